@@ -0,0 +1,33 @@
+"""add indexes used by garbage collection and session lookups
+
+Revision ID: 0f8a6035e3d0
+Revises: be60e4b8c659
+Create Date: 2026-10-19 10:12:41.208731
+
+"""
+
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision = "0f8a6035e3d0"
+down_revision = "be60e4b8c659"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_index(op.f("ix_sessions_user_id"), "sessions", ["user_id"])
+    op.create_index(op.f("ix_sessions_last_accessed"), "sessions", ["last_accessed"])
+    op.create_index(
+        op.f("ix_email_requests_created_at"), "email_requests", ["created_at"]
+    )
+    op.create_index(
+        op.f("ix_fcm_tokens_last_updated_at"), "fcm_tokens", ["last_updated_at"]
+    )
+
+
+def downgrade():
+    op.drop_index(op.f("ix_fcm_tokens_last_updated_at"), table_name="fcm_tokens")
+    op.drop_index(op.f("ix_email_requests_created_at"), table_name="email_requests")
+    op.drop_index(op.f("ix_sessions_last_accessed"), table_name="sessions")
+    op.drop_index(op.f("ix_sessions_user_id"), table_name="sessions")
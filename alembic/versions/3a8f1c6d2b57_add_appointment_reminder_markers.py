@@ -0,0 +1,63 @@
+"""add appointment reminder markers
+
+Revision ID: 3a8f1c6d2b57
+Revises: 7c41d2b9a0e6
+Create Date: 2026-10-19 15:42:07.118934
+
+"""
+
+import sqlalchemy as sa
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision = "3a8f1c6d2b57"
+down_revision = "7c41d2b9a0e6"
+branch_labels = None
+depends_on = None
+
+REMINDER_MINUTES = (120, 30)
+
+
+def upgrade():
+    for minutes in REMINDER_MINUTES:
+        op.add_column(
+            "appointments",
+            sa.Column(
+                f"reminder_t_minus_{minutes}_sent_at", sa.TIMESTAMP(), nullable=True
+            ),
+        )
+
+        # Reminders whose window already started were sent by the scheduler jobs
+        op.execute(
+            f"""
+            UPDATE appointments
+            SET reminder_t_minus_{minutes}_sent_at = (now() at time zone('utc'))
+            FROM appointment_slots
+            WHERE appointments.start_slot_id = appointment_slots.id
+            AND appointment_slots.start_time <= now() + interval '{minutes} minutes'
+            """
+        )
+
+        op.create_index(
+            f"ix_appointments_pending_t_minus_{minutes}_reminder",
+            "appointments",
+            ["start_slot_id"],
+            postgresql_where=sa.text(
+                f"reminder_t_minus_{minutes}_sent_at IS NULL AND canceled = false"
+            ),
+        )
+
+    # Pending reminders are sent by the reminder sweep from now on
+    if sa.inspect(op.get_bind()).has_table("apscheduler_jobs"):
+        op.execute(
+            "DELETE FROM apscheduler_jobs WHERE id LIKE 'appointment_reminder_%'"
+        )
+
+
+def downgrade():
+    for minutes in REMINDER_MINUTES:
+        op.drop_index(
+            f"ix_appointments_pending_t_minus_{minutes}_reminder",
+            table_name="appointments",
+        )
+        op.drop_column("appointments", f"reminder_t_minus_{minutes}_sent_at")
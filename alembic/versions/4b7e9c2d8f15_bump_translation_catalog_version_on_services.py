@@ -0,0 +1,30 @@
+"""bump translation catalog version on services changes
+
+Revision ID: 4b7e9c2d8f15
+Revises: 9d4e2f7a1c38
+Create Date: 2026-10-19 18:37:45.902114
+
+"""
+
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision = "4b7e9c2d8f15"
+down_revision = "9d4e2f7a1c38"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # Services are cached along with their translations
+    op.execute(
+        """
+        CREATE TRIGGER services_bump_translation_catalog_version
+        AFTER INSERT OR UPDATE OR DELETE OR TRUNCATE ON services
+        FOR EACH STATEMENT EXECUTE FUNCTION bump_translation_catalog_version()
+        """
+    )
+
+
+def downgrade():
+    op.execute("DROP TRIGGER services_bump_translation_catalog_version ON services")
@@ -0,0 +1,56 @@
+"""create translation_catalog_version table
+
+Revision ID: 5e0b7d93c4a1
+Revises: 3a8f1c6d2b57
+Create Date: 2026-10-19 17:26:51.730468
+
+"""
+
+import sqlalchemy as sa
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision = "5e0b7d93c4a1"
+down_revision = "3a8f1c6d2b57"
+branch_labels = None
+depends_on = None
+
+TRANSLATION_TABLES = ("languages", "service_translations", "holiday_translations")
+
+
+def upgrade():
+    op.create_table(
+        "translation_catalog_version",
+        sa.Column("id", sa.Integer(), nullable=False),
+        sa.Column("version", sa.Integer(), server_default="0", nullable=False),
+        sa.PrimaryKeyConstraint("id"),
+    )
+    op.execute("INSERT INTO translation_catalog_version (id, version) VALUES (1, 0)")
+
+    op.execute(
+        """
+        CREATE FUNCTION bump_translation_catalog_version() RETURNS trigger AS $$
+        BEGIN
+            UPDATE translation_catalog_version SET version = version + 1;
+            RETURN NULL;
+        END;
+        $$ LANGUAGE plpgsql
+        """
+    )
+
+    for table in TRANSLATION_TABLES:
+        op.execute(
+            f"""
+            CREATE TRIGGER {table}_bump_translation_catalog_version
+            AFTER INSERT OR UPDATE OR DELETE OR TRUNCATE ON {table}
+            FOR EACH STATEMENT EXECUTE FUNCTION bump_translation_catalog_version()
+            """
+        )
+
+
+def downgrade():
+    for table in TRANSLATION_TABLES:
+        op.execute(f"DROP TRIGGER {table}_bump_translation_catalog_version ON {table}")
+
+    op.execute("DROP FUNCTION bump_translation_catalog_version()")
+    op.drop_table("translation_catalog_version")
@@ -0,0 +1,27 @@
+"""add emails_sent_at column to notification_outbox table
+
+Revision ID: 6f2a8d4c1e93
+Revises: 4b7e9c2d8f15
+Create Date: 2026-10-19 19:12:08.417365
+
+"""
+
+import sqlalchemy as sa
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision = "6f2a8d4c1e93"
+down_revision = "4b7e9c2d8f15"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.add_column(
+        "notification_outbox",
+        sa.Column("emails_sent_at", sa.TIMESTAMP(timezone=False), nullable=True),
+    )
+
+
+def downgrade():
+    op.drop_column("notification_outbox", "emails_sent_at")
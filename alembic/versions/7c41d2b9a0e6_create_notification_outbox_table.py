@@ -0,0 +1,64 @@
+"""create notification_outbox table
+
+Revision ID: 7c41d2b9a0e6
+Revises: e931d50cb35a
+Create Date: 2026-10-19 13:05:18.402615
+
+"""
+
+import sqlalchemy as sa
+from alembic import op
+from sqlalchemy.dialects import postgresql
+
+# revision identifiers, used by Alembic.
+revision = "7c41d2b9a0e6"
+down_revision = "e931d50cb35a"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table(
+        "notification_outbox",
+        sa.Column("id", sa.Integer(), nullable=False),
+        sa.Column("kind", sa.String(), nullable=False),
+        sa.Column("payload", postgresql.JSONB(), nullable=False),
+        sa.Column("status", sa.String(), server_default="pending", nullable=False),
+        sa.Column("attempts", sa.Integer(), server_default="0", nullable=False),
+        sa.Column(
+            "next_attempt_at",
+            sa.TIMESTAMP(),
+            server_default=sa.text("(now() at time zone('utc'))"),
+            nullable=False,
+        ),
+        sa.Column("last_error", sa.String(), nullable=True),
+        sa.Column(
+            "created_at",
+            sa.TIMESTAMP(),
+            server_default=sa.text("(now() at time zone('utc'))"),
+            nullable=False,
+        ),
+        sa.Column("processed_at", sa.TIMESTAMP(), nullable=True),
+        sa.PrimaryKeyConstraint("id"),
+    )
+    op.create_index(
+        "ix_notification_outbox_status_next_attempt_at",
+        "notification_outbox",
+        ["status", "next_attempt_at"],
+    )
+    op.create_index(
+        op.f("ix_notification_outbox_processed_at"),
+        "notification_outbox",
+        ["processed_at"],
+    )
+
+
+def downgrade():
+    op.drop_index(
+        op.f("ix_notification_outbox_processed_at"), table_name="notification_outbox"
+    )
+    op.drop_index(
+        "ix_notification_outbox_status_next_attempt_at",
+        table_name="notification_outbox",
+    )
+    op.drop_table("notification_outbox")
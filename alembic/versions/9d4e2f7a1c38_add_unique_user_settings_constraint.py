@@ -0,0 +1,34 @@
+"""add unique user settings constraint
+
+Revision ID: 9d4e2f7a1c38
+Revises: 5e0b7d93c4a1
+Create Date: 2026-10-19 18:04:12.318650
+
+"""
+
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision = "9d4e2f7a1c38"
+down_revision = "5e0b7d93c4a1"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # Keep only the most recent of duplicated settings
+    op.execute(
+        """
+        DELETE FROM settings
+        USING settings AS newer_settings
+        WHERE settings.user_id = newer_settings.user_id
+            AND settings.name = newer_settings.name
+            AND settings.id < newer_settings.id
+        """
+    )
+
+    op.create_unique_constraint("unique_user_settings", "settings", ["user_id", "name"])
+
+
+def downgrade():
+    op.drop_constraint("unique_user_settings", "settings", type_="unique")
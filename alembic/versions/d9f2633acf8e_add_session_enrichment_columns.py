@@ -0,0 +1,41 @@
+"""add session enrichment columns to sessions table
+
+Revision ID: d9f2633acf8e
+Revises: 0f8a6035e3d0
+Create Date: 2026-10-19 11:03:17.552904
+
+"""
+
+import sqlalchemy as sa
+from alembic import op
+from sqlalchemy.dialects import postgresql
+
+# revision identifiers, used by Alembic.
+revision = "d9f2633acf8e"
+down_revision = "0f8a6035e3d0"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.add_column(
+        "sessions",
+        sa.Column("sign_in_user_agent_info", postgresql.JSONB(), nullable=True),
+    )
+    op.add_column(
+        "sessions", sa.Column("sign_in_location", postgresql.JSONB(), nullable=True)
+    )
+    op.add_column(
+        "sessions",
+        sa.Column("last_user_agent_info", postgresql.JSONB(), nullable=True),
+    )
+    op.add_column(
+        "sessions", sa.Column("last_location", postgresql.JSONB(), nullable=True)
+    )
+
+
+def downgrade():
+    op.drop_column("sessions", "last_location")
+    op.drop_column("sessions", "last_user_agent_info")
+    op.drop_column("sessions", "sign_in_location")
+    op.drop_column("sessions", "sign_in_user_agent_info")
@@ -0,0 +1,44 @@
+"""create ip_address_details table
+
+Revision ID: e931d50cb35a
+Revises: d9f2633acf8e
+Create Date: 2026-10-19 12:26:54.730118
+
+"""
+
+import sqlalchemy as sa
+from alembic import op
+from sqlalchemy.dialects import postgresql
+
+# revision identifiers, used by Alembic.
+revision = "e931d50cb35a"
+down_revision = "d9f2633acf8e"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table(
+        "ip_address_details",
+        sa.Column("ip_address", sa.String(), nullable=False),
+        sa.Column("details", postgresql.JSONB(), nullable=False),
+        sa.Column(
+            "fetched_at",
+            sa.TIMESTAMP(),
+            server_default=sa.text("(now() at time zone('utc'))"),
+            nullable=False,
+        ),
+        sa.PrimaryKeyConstraint("ip_address"),
+    )
+    op.create_index(
+        op.f("ix_ip_address_details_fetched_at"),
+        "ip_address_details",
+        ["fetched_at"],
+    )
+
+
+def downgrade():
+    op.drop_index(
+        op.f("ix_ip_address_details_fetched_at"), table_name="ip_address_details"
+    )
+    op.drop_table("ip_address_details")
@@ -0,0 +1,69 @@
+import datetime
+import os
+import time
+from pathlib import Path
+
+from jinja2 import Environment, FileSystemLoader
+
+from src.email_renderer import EmailRenderer
+
+TEMPLATES_DIR = Path(__file__).parent / "src/templates"
+EMAILS = 20000
+PROCESSES = os.cpu_count() or 1
+
+
+def get_emails(count: int) -> list[tuple[str, dict]]:
+    template_names = [
+        "new_appointment_pl.html",
+        "account_verification_pl.html",
+        "account_verification_en.html",
+        "password_reset_pl.html",
+        "password_reset_en.html",
+    ]
+
+    return [
+        (
+            template_names[i % len(template_names)],
+            {
+                "company_name": "Zołza Hairstyles",
+                "current_year": datetime.datetime.now().year,
+                "title": f"Jan Kowalski {i} umówił/a wizytę",
+                "msg": "Strzyżenie - 12.10.2026 14:30",
+                "user": {"name": "Jan", "surname": f"Kowalski {i}"},
+                "frontend_url": "https://example.com",
+                "account_confirmation_link": f"https://example.com/confirm/{i}",
+                "password_reset_link": f"https://example.com/reset/{i}",
+            },
+        )
+        for i in range(count)
+    ]
+
+
+def render_per_call(emails: list[tuple[str, dict]]) -> None:
+    # What fastapi-mail does: a new environment and template lookup per email
+    for template_name, template_body in emails:
+        environment = Environment(loader=FileSystemLoader(TEMPLATES_DIR))
+        environment.get_template(template_name).render(**template_body).encode("utf-8")
+
+
+def benchmark(name: str, render, emails: list[tuple[str, dict]]) -> None:
+    start = time.perf_counter()
+    render(emails)
+    elapsed = time.perf_counter() - start
+
+    print(f"{name:<32} {len(emails) / elapsed:>12.0f} renders/s")
+
+
+if __name__ == "__main__":
+    emails = get_emails(EMAILS)
+
+    renderer = EmailRenderer(TEMPLATES_DIR)
+    renderer.compile_templates()
+
+    benchmark("fastapi-mail (per call)", render_per_call, emails)
+    benchmark("precompiled", renderer.render_many, emails)
+    benchmark(
+        f"precompiled, {PROCESSES} processes",
+        lambda batch: renderer.render_many(batch, processes=PROCESSES),
+        emails,
+    )
@@ -6,6 +6,7 @@ from datetime import date, datetime, timedelta, timezone
 from typing import Any
 
 import langcodes
+from apscheduler.jobstores.base import JobLookupError
 from apscheduler.schedulers.background import BackgroundScheduler
 from langcodes import standardize_tag
 from sqlalchemy.orm import Session
@@ -13,8 +14,9 @@ from sqlalchemy.orm import Session
 from src import models
 from src.config import settings
 from src.database import get_db
+from src.garbage_collector import collect_garbage
 from src.loggers import init_app_logger
-from src.scheduler import configure_and_start_scheduler, scheduler
+from src.scheduler import create_scheduler
 from src.utils import COMPANY_TIMEZONE
 
 
@@ -209,6 +211,41 @@ def add_appointment_slots_generation_task(
     )
 
 
+def ensure_garbage_collection_task_exists(
+    background_scheduler: BackgroundScheduler,
+) -> None:
+    garbage_collection_task = background_scheduler.get_job("garbage_collection")
+
+    if not garbage_collection_task:
+        add_garbage_collection_task(background_scheduler)
+
+
+def add_garbage_collection_task(
+    background_scheduler: BackgroundScheduler,
+) -> None:
+    background_scheduler.add_job(
+        collect_garbage,
+        args=[get_db],
+        trigger="interval",
+        hours=settings.GARBAGE_COLLECTION_INTERVAL_HOURS,
+        name="Garbage Collection",
+        next_run_time=datetime.now(COMPANY_TIMEZONE) + timedelta(minutes=5),
+        coalesce=True,
+        max_instances=1,
+        id="garbage_collection",
+    )
+
+
+def remove_reminder_sweep_task(
+    background_scheduler: BackgroundScheduler,
+) -> None:
+    # Reminders are sent by the reminder scheduler running in the scheduler leader
+    try:
+        background_scheduler.remove_job("reminder_sweep")
+    except JobLookupError:
+        pass
+
+
 def check_if_appointment_slots_generated(db: Session) -> bool:
     last_appointment_slot = (
         db.query(models.AppointmentSlot)
@@ -499,10 +536,6 @@ def generate_appointment_slots(db: Session) -> None:
 def init_app():
     init_app_logger.info("Initializing application")
 
-    configure_and_start_scheduler()
-
-    init_app_logger.info("Scheduler started")
-
     db = next(get_db())
 
     init_app_logger.info(f"Created new {type(db)} object #{id(db)}")
@@ -527,4 +560,17 @@ def init_app():
 
     ensure_enough_appointment_slots_available(get_db)
 
-    ensure_appointment_slots_generation_task_exists(scheduler)
+    # Jobs are only registered here, they're run by the scheduler leader
+    scheduler = create_scheduler()
+    scheduler.start(paused=True)
+
+    try:
+        ensure_appointment_slots_generation_task_exists(scheduler)
+
+        ensure_garbage_collection_task_exists(scheduler)
+
+        remove_reminder_sweep_task(scheduler)
+    finally:
+        scheduler.shutdown()
+
+    init_app_logger.info("Scheduled jobs registered")
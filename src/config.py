@@ -24,11 +24,35 @@ class Settings(BaseSettings):
     PASSWORD_RESET_COOLDOWN_MINUTES: int
 
     SUDO_MODE_TIME_HOURS: int
+    MAX_SESSIONS_PER_USER: int = 10
     APPOINTMENT_SLOT_TIME_MINUTES: int
     MAX_FUTURE_APPOINTMENT_DAYS: int
 
     TEMPORARY_CLOSURE_FROM_DATE: str | None = None
 
+    # Garbage collection config
+    GARBAGE_COLLECTION_INTERVAL_HOURS: int = 6
+    GARBAGE_COLLECTION_BATCH_SIZE: int = 500
+    SESSION_IDLE_RETENTION_DAYS: int = 90
+    EMAIL_VERIFICATION_REQUEST_RETENTION_DAYS: int = 30
+    FCM_TOKEN_RETENTION_DAYS: int = 60
+    NOTIFICATION_OUTBOX_RETENTION_DAYS: int = 14
+
+    # Notification outbox config
+    OUTBOX_BATCH_SIZE: int = 100
+    OUTBOX_POLL_INTERVAL_SECONDS: float = 5
+    OUTBOX_MAX_ATTEMPTS: int = 8
+    OUTBOX_RETRY_BASE_SECONDS: int = 30
+    OWNER_NOTIFICATION_DIGEST_MINUTES: int | None = None
+    REMINDER_WHEEL_HORIZON_HOURS: int = 3
+    REMINDER_WHEEL_TOP_UP_MINUTES: int = 10
+    SCHEDULER_LEADER_POLL_INTERVAL_SECONDS: float = 5
+    RUN_BACKGROUND_WORKERS_IN_API: bool = True
+    WORKER_HEARTBEAT_PATH: str = "worker-heartbeat.json"
+    WORKER_HEARTBEAT_SECONDS: float = 10
+    TRANSLATION_CATALOG_CHECK_SECONDS: float = 30
+    USER_SETTINGS_CACHE_TTL_SECONDS: float = 60
+
     # Database config
     DATABASE_USERNAME: str
     DATABASE_PASSWORD: str
@@ -47,13 +71,18 @@ class Settings(BaseSettings):
     USE_CREDENTIALS: bool
     VALIDATE_CERTS: bool
     MAIL_FROM_NAME: str
+    SMTP_POOL_SIZE: int = 3
 
     # IPINFO config
     IPINFO_ACCESS_TOKEN: str
+    IP_ADDRESS_DETAILS_CACHE_TTL_HOURS: int = 168
 
     # FIREBASE config
     FIREBASE_SERVICE_ACCOUNT_CREDENTIALS_PATH: str
 
+    # Rate limiting config (buckets are kept in memory of each worker if not set)
+    RATE_LIMIT_REDIS_URL: str | None = None
+
     # GITHUB config (used for an unrelated proxy, disabled if not set)
     GH_APP_CLIENT_ID: str | None = None
     GH_APP_CLIENT_SECRET: str | None = None
@@ -1,3 +1,4 @@
+from fastapi import Request
 from sqlalchemy import create_engine, engine
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker
@@ -40,3 +41,11 @@ def get_db():
         yield db
     finally:
         db.close()
+
+
+def get_db_factory(request: Request) -> callable:
+    """Returns the session factory for work done after the response, e.g. background tasks
+
+    Dependency overrides are respected, so the work uses the request's database
+    """
+    return request.app.dependency_overrides.get(get_db, get_db)
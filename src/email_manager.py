@@ -1,13 +1,16 @@
 import datetime
 import logging
+from email.message import EmailMessage
+from email.utils import formatdate, make_msgid
 from pathlib import Path
 
 from fastapi_mail import ConnectionConfig, FastMail, MessageSchema, MessageType
-from fastapi_mail.errors import ConnectionErrors
 
 from . import models, oauth2
 from .config import settings
+from .email_renderer import get_email_renderer
 from .exceptions import InvalidEnumerationMemberHTTPException
+from .mail_sender import SmtpMailSender
 from .schemas.email_request import EmailRequest, EmailRequestType
 from .schemas.oauth2 import TokenPayloadBase, TokenType
 from .schemas.user_settings import DefaultContentLanguages
@@ -28,19 +31,81 @@ MAIL_CONFIG = ConnectionConfig(
 
 fastMail = FastMail(MAIL_CONFIG)
 
+mail_sender = SmtpMailSender(MAIL_CONFIG, settings.SMTP_POOL_SIZE)
+
 
 def get_fast_mail_client():
     return fastMail
 
 
+def get_mail_sender() -> SmtpMailSender:
+    return mail_sender
+
+
+def set_mail_sender(sender: SmtpMailSender) -> None:
+    global mail_sender
+
+    mail_sender = sender
+
+
+def build_email_message(
+    email: MessageSchema, template_name: str, config: ConnectionConfig
+) -> EmailMessage:
+    message = EmailMessage()
+    message["Subject"] = email.subject
+    message["From"] = (
+        f"{config.MAIL_FROM_NAME} <{config.MAIL_FROM}>"
+        if config.MAIL_FROM_NAME
+        else config.MAIL_FROM
+    )
+    message["To"] = ", ".join(email.recipients)
+    message["Date"] = formatdate(localtime=True)
+    message["Message-ID"] = make_msgid()
+    message.set_content(
+        get_email_renderer().render(template_name, email.template_body),
+        maintype="text",
+        subtype=email.subtype.value,
+        cte="quoted-printable",
+        params={"charset": "utf-8"},
+    )
+
+    return message
+
+
+async def send_emails(
+    emails: list[tuple[MessageSchema, str]], fast_mail_client: FastMail
+) -> list[Exception | None]:
+    """Sends the emails over the pooled SMTP connections
+
+    Returns the exception raised for each email, None if it was sent
+    """
+    config = fast_mail_client.config
+
+    messages = [
+        build_email_message(email, template_name, config)
+        for email, template_name in emails
+    ]
+
+    # For test environment
+    if config.SUPPRESS_SEND:
+        return [None] * len(messages)
+
+    results = await get_mail_sender().send_many(messages)
+
+    for result in results:
+        if result:
+            logging.error(f"Failed to send message: {result!r}")
+
+    return results
+
+
 async def send_email(
     email: MessageSchema, template_name: str, fast_mail_client: FastMail
 ):
-    try:
-        await fast_mail_client.send_message(email, template_name)
-    except ConnectionErrors:
-        logging.error("Failed to send message")
-        raise
+    [error] = await send_emails([(email, template_name)], fast_mail_client)
+
+    if error:
+        raise error
 
 
 def create_email_verification_email(
@@ -151,3 +216,31 @@ def create_new_appointment_email(
     )
 
     return message, template_name
+
+
+def create_new_appointments_digest_email(
+    content_language: DefaultContentLanguages, email, title, appointments
+):
+    match content_language:
+        case DefaultContentLanguages.polish:
+            template_name = "new_appointments_digest_pl.html"
+            subject = f"{settings.COMPANY_NAME} - nowe wizyty"
+        case DefaultContentLanguages.english:
+            template_name = "new_appointments_digest_en.html"
+            subject = f"{settings.COMPANY_NAME} - new appointments"
+        case _:
+            raise InvalidEnumerationMemberHTTPException()
+
+    message = MessageSchema(
+        subject=subject,
+        recipients=[email],
+        template_body={
+            "title": title,
+            "appointments": appointments,
+            "company_name": settings.COMPANY_NAME,
+            "current_year": datetime.datetime.today().year,
+        },
+        subtype=MessageType.html,
+    )
+
+    return message, template_name
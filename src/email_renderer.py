@@ -0,0 +1,94 @@
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+
+from jinja2 import Environment, FileSystemLoader, Template, select_autoescape
+
+TEMPLATES_DIR = Path(__file__).parent / "templates"
+
+# Batches smaller than this are rendered in-process,
+# as starting worker processes costs more than rendering them
+PROCESS_POOL_MIN_BATCH_SIZE = 2000
+
+
+class EmailRenderer:
+    """Renders email templates compiled once per template (and thus per language)
+
+    Templates are named `<email>_<language code>.html`, all of them are
+    compiled on `compile_templates` and rendered straight into UTF-8 bytes
+    """
+
+    def __init__(self, templates_dir: Path = TEMPLATES_DIR):
+        self.templates_dir = templates_dir
+        self.environment = Environment(
+            loader=FileSystemLoader(templates_dir),
+            autoescape=select_autoescape(["html"]),
+            auto_reload=False,
+        )
+        self.templates: dict[str, Template] = {}
+
+    def compile_templates(self) -> None:
+        for template_path in sorted(self.templates_dir.glob("*.html")):
+            self.get_template(template_path.name)
+
+    def get_template(self, template_name: str) -> Template:
+        template = self.templates.get(template_name)
+
+        if template is None:
+            template = self.environment.get_template(template_name)
+            self.templates[template_name] = template
+
+        return template
+
+    def render(self, template_name: str, template_body: dict) -> bytes:
+        return self.get_template(template_name).render(**template_body).encode("utf-8")
+
+    def render_many(
+        self,
+        emails: list[tuple[str, dict]],
+        processes: int | None = None,
+    ) -> list[bytes]:
+        """Renders (template name, template body) pairs in order
+
+        Big batches are spread over a pool of `processes` worker processes
+        """
+        if not processes or len(emails) < PROCESS_POOL_MIN_BATCH_SIZE:
+            return [
+                self.render(template_name, template_body)
+                for template_name, template_body in emails
+            ]
+
+        with ProcessPoolExecutor(
+            max_workers=processes,
+            initializer=init_process_renderer,
+            initargs=(self.templates_dir,),
+        ) as executor:
+            return list(
+                executor.map(
+                    render_in_process,
+                    emails,
+                    chunksize=max(len(emails) // (processes * 4), 1),
+                )
+            )
+
+
+process_renderer: EmailRenderer | None = None
+
+
+def init_process_renderer(templates_dir: Path) -> None:
+    global process_renderer
+
+    process_renderer = EmailRenderer(templates_dir)
+    process_renderer.compile_templates()
+
+
+def render_in_process(email: tuple[str, dict]) -> bytes:
+    template_name, template_body = email
+
+    return process_renderer.render(template_name, template_body)
+
+
+email_renderer = EmailRenderer()
+
+
+def get_email_renderer() -> EmailRenderer:
+    return email_renderer
@@ -34,6 +34,12 @@ class IncorrectTokenDataException(Exception):
     pass
 
 
+class EmailDeliveryException(Exception):
+    def __init__(self, errors: list[Exception]):
+        super().__init__(f"Failed to send {len(errors)} emails: {errors!r}")
+        self.errors = errors
+
+
 class InvalidTokenHTTPException(HTTPException):
     def __init__(
         self,
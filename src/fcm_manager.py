@@ -1,52 +1,94 @@
-import os
+from typing import Hashable
 
-import firebase_admin
-from firebase_admin import credentials, messaging
 from sqlalchemy.orm import Session
+from starlette.concurrency import run_in_threadpool
 
 from . import models
-from .config import settings
-
-dir_name = os.path.dirname(__file__)
-firebaseServiceAccountCredentialsPath = os.path.join(
-    dir_name, settings.FIREBASE_SERVICE_ACCOUNT_CREDENTIALS_PATH
-)
-
-cred = credentials.Certificate(firebaseServiceAccountCredentialsPath)
-firebase_admin.initialize_app(cred)
-
-
-def send_multicast_message(
-    *,
-    db: Session,
-    fcm_tokens_db: list[models.FcmToken],
-    title: str,
-    msg: str,
-    fcm_tokens: list[str],
-    data_object: object | None = None,
-) -> None:
-    message = messaging.MulticastMessage(
-        notification=messaging.Notification(title=title, body=msg),
-        data=data_object,
-        tokens=fcm_tokens,
-        android=messaging.AndroidConfig(
-            priority="high", notification=messaging.AndroidNotification(priority="max")
-        ),
-        apns=messaging.APNSConfig(
-            headers={"apns-priority": "10", "interruption-level": "time-sensitive"}
-        ),
+from .loggers import app_logger
+from .push_transport import PushMessage, get_push_transport
+
+# Maximum number of messages sent concurrently as a part of a single batch
+FCM_MAX_BATCH_SIZE = 500
+
+
+def delete_fcm_tokens(db: Session, fcm_tokens: list[str]) -> None:
+    db.query(models.FcmToken).where(models.FcmToken.token.in_(fcm_tokens)).delete(
+        synchronize_session=False
     )
+    db.commit()
+
+
+class PushBatch:
+    """Collects push messages across users and notifications
+
+    Everything is sent on flush using the push transport,
+    tokens rejected by FCM as invalid are deleted with a single query
+    """
+
+    def __init__(self):
+        self.messages: list[PushMessage] = []
+        self.keys: list[Hashable | None] = []
+
+    def __len__(self) -> int:
+        return len(self.messages)
+
+    def add(
+        self,
+        *,
+        fcm_tokens: list[str],
+        title: str,
+        msg: str,
+        data_object: dict | None = None,
+        key: Hashable | None = None,
+    ) -> None:
+        """Adds a message for every token
+
+        `key` identifies the caller (e.g. a notification) in the flush result
+        """
+        for fcm_token in fcm_tokens:
+            self.messages.append(
+                PushMessage(token=fcm_token, title=title, body=msg, data=data_object)
+            )
+            self.keys.append(key)
+
+    async def flush(self, db: Session) -> set[Hashable]:
+        """Sends all collected messages
+
+        Returns keys of messages which failed for reasons other than
+        an invalid token, so the caller can retry them
+        """
+        push_transport = get_push_transport()
+
+        invalid_tokens = []
+        failed_keys = set()
+
+        for start in range(0, len(self.messages), FCM_MAX_BATCH_SIZE):
+            messages = self.messages[start : start + FCM_MAX_BATCH_SIZE]
+            keys = self.keys[start : start + FCM_MAX_BATCH_SIZE]
+
+            try:
+                results = await push_transport.send_each(messages)
+            except Exception:
+                app_logger.exception(f"Failed to send {len(messages)} push messages")
+                failed_keys.update(keys)
+                continue
+
+            for message, key, result in zip(messages, keys, results):
+                if result.success:
+                    continue
+
+                if result.invalid_token:
+                    invalid_tokens.append(message.token)
+                else:
+                    app_logger.warning(f"Failed to send push message: {result.error}")
+                    failed_keys.add(key)
 
-    response = messaging.send_each_for_multicast(message)
+        if invalid_tokens:
+            await run_in_threadpool(delete_fcm_tokens, db, invalid_tokens)
 
-    db = db.object_session(fcm_tokens_db[0])
+        self.messages = []
+        self.keys = []
 
-    if response.failure_count > 0:
-        responses = response.responses
-        for idx, resp in enumerate(responses):
-            if not resp.success:
-                # The order of responses corresponds to the order of the registration
-                # tokens.
-                db.delete(fcm_tokens_db[idx])  # todo: test
+        failed_keys.discard(None)
 
-        db.commit()
+        return failed_keys
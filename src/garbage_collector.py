@@ -0,0 +1,227 @@
+import time
+from datetime import datetime, timedelta
+from typing import TypedDict
+
+from sqlalchemy.orm import Query, Session
+
+from . import models
+from .config import settings
+from .loggers import app_logger
+from .schemas.email_request import EmailRequestType
+from .schemas.notification_outbox import OutboxStatus
+
+
+class GarbageCollectionStats(TypedDict):
+    sessions: int
+    email_requests: int
+    fcm_tokens: int
+    ip_address_details: int
+    notifications: int
+    batches: int
+    duration_seconds: float
+
+
+def delete_in_batches(
+    db: Session, model, ids_query: Query, batch_size: int, key_column=None
+) -> tuple[int, int]:
+    key_column = key_column if key_column is not None else model.id
+
+    deleted = 0
+    batches = 0
+
+    while True:
+        ids = [row[0] for row in ids_query.limit(batch_size).all()]
+
+        if not ids:
+            break
+
+        db.query(model).where(key_column.in_(ids)).delete(synchronize_session=False)
+        db.commit()
+
+        deleted += len(ids)
+        batches += 1
+
+        if len(ids) < batch_size:
+            break
+
+    return deleted, batches
+
+
+def delete_idle_sessions(
+    db: Session, now: datetime, batch_size: int
+) -> tuple[int, int]:
+    cutoff = now - timedelta(days=settings.SESSION_IDLE_RETENTION_DAYS)
+
+    deleted = 0
+    batches = 0
+
+    while True:
+        session_ids = [
+            row[0]
+            for row in db.query(models.Session.id)
+            .where(models.Session.last_accessed < cutoff)
+            .limit(batch_size)
+            .all()
+        ]
+
+        if not session_ids:
+            break
+
+        db.query(models.FcmToken).where(
+            models.FcmToken.session_id.in_(session_ids)
+        ).delete(synchronize_session=False)
+        db.query(models.Session).where(models.Session.id.in_(session_ids)).delete(
+            synchronize_session=False
+        )
+        db.commit()
+
+        deleted += len(session_ids)
+        batches += 1
+
+        if len(session_ids) < batch_size:
+            break
+
+    return deleted, batches
+
+
+def delete_stale_email_requests(
+    db: Session, now: datetime, batch_size: int
+) -> tuple[int, int]:
+    # Expired password reset tokens are useless once their cooldown has passed too
+    password_reset_cutoff = now - timedelta(
+        minutes=max(
+            settings.PASSWORD_RESET_TOKEN_EXPIRE_MINUTES,
+            settings.PASSWORD_RESET_COOLDOWN_MINUTES,
+        )
+    )
+    # Verification tokens never expire, so only verified users' requests
+    # can be removed as soon as their cooldown has passed
+    verified_cutoff = now - timedelta(
+        minutes=settings.MAIL_VERIFICATION_COOLDOWN_MINUTES
+    )
+    unverified_cutoff = now - timedelta(
+        days=settings.EMAIL_VERIFICATION_REQUEST_RETENTION_DAYS
+    )
+
+    verified_user_ids = db.query(models.User.id).where(models.User.verified == True)
+
+    ids_query = db.query(models.EmailRequests.id).where(
+        (
+            (
+                models.EmailRequests.request_type
+                == EmailRequestType.password_reset_request
+            )
+            & (models.EmailRequests.created_at < password_reset_cutoff)
+        )
+        | (
+            (
+                models.EmailRequests.request_type
+                == EmailRequestType.email_verification_request
+            )
+            & (
+                (models.EmailRequests.created_at < unverified_cutoff)
+                | (
+                    (models.EmailRequests.created_at < verified_cutoff)
+                    & models.EmailRequests.user_id.in_(verified_user_ids)
+                )
+            )
+        )
+    )
+
+    return delete_in_batches(db, models.EmailRequests, ids_query, batch_size)
+
+
+def delete_stale_fcm_tokens(
+    db: Session, now: datetime, batch_size: int
+) -> tuple[int, int]:
+    cutoff = now - timedelta(days=settings.FCM_TOKEN_RETENTION_DAYS)
+
+    ids_query = (
+        db.query(models.FcmToken.id)
+        .join(models.Session, models.FcmToken.session_id == models.Session.id)
+        .where(models.FcmToken.last_updated_at < cutoff)
+        .where(models.Session.last_accessed < cutoff)
+    )
+
+    return delete_in_batches(db, models.FcmToken, ids_query, batch_size)
+
+
+def delete_expired_ip_address_details(
+    db: Session, now: datetime, batch_size: int
+) -> tuple[int, int]:
+    cutoff = now - timedelta(hours=settings.IP_ADDRESS_DETAILS_CACHE_TTL_HOURS)
+
+    ids_query = db.query(models.IpAddressDetails.ip_address).where(
+        models.IpAddressDetails.fetched_at < cutoff
+    )
+
+    return delete_in_batches(
+        db,
+        models.IpAddressDetails,
+        ids_query,
+        batch_size,
+        key_column=models.IpAddressDetails.ip_address,
+    )
+
+
+def delete_processed_notifications(
+    db: Session, now: datetime, batch_size: int
+) -> tuple[int, int]:
+    cutoff = now - timedelta(days=settings.NOTIFICATION_OUTBOX_RETENTION_DAYS)
+
+    ids_query = (
+        db.query(models.NotificationOutbox.id)
+        .where(
+            models.NotificationOutbox.status.in_([OutboxStatus.sent, OutboxStatus.dead])
+        )
+        .where(models.NotificationOutbox.processed_at < cutoff)
+    )
+
+    return delete_in_batches(db, models.NotificationOutbox, ids_query, batch_size)
+
+
+def collect_garbage(get_db_func: callable) -> GarbageCollectionStats:
+    db = next(get_db_func())
+
+    started_at = time.perf_counter()
+    now = datetime.utcnow()
+    batch_size = settings.GARBAGE_COLLECTION_BATCH_SIZE
+
+    try:
+        fcm_tokens, fcm_token_batches = delete_stale_fcm_tokens(db, now, batch_size)
+        sessions, session_batches = delete_idle_sessions(db, now, batch_size)
+        email_requests, email_request_batches = delete_stale_email_requests(
+            db, now, batch_size
+        )
+        ip_address_details, ip_address_details_batches = (
+            delete_expired_ip_address_details(db, now, batch_size)
+        )
+        notifications, notification_batches = delete_processed_notifications(
+            db, now, batch_size
+        )
+    except Exception:
+        db.rollback()
+        app_logger.exception("Garbage collection failed")
+        raise
+    finally:
+        db.close()
+
+    stats = GarbageCollectionStats(
+        sessions=sessions,
+        email_requests=email_requests,
+        fcm_tokens=fcm_tokens,
+        ip_address_details=ip_address_details,
+        notifications=notifications,
+        batches=(
+            fcm_token_batches
+            + session_batches
+            + email_request_batches
+            + ip_address_details_batches
+            + notification_batches
+        ),
+        duration_seconds=round(time.perf_counter() - started_at, 3),
+    )
+
+    app_logger.info(f"Garbage collection finished: {stats}")
+
+    return stats
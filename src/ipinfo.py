@@ -1,18 +1,178 @@
+import abc
 import ipaddress
+from datetime import datetime, timedelta
+from typing import Iterable
 
 import ipinfo
-from ipinfo.exceptions import RequestQuotaExceededError, TimeoutExceededError
-from requests.exceptions import HTTPError
+from cachetools import TTLCache
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.orm import Session
+from starlette.concurrency import run_in_threadpool
 
+from . import models
 from .config import settings
+from .loggers import app_logger
 
-handler = ipinfo.getHandler(settings.IPINFO_ACCESS_TOKEN)
+IP_ADDRESS_DETAILS_MEMORY_CACHE_SIZE = 4096
 
 
-def get_ip_address_details(ip_address: str) -> None | dict:
-    if ipaddress.ip_address(ip_address).is_private:
-        return None
+class IpInfoClient:
+    @abc.abstractmethod
+    async def get_batch_details(self, ip_addresses: list[str]) -> dict[str, dict]:
+        """Looks up all the given IP addresses using a single batched request"""
+
+
+class IpInfoApiClient(IpInfoClient):
+    def __init__(self, access_token: str):
+        self.handler = ipinfo.getHandlerAsync(access_token)
+
+    async def get_batch_details(self, ip_addresses: list[str]) -> dict[str, dict]:
+        batch_details = await self.handler.getBatchDetails(
+            ip_addresses, raise_on_fail=False
+        )
+
+        return {
+            ip_address: details
+            for ip_address, details in batch_details.items()
+            if isinstance(details, dict)
+        }
+
+
+class LocalIpInfoClient(IpInfoClient):
+    """Stand-in for the ipinfo API used for tests and local development
+
+    Returns the details it was constructed with and records every lookup
+    """
+
+    def __init__(self, ip_addresses_details: dict[str, dict] | None = None):
+        self.ip_addresses_details = ip_addresses_details or {}
+        self.lookups: list[list[str]] = []
+
+    async def get_batch_details(self, ip_addresses: list[str]) -> dict[str, dict]:
+        self.lookups.append(ip_addresses)
+
+        return {
+            ip_address: self.ip_addresses_details[ip_address]
+            for ip_address in ip_addresses
+            if ip_address in self.ip_addresses_details
+        }
+
+
+ip_info_client: IpInfoClient = IpInfoApiClient(settings.IPINFO_ACCESS_TOKEN)
+
+memory_cache: TTLCache = TTLCache(
+    maxsize=IP_ADDRESS_DETAILS_MEMORY_CACHE_SIZE,
+    ttl=settings.IP_ADDRESS_DETAILS_CACHE_TTL_HOURS * 3600,
+)
+
+
+def get_ip_info_client() -> IpInfoClient:
+    return ip_info_client
+
+
+def set_ip_info_client(client: IpInfoClient) -> None:
+    global ip_info_client
+
+    ip_info_client = client
+    memory_cache.clear()
+
+
+def is_public_ip_address(ip_address: str) -> bool:
     try:
-        return handler.getDetails(ip_address).all
-    except (RequestQuotaExceededError, TimeoutExceededError, HTTPError):
-        return None
+        ip = ipaddress.ip_address(ip_address)
+    except ValueError:
+        return False
+
+    # Some multicast ranges count as global, yet they never identify a client
+    return ip.is_global and not ip.is_multicast
+
+
+def load_stored_details(db: Session, ip_addresses: list[str]) -> dict[str, dict]:
+    fetched_after = datetime.utcnow() - timedelta(
+        hours=settings.IP_ADDRESS_DETAILS_CACHE_TTL_HOURS
+    )
+
+    stored_details = (
+        db.query(models.IpAddressDetails.ip_address, models.IpAddressDetails.details)
+        .where(models.IpAddressDetails.ip_address.in_(ip_addresses))
+        .where(models.IpAddressDetails.fetched_at > fetched_after)
+        .all()
+    )
+
+    return {ip_address: details for ip_address, details in stored_details}
+
+
+def store_details(db: Session, ip_addresses_details: dict[str, dict]) -> None:
+    now = datetime.utcnow()
+
+    statement = insert(models.IpAddressDetails).values(
+        [
+            {"ip_address": ip_address, "details": details, "fetched_at": now}
+            for ip_address, details in ip_addresses_details.items()
+        ]
+    )
+    statement = statement.on_conflict_do_update(
+        index_elements=[models.IpAddressDetails.ip_address],
+        set_={
+            "details": statement.excluded.details,
+            "fetched_at": statement.excluded.fetched_at,
+        },
+    )
+
+    db.execute(statement)
+    db.commit()
+
+
+async def get_ip_addresses_details(
+    db: Session, ip_addresses: Iterable[str]
+) -> dict[str, dict | None]:
+    """Returns ipinfo details of every given IP address
+
+    Addresses are looked up in the in-process cache, then in the database
+    and only the remaining ones are requested from ipinfo using a single
+    batched call. Private addresses, hosts which aren't IP addresses
+    (e.g. a unix socket peer) and failed lookups map to None.
+    """
+    ip_addresses_details = {}
+    missing_ip_addresses = []
+
+    for ip_address in set(ip_addresses):
+        if not is_public_ip_address(ip_address):
+            ip_addresses_details[ip_address] = None
+        elif ip_address in memory_cache:
+            ip_addresses_details[ip_address] = memory_cache[ip_address]
+        else:
+            missing_ip_addresses.append(ip_address)
+
+    if missing_ip_addresses:
+        stored_details = await run_in_threadpool(
+            load_stored_details, db, missing_ip_addresses
+        )
+        memory_cache.update(stored_details)
+        ip_addresses_details.update(stored_details)
+
+        missing_ip_addresses = [
+            ip_address
+            for ip_address in missing_ip_addresses
+            if ip_address not in stored_details
+        ]
+
+    if missing_ip_addresses:
+        try:
+            fetched_details = await get_ip_info_client().get_batch_details(
+                missing_ip_addresses
+            )
+        except Exception:
+            app_logger.exception(
+                f"Failed to look up IP addresses: {missing_ip_addresses}"
+            )
+            fetched_details = {}
+
+        if fetched_details:
+            await run_in_threadpool(store_details, db, fetched_details)
+            memory_cache.update(fetched_details)
+
+        for ip_address in missing_ip_addresses:
+            ip_addresses_details[ip_address] = fetched_details.get(ip_address)
+
+    return ip_addresses_details
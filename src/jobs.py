@@ -1,79 +1,203 @@
-import datetime
+import math
+from datetime import datetime, timedelta, timezone
+from typing import Iterable, TypedDict
 
 from pydantic import UUID4
+from sqlalchemy import func, or_, select, update
 from sqlalchemy.orm import Session
 
-from .notifications_manager import (
-    AppointmentCanceledNotification,
-    AppointmentUpdatedNotification,
-    NewAppointmentNotification,
-    UpcomingAppointmentNotification,
-)
-
-
-def send_upcoming_appointment_notification(
-    get_db_func: callable,
-    *,
-    user_id: UUID4,
-    appointment_id: UUID4,
-    minutes_to_appointment: int,
-):
-    db = next(get_db_func())
-
-    upcoming_appointment_notification = UpcomingAppointmentNotification(
-        db=db,
-        user_id=user_id,
-        appointment_id=appointment_id,
-        minutes_to_appointment=minutes_to_appointment,
-    )
-    upcoming_appointment_notification.send()
+from . import models
+from .outbox import enqueue_notification
+from .schemas.notification_outbox import NotificationKind, UpcomingAppointmentPayload
 
+# Appointment reminders are sent this many minutes before the appointment
+REMINDER_MINUTES = (120, 30)
 
-async def send_new_appointment_notification(
-    db: Session,
-    *,
-    user_name: str,
-    user_surname: str,
-    service_id: UUID4,
-    appointment_date: datetime.datetime,
-):
-    new_appointment_notification = NewAppointmentNotification(
-        db=db,
-        user_name=user_name,
-        user_surname=user_surname,
-        service_id=service_id,
-        appointment_date=appointment_date,
-    )
-    await new_appointment_notification.send()
+# Reminders sent later than this state the actual time left to the appointment
+REMINDER_DELAY_TOLERANCE_MINUTES = 5
 
+# Postgres channel notified about appointments whose reminders changed
+REMINDERS_CHANNEL = "appointment_reminders"
 
-def send_appointment_updated_notification(
-    db: Session,
-    *,
-    user_id: UUID4,
-    service_id: UUID4,
-    new_appointment_date: datetime.datetime,
-):
-    appointment_updated_notification = AppointmentUpdatedNotification(
-        db=db,
-        user_id=user_id,
-        service_id=service_id,
-        new_appointment_date=new_appointment_date,
+
+class PendingReminder(TypedDict):
+    appointment_id: UUID4
+    minutes_to_appointment: int
+    due_at: datetime
+
+
+def get_reminder_sent_at_column(minutes_to_appointment: int):
+    return getattr(
+        models.Appointment, f"reminder_t_minus_{minutes_to_appointment}_sent_at"
     )
-    appointment_updated_notification.send()
 
 
-def send_appointment_canceled_notification(
+def skip_passed_reminders(
+    appointment_db: models.Appointment, appointment_start_time: datetime
+) -> None:
+    """Resets the appointment's reminders, marking those whose window already passed
+
+    Reminders are sent only for windows starting after the appointment
+    was booked (or moved)
+    """
+    now = datetime.now(timezone.utc)
+
+    for minutes_to_appointment in REMINDER_MINUTES:
+        window_start = appointment_start_time - timedelta(
+            minutes=minutes_to_appointment
+        )
+
+        setattr(
+            appointment_db,
+            f"reminder_t_minus_{minutes_to_appointment}_sent_at",
+            datetime.utcnow() if now >= window_start else None,
+        )
+
+
+def notify_reminders_changed(db: Session, appointment_id: UUID4) -> None:
+    # Delivered to the reminder scheduler when the transaction commits
+    db.execute(select(func.pg_notify(REMINDERS_CHANNEL, str(appointment_id))))
+
+
+def get_pending_reminders(
     db: Session,
-    *,
-    user_id: UUID4,
-    service_id: UUID4,
-    appointment_date: datetime.datetime,
-):
-    appointment_canceled_notification = AppointmentCanceledNotification(
-        db=db,
-        user_id=user_id,
-        service_id=service_id,
-        appointment_date=appointment_date,
+    until: datetime,
+    appointment_ids: Iterable[UUID4] | None = None,
+) -> list[PendingReminder]:
+    """Returns unsent reminders of upcoming appointments due before `until`
+
+    Reminders whose window already started are included, they're due now
+    """
+    now = datetime.now(timezone.utc)
+
+    query = (
+        db.query(
+            models.Appointment.id,
+            models.AppointmentSlot.start_time,
+            *(
+                get_reminder_sent_at_column(minutes_to_appointment)
+                for minutes_to_appointment in REMINDER_MINUTES
+            ),
+        )
+        .join(
+            models.AppointmentSlot,
+            models.Appointment.start_slot_id == models.AppointmentSlot.id,
+        )
+        .where(models.Appointment.canceled == False)
+        .where(models.AppointmentSlot.start_time > now)
+        .where(
+            models.AppointmentSlot.start_time
+            <= until + timedelta(minutes=max(REMINDER_MINUTES))
+        )
+        .where(
+            or_(
+                *(
+                    get_reminder_sent_at_column(minutes_to_appointment) == None
+                    for minutes_to_appointment in REMINDER_MINUTES
+                )
+            )
+        )
     )
-    appointment_canceled_notification.send()
+
+    if appointment_ids is not None:
+        query = query.where(models.Appointment.id.in_(list(appointment_ids)))
+
+    reminders = []
+
+    for row in query.all():
+        for minutes_to_appointment in REMINDER_MINUTES:
+            if getattr(row, f"reminder_t_minus_{minutes_to_appointment}_sent_at"):
+                continue
+
+            due_at = row.start_time - timedelta(minutes=minutes_to_appointment)
+
+            if due_at <= until:
+                reminders.append(
+                    PendingReminder(
+                        appointment_id=row.id,
+                        minutes_to_appointment=minutes_to_appointment,
+                        due_at=due_at,
+                    )
+                )
+
+    return reminders
+
+
+def send_appointment_reminders(db: Session, reminders: list[PendingReminder]) -> int:
+    """Marks the reminders as sent and enqueues them in a single transaction
+
+    The database has the final say, so reminders of appointments which
+    were canceled, moved or already reminded about are skipped. Late
+    reminders superseded by a closer one (e.g. both were missed during
+    downtime) are only marked as sent.
+    Returns the number of enqueued reminders
+    """
+    now = datetime.now(timezone.utc)
+    enqueued = 0
+
+    for minutes_to_appointment in REMINDER_MINUTES:
+        appointment_ids = [
+            reminder["appointment_id"]
+            for reminder in reminders
+            if reminder["minutes_to_appointment"] == minutes_to_appointment
+        ]
+
+        if not appointment_ids:
+            continue
+
+        sent_at_column = get_reminder_sent_at_column(minutes_to_appointment)
+
+        due_appointments = db.execute(
+            update(models.Appointment)
+            .where(models.Appointment.id.in_(appointment_ids))
+            .where(models.Appointment.start_slot_id == models.AppointmentSlot.id)
+            .where(sent_at_column == None)
+            .where(models.Appointment.canceled == False)
+            .where(models.AppointmentSlot.start_time > now)
+            .where(
+                models.AppointmentSlot.start_time
+                <= now + timedelta(minutes=minutes_to_appointment)
+            )
+            .values({sent_at_column: datetime.utcnow()})
+            .returning(
+                models.Appointment.id,
+                models.Appointment.user_id,
+                models.Appointment.service_id,
+                models.AppointmentSlot.start_time,
+            )
+            .execution_options(synchronize_session=False)
+        ).all()
+
+        for appointment in due_appointments:
+            minutes_left = math.ceil(
+                (appointment.start_time - now).total_seconds() / 60
+            )
+
+            # The closer reminder is due as well, sending both would be redundant
+            if any(
+                minutes_left <= closer_reminder_minutes
+                for closer_reminder_minutes in REMINDER_MINUTES
+                if closer_reminder_minutes < minutes_to_appointment
+            ):
+                continue
+
+            if minutes_left < minutes_to_appointment - REMINDER_DELAY_TOLERANCE_MINUTES:
+                reminder_minutes = minutes_left
+            else:
+                reminder_minutes = minutes_to_appointment
+
+            enqueue_notification(
+                db,
+                NotificationKind.upcoming_appointment,
+                UpcomingAppointmentPayload(
+                    user_id=appointment.user_id,
+                    appointment_id=appointment.id,
+                    service_id=appointment.service_id,
+                    minutes_to_appointment=reminder_minutes,
+                ),
+            )
+            enqueued += 1
+
+    db.commit()
+
+    return enqueued
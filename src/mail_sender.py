@@ -0,0 +1,181 @@
+import asyncio
+import time
+from email.message import EmailMessage
+from typing import TypedDict
+
+import aiosmtplib
+from fastapi_mail import ConnectionConfig
+
+from .loggers import app_logger
+
+# A message is retried once over a new connection if the pooled one went stale
+SMTP_SEND_ATTEMPTS = 2
+
+# Errors after which the connection can't be reused
+SMTP_CONNECTION_ERRORS = (
+    aiosmtplib.SMTPServerDisconnected,
+    aiosmtplib.SMTPConnectError,
+    aiosmtplib.SMTPTimeoutError,
+    ConnectionError,
+)
+
+
+class MailSenderMetrics(TypedDict):
+    sent: int
+    failed: int
+    connections_opened: int
+    reconnects: int
+    messages_per_second: float
+
+
+class SmtpMailSender:
+    """Delivers emails over a small pool of persistent, authenticated SMTP connections
+
+    Connections are opened lazily, reused for consecutive messages and
+    replaced when the server drops them, so sending a batch of emails costs
+    at most one TLS handshake and login per pooled connection
+    """
+
+    def __init__(self, config: ConnectionConfig, pool_size: int):
+        self.config = config
+        self.pool_size = pool_size
+        self.connections: asyncio.LifoQueue | None = None
+
+        self.sent = 0
+        self.failed = 0
+        self.connections_opened = 0
+        self.reconnects = 0
+        self.first_sent_at: float | None = None
+
+    def get_connections(self) -> asyncio.LifoQueue:
+        # Created on first use, so the queue belongs to the running event loop
+        if self.connections is None:
+            self.connections = asyncio.LifoQueue()
+
+            for _ in range(self.pool_size):
+                self.connections.put_nowait(None)
+
+        return self.connections
+
+    async def connect(self) -> aiosmtplib.SMTP:
+        smtp = aiosmtplib.SMTP(
+            hostname=self.config.MAIL_SERVER,
+            port=self.config.MAIL_PORT,
+            timeout=self.config.TIMEOUT,
+            use_tls=self.config.MAIL_SSL_TLS,
+            start_tls=self.config.MAIL_STARTTLS,
+            validate_certs=self.config.VALIDATE_CERTS,
+        )
+        await smtp.connect()
+
+        if self.config.USE_CREDENTIALS:
+            await smtp.login(self.config.MAIL_USERNAME, self.config.MAIL_PASSWORD)
+
+        self.connections_opened += 1
+
+        return smtp
+
+    @staticmethod
+    def discard(smtp: aiosmtplib.SMTP | None) -> None:
+        if smtp is not None:
+            smtp.close()
+
+    async def send(self, message: EmailMessage) -> None:
+        connections = self.get_connections()
+        smtp = await connections.get()
+
+        try:
+            for attempt in range(1, SMTP_SEND_ATTEMPTS + 1):
+                try:
+                    if smtp is None or not smtp.is_connected:
+                        smtp = await self.connect()
+
+                    await smtp.send_message(message)
+                    break
+                except SMTP_CONNECTION_ERRORS:
+                    self.discard(smtp)
+                    smtp = None
+
+                    if attempt == SMTP_SEND_ATTEMPTS:
+                        raise
+
+                    self.reconnects += 1
+        except Exception:
+            # The connection may be left in the middle of a transaction
+            self.discard(smtp)
+            smtp = None
+            self.failed += 1
+            raise
+        else:
+            self.sent += 1
+
+            if self.first_sent_at is None:
+                self.first_sent_at = time.monotonic()
+        finally:
+            connections.put_nowait(smtp)
+
+    async def send_many(self, messages: list[EmailMessage]) -> list[Exception | None]:
+        """Sends the messages concurrently over the pooled connections
+
+        Returns the exception raised for each message, None if it was sent
+        """
+        results = await asyncio.gather(
+            *(self.send(message) for message in messages), return_exceptions=True
+        )
+
+        return [result if isinstance(result, Exception) else None for result in results]
+
+    async def close(self) -> None:
+        if self.connections is None:
+            return
+
+        while not self.connections.empty():
+            smtp = self.connections.get_nowait()
+
+            if smtp is not None and smtp.is_connected:
+                try:
+                    await smtp.quit()
+                except Exception:
+                    self.discard(smtp)
+
+        self.connections = None
+
+    def get_metrics(self) -> MailSenderMetrics:
+        elapsed = time.monotonic() - self.first_sent_at if self.first_sent_at else 0
+
+        return MailSenderMetrics(
+            sent=self.sent,
+            failed=self.failed,
+            connections_opened=self.connections_opened,
+            reconnects=self.reconnects,
+            messages_per_second=round(self.sent / elapsed, 2) if elapsed else 0.0,
+        )
+
+    def log_metrics(self) -> None:
+        app_logger.info(f"Mail sender metrics: {self.get_metrics()}")
+
+
+class FakeMailSender(SmtpMailSender):
+    """Stand-in for the SMTP server used for tests and local development
+
+    Records every sent message instead of delivering it,
+    messages to `rejected_recipients` are refused the way SMTP servers refuse them
+    """
+
+    def __init__(self, rejected_recipients: set[str] | None = None):
+        super().__init__(config=None, pool_size=0)
+        self.rejected_recipients = rejected_recipients or set()
+        self.sent_messages: list[EmailMessage] = []
+
+    async def send(self, message: EmailMessage) -> None:
+        if message["To"] in self.rejected_recipients:
+            self.failed += 1
+            raise aiosmtplib.SMTPRecipientRefused(
+                550, "Mailbox unavailable", message["To"]
+            )
+
+        self.sent_messages.append(message)
+        self.sent += 1
+
+        if self.first_sent_at is None:
+            self.first_sent_at = time.monotonic()
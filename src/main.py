@@ -4,9 +4,20 @@ from fastapi.responses import RedirectResponse
 
 from . import github_client
 from .config import settings
+from .database import get_db
+from .email_manager import get_mail_sender
+from .email_renderer import get_email_renderer
 from .loggers import app_logger
+from .push_transport import close_push_transport
+from .rate_limiter import RATE_LIMIT_RULES, RateLimitMiddleware
 from .routers import appointments, auth, notifications, services, user_settings, users
-from .scheduler import configure_and_start_scheduler
+from .translation_catalog import get_translation_catalog
+
+if settings.RUN_BACKGROUND_WORKERS_IN_API:
+    # API-only workers don't load the scheduler
+    from . import worker as background_worker
+else:
+    background_worker = None
 
 app = FastAPI(
     docs_url=settings.BASE_URL + "/docs",
@@ -27,6 +38,8 @@ ALLOWED_ORIGINS = [
     settings.FRONTEND_URL,
 ]
 
+app.add_middleware(RateLimitMiddleware, rules=RATE_LIMIT_RULES)
+
 app.add_middleware(
     CORSMiddleware,
     allow_origins=ALLOWED_ORIGINS,
@@ -37,10 +50,31 @@ app.add_middleware(
 
 
 @app.on_event("startup")
-def startup():
+async def startup():
     app_logger.info("Application is in startup")
 
-    configure_and_start_scheduler()
+    get_email_renderer().compile_templates()
+
+    db = next(get_db())
+    try:
+        get_translation_catalog(db)
+    finally:
+        db.close()
+
+    if background_worker:
+        background_worker.start_background_workers()
+
+
+@app.on_event("shutdown")
+async def shutdown():
+    if background_worker:
+        await background_worker.stop_background_workers()
+
+    await close_push_transport()
+
+    mail_sender = get_mail_sender()
+    mail_sender.log_metrics()
+    await mail_sender.close()
 
 
 @app.get(settings.BASE_URL, tags=["Frontend Redirection"])
@@ -50,6 +84,15 @@ def frontend_redirection():
     )
 
 
+@app.get(settings.BASE_URL + "/health", tags=["Health"])
+def health():
+    # The separate worker process has its own health check
+    if not background_worker:
+        return {"status": "ok"}
+
+    return {"status": "ok", "scheduler_leader": background_worker.is_scheduler_leader()}
+
+
 @app.get(settings.BASE_URL + "/github_user/{username}")
 def get_github_user_data(username: str):
     if not settings.GH_APP_CLIENT_ID or not settings.GH_APP_CLIENT_SECRET:
@@ -6,11 +6,12 @@ from sqlalchemy import (
     Column,
     Enum,
     ForeignKey,
+    Index,
     Integer,
     String,
     UniqueConstraint,
 )
-from sqlalchemy.dialects.postgresql import UUID
+from sqlalchemy.dialects.postgresql import JSONB, UUID
 from sqlalchemy.orm import relationship
 from sqlalchemy.sql.expression import text
 from sqlalchemy.sql.sqltypes import ARRAY, DATE, TIMESTAMP
@@ -64,17 +65,25 @@ class Session(Base):
         nullable=False,
         server_default=text("gen_random_uuid()"),
     )
-    user_id = Column(UUID(as_uuid=True), ForeignKey("users.id"), nullable=False)
+    user_id = Column(
+        UUID(as_uuid=True), ForeignKey("users.id"), nullable=False, index=True
+    )
     access_token = Column(String, nullable=False)
     refresh_token = Column(String, nullable=False)
     sign_in_user_agent = Column(String, nullable=False)
     sign_in_ip_address = Column(String, nullable=False)
     last_user_agent = Column(String, nullable=False)
     last_ip_address = Column(String, nullable=False)
+    # Parsed user agents and IP geolocation, filled in asynchronously
+    sign_in_user_agent_info = Column(JSONB(none_as_null=True))
+    sign_in_location = Column(JSONB(none_as_null=True))
+    last_user_agent_info = Column(JSONB(none_as_null=True))
+    last_location = Column(JSONB(none_as_null=True))
     last_accessed = Column(
         TIMESTAMP(timezone=False),
         nullable=False,
         server_default=text("(now() at time zone('utc'))"),
+        index=True,
     )
     sudo_mode_activated = Column(TIMESTAMP(timezone=False))
     sudo_mode_expires = Column(TIMESTAMP(timezone=False))
@@ -96,6 +105,7 @@ class EmailRequests(Base):
         TIMESTAMP(timezone=False),
         nullable=False,
         server_default=text("(now() at time zone('utc'))"),
+        index=True,
     )
     UniqueConstraint("user_id", "request_type", name="limit_email_requests")
 
@@ -242,6 +252,9 @@ class Appointment(Base):
         nullable=False,
         server_default=text("(now() at time zone('utc'))"),
     )
+    # Set when the reminder is sent or its window passed before it could be
+    reminder_t_minus_120_sent_at = Column(TIMESTAMP(timezone=False))
+    reminder_t_minus_30_sent_at = Column(TIMESTAMP(timezone=False))
     start_slot = relationship(
         "AppointmentSlot", cascade="all,delete", foreign_keys=[start_slot_id]
     )
@@ -250,6 +263,23 @@ class Appointment(Base):
     )
     service = relationship("Service")
     user = relationship("User")
+    # Only appointments still waiting for a reminder are indexed
+    __table_args__ = (
+        Index(
+            "ix_appointments_pending_t_minus_120_reminder",
+            "start_slot_id",
+            postgresql_where=text(
+                "reminder_t_minus_120_sent_at IS NULL AND canceled = false"
+            ),
+        ),
+        Index(
+            "ix_appointments_pending_t_minus_30_reminder",
+            "start_slot_id",
+            postgresql_where=text(
+                "reminder_t_minus_30_sent_at IS NULL AND canceled = false"
+            ),
+        ),
+    )
 
 
 class FcmToken(Base):
@@ -264,6 +294,7 @@ class FcmToken(Base):
         TIMESTAMP(timezone=False),
         nullable=False,
         server_default=text("(now() at time zone('utc'))"),
+        index=True,
     )
 
 
@@ -279,7 +310,8 @@ class Setting(Base):
         nullable=False,
         server_default=text("(now() at time zone('utc'))"),
     )
-    UniqueConstraint("user_id", "name", name="unique_user_settings")
+
+    __table_args__ = (UniqueConstraint("user_id", "name", name="unique_user_settings"),)
 
 
 class Holiday(Base):
@@ -302,3 +334,50 @@ class Language(Base):
     id = Column(Integer, primary_key=True, nullable=False)
     code = Column(String, nullable=False, unique=True)
     name = Column(String, nullable=False, unique=True)
+
+
+class IpAddressDetails(Base):
+    __tablename__ = "ip_address_details"
+    ip_address = Column(String, primary_key=True, nullable=False)
+    details = Column(JSONB, nullable=False)
+    fetched_at = Column(
+        TIMESTAMP(timezone=False),
+        nullable=False,
+        server_default=text("(now() at time zone('utc'))"),
+        index=True,
+    )
+
+
+class NotificationOutbox(Base):
+    __tablename__ = "notification_outbox"
+    id = Column(Integer, primary_key=True, nullable=False)
+    kind = Column(String, nullable=False)
+    payload = Column(JSONB, nullable=False)
+    status = Column(String, nullable=False, server_default="pending")
+    attempts = Column(Integer, nullable=False, server_default="0")
+    next_attempt_at = Column(
+        TIMESTAMP(timezone=False),
+        nullable=False,
+        server_default=text("(now() at time zone('utc'))"),
+    )
+    last_error = Column(String)
+    # Set once the emails went out, so retries only redo the push messages
+    emails_sent_at = Column(TIMESTAMP(timezone=False))
+    created_at = Column(
+        TIMESTAMP(timezone=False),
+        nullable=False,
+        server_default=text("(now() at time zone('utc'))"),
+    )
+    processed_at = Column(TIMESTAMP(timezone=False), index=True)
+    __table_args__ = (
+        Index(
+            "ix_notification_outbox_status_next_attempt_at", "status", "next_attempt_at"
+        ),
+    )
+
+
+class TranslationCatalogVersion(Base):
+    __tablename__ = "translation_catalog_version"
+    id = Column(Integer, primary_key=True, nullable=False)
+    # Bumped by triggers on every change of languages and translations
+    version = Column(Integer, nullable=False, server_default="0")
@@ -0,0 +1,127 @@
+from typing import Iterable, TypedDict
+
+from pydantic import UUID4
+from sqlalchemy import and_, func, literal, select
+from sqlalchemy.orm import Session, aliased
+
+from . import models
+from .schemas.user_settings import AvailableSettings, DefaultContentLanguages
+
+
+class NotificationRecipient(TypedDict):
+    id: UUID4
+    email: str
+    is_owner: bool
+    language_id: int
+    language_code: str
+    fcm_tokens: list[str]
+    # Names of the batch's services in the recipient's language
+    service_names: dict[UUID4, str]
+
+
+class NotificationContext(TypedDict):
+    recipients: dict[UUID4, NotificationRecipient]
+    owner_ids: list[UUID4]
+
+
+def load_notification_context(
+    db: Session,
+    *,
+    user_ids: Iterable[UUID4],
+    service_ids: Iterable[UUID4],
+    include_owners: bool = False,
+) -> NotificationContext:
+    """Loads everything needed to build a batch of notifications in one query
+
+    Returns recipients (the given users and optionally all owners) with
+    their FCM tokens, content language and names of the given services
+    translated to that language
+    """
+    user_ids = list(set(user_ids))
+    service_ids = list(set(service_ids))
+
+    user_language = aliased(models.Language)
+    fallback_language = aliased(models.Language)
+
+    # Users without a (known) language setting get content in english,
+    # the same way as in utils.get_user_language_id
+    language_id = func.coalesce(user_language.id, fallback_language.id)
+    language_code = func.coalesce(user_language.code, fallback_language.code)
+
+    fcm_tokens = (
+        select(func.array_agg(models.FcmToken.token))
+        .where(models.FcmToken.user_id == models.User.id)
+        .scalar_subquery()
+    )
+
+    is_owner = models.User.permission_level.any("owner")
+
+    recipients_filter = models.User.id.in_(user_ids)
+    if include_owners:
+        recipients_filter = recipients_filter | is_owner
+
+    rows = (
+        db.query(
+            models.User.id,
+            models.User.email,
+            is_owner.label("is_owner"),
+            language_id.label("language_id"),
+            language_code.label("language_code"),
+            fcm_tokens.label("fcm_tokens"),
+            models.ServiceTranslations.service_id,
+            models.ServiceTranslations.name,
+        )
+        .outerjoin(
+            models.Setting,
+            and_(
+                models.Setting.user_id == models.User.id,
+                models.Setting.name == AvailableSettings.language.value,
+            ),
+        )
+        .outerjoin(user_language, user_language.code == models.Setting.current_value)
+        .join(
+            fallback_language,
+            fallback_language.code == DefaultContentLanguages.english.value,
+        )
+        .outerjoin(
+            models.ServiceTranslations,
+            and_(
+                models.ServiceTranslations.language_id == language_id,
+                (
+                    models.ServiceTranslations.service_id.in_(service_ids)
+                    if service_ids
+                    else literal(False)
+                ),
+            ),
+        )
+        .where(recipients_filter)
+        .all()
+    )
+
+    recipients: dict[UUID4, NotificationRecipient] = {}
+
+    for row in rows:
+        recipient = recipients.setdefault(
+            row.id,
+            NotificationRecipient(
+                id=row.id,
+                email=row.email,
+                is_owner=row.is_owner,
+                language_id=row.language_id,
+                language_code=row.language_code,
+                fcm_tokens=row.fcm_tokens or [],
+                service_names={},
+            ),
+        )
+
+        if row.service_id:
+            recipient["service_names"][row.service_id] = row.name
+
+    return NotificationContext(
+        recipients=recipients,
+        owner_ids=[
+            recipient_id
+            for recipient_id, recipient in recipients.items()
+            if recipient["is_owner"]
+        ],
+    )
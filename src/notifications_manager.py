@@ -1,39 +1,82 @@
 import abc
 import datetime
-from typing import TypedDict
+from typing import Hashable, TypedDict
 
 from fastapi_mail import FastMail, MessageSchema
 from pydantic import UUID4
-from sqlalchemy.orm import Session
 
-from src import models
+from src.config import settings
 from src.email_manager import (
     create_new_appointment_email,
+    create_new_appointments_digest_email,
     get_fast_mail_client,
-    send_email,
+    send_emails,
 )
-from src.fcm_manager import send_multicast_message
+from src.exceptions import EmailDeliveryException
+from src.fcm_manager import PushBatch
 from src.loggers import app_logger
-from src.utils import format_datetime_str, get_user_language_id
+from src.notification_context import NotificationContext, NotificationRecipient
+from src.schemas.notification_outbox import NewAppointmentPayload
+from src.schemas.user_settings import DefaultContentLanguages
+from src.utils import format_datetime_str
+
+# Upper bound of messages buffered by a single notification (one per owner)
+NEW_APPOINTMENT_NOTIFICATION_MAX_BUFFERED = 100
+
+# Appointments listed in a digest push message, the email lists all of them
+DIGEST_PUSH_MAX_APPOINTMENTS = 5
+
+
+def get_service_name(recipient: NotificationRecipient, service_id: UUID4) -> str:
+    return recipient["service_names"].get(service_id, settings.COMPANY_NAME)
+
+
+def get_minutes_to_appointment_msg(minutes: int) -> str:
+    if minutes == 1:
+        unit = "minutę"
+    elif minutes % 10 in (2, 3, 4) and minutes % 100 not in (12, 13, 14):
+        unit = "minuty"
+    else:
+        unit = "minut"
+
+    return f"Twoja wizyta odbędzie się za {minutes} {unit}"
+
+
+def get_content_language(recipient: NotificationRecipient) -> DefaultContentLanguages:
+    """Returns the recipient's language, english if there's no content in it"""
+    try:
+        return DefaultContentLanguages(recipient["language_code"])
+    except ValueError:
+        return DefaultContentLanguages.english
+
+
+def get_new_appointments_title(
+    count: int, content_language: DefaultContentLanguages
+) -> str:
+    if content_language == DefaultContentLanguages.english:
+        return "1 new appointment" if count == 1 else f"{count} new appointments"
+
+    if count == 1:
+        return "1 nowa wizyta"
+
+    if count % 10 in (2, 3, 4) and count % 100 not in (12, 13, 14):
+        return f"{count} nowe wizyty"
+
+    return f"{count} nowych wizyt"
 
 
 class Notification:
-    db: Session
     abort_send: bool = False
-    fcm_tokens_db: list[models.FcmToken]
     fcm_tokens: list[str]
     title: str
     msg: str
 
     @abc.abstractmethod
-    def send(self) -> None:
+    def send(self, push_batch: PushBatch, key: Hashable | None = None) -> None:
+        """Adds the push messages to the batch, they're sent when it's flushed"""
         if not self.abort_send and self.fcm_tokens:
-            send_multicast_message(
-                db=self.db,
-                fcm_tokens_db=self.fcm_tokens_db,
-                title=self.title,
-                msg=self.msg,
-                fcm_tokens=self.fcm_tokens,
+            push_batch.add(
+                fcm_tokens=self.fcm_tokens, title=self.title, msg=self.msg, key=key
             )
 
             # TODO: send email
@@ -44,89 +87,52 @@ class UpcomingAppointmentNotification(Notification):
     appointment_id: UUID4
     minutes_to_appointment: int
 
-    user: models.User
-    appointment: models.Appointment
-
     def __init__(
         self,
         *,
-        db: Session,
+        context: NotificationContext,
         user_id: UUID4,
         appointment_id: UUID4,
+        service_id: UUID4,
         minutes_to_appointment: int,
     ):
-        self.db = db
         self.user_id = user_id
         self.appointment_id = appointment_id
         self.minutes_to_appointment = minutes_to_appointment
 
-        self.fcm_tokens_db = (
-            db.query(models.FcmToken)
-            .where(models.FcmToken.user_id == self.user_id)
-            .all()
-        )
-
-        if self.fcm_tokens_db:
-            self.fcm_tokens = [token_db.token for token_db in self.fcm_tokens_db]
-
-            self.user = db.query(models.User).where(models.User.id == user_id).first()
+        recipient = context["recipients"].get(user_id)
 
-            self.appointment = (
-                db.query(models.Appointment)
-                .where(models.Appointment.id == appointment_id)
-                .first()
-            )
-
-            # TODO: Notification settings
-            # user_notification_settings = (
-            #     db.query(models.Setting)
-            #     .where(models.Setting.user_id == user_id)
-            #     .where(models.Setting.name == "notifications")
-            #     .all()
-            # )
-
-            # TODO: translations
-            # match self.content_language:
-            #     case DefaultContentLanguages.polish:
-            #         self.title = "Nadchodząca wizyta"
-            #         self.msg = f"Wizyta rozpocznie się za {} "
-            #     case DefaultContentLanguages.english:
-            #         self.title = "Upcoming appointment"
-            #         self.msg = f"Your appointment will take place in {}"
-            #     case _:
-            #         raise ValueError()
-
-            service_db = (
-                db.query(models.Service)
-                .where(models.Service.id == self.appointment.service_id)
-                .first()
-            )
+        # TODO: Notification settings
 
-            language_id = get_user_language_id(db, self.user.id)
+        # TODO: translations
+        # match self.content_language:
+        #     case DefaultContentLanguages.polish:
+        #         self.title = "Nadchodząca wizyta"
+        #         self.msg = f"Wizyta rozpocznie się za {} "
+        #     case DefaultContentLanguages.english:
+        #         self.title = "Upcoming appointment"
+        #         self.msg = f"Your appointment will take place in {}"
+        #     case _:
+        #         raise ValueError()
 
-            service_translation = (
-                db.query(
-                    models.ServiceTranslations.name,
-                    models.ServiceTranslations.description,
-                )
-                .where(models.ServiceTranslations.language_id == language_id)
-                .where(models.ServiceTranslations.service_id == service_db.id)
-                .first()
-            )
-            service_name = service_translation[0]
+        if recipient and recipient["fcm_tokens"]:
+            self.fcm_tokens = recipient["fcm_tokens"]
 
-            self.title = service_name
+            self.title = get_service_name(recipient, service_id)
 
             match minutes_to_appointment:
                 case 30:
                     self.msg = "Twoja wizyta odbędzie się za 30 minut"
                 case 120:
                     self.msg = "Twoja wizyta odbędzie się za 2 godziny"
+                case _:
+                    # Reminders sent late state the actual time left
+                    self.msg = get_minutes_to_appointment_msg(minutes_to_appointment)
         else:
             self.abort_send = True
 
-    def send(self) -> None:
-        super().send()
+    def send(self, push_batch: PushBatch, key: Hashable | None = None) -> None:
+        super().send(push_batch, key)
 
 
 class AppointmentUpdatedNotification(Notification):
@@ -135,36 +141,21 @@ class AppointmentUpdatedNotification(Notification):
     def __init__(
         self,
         *,
-        db: Session,
+        context: NotificationContext,
         user_id: UUID4,
         service_id: UUID4,
         new_appointment_date: datetime.datetime,
     ):
-        self.db = db
+        self.user_id = user_id
 
-        self.fcm_tokens_db = (
-            db.query(models.FcmToken).where(models.FcmToken.user_id == user_id).all()
-        )
+        recipient = context["recipients"].get(user_id)
 
         # TODO: Notification settings
 
-        if self.fcm_tokens_db:
-            self.fcm_tokens = [token_db.token for token_db in self.fcm_tokens_db]
+        if recipient and recipient["fcm_tokens"]:
+            self.fcm_tokens = recipient["fcm_tokens"]
 
-            language_id = get_user_language_id(db, user_id)
-
-            service_translation = (
-                db.query(
-                    models.ServiceTranslations.name,
-                    models.ServiceTranslations.description,
-                )
-                .where(models.ServiceTranslations.language_id == language_id)
-                .where(models.ServiceTranslations.service_id == service_id)
-                .first()
-            )
-            service_name = service_translation[0]
-
-            self.title = service_name
+            self.title = get_service_name(recipient, service_id)
             self.msg = (
                 f"Zmieniono datę wizyty na"
                 f" {format_datetime_str(new_appointment_date)}"
@@ -173,8 +164,8 @@ class AppointmentUpdatedNotification(Notification):
         else:
             self.abort_send = True
 
-    def send(self) -> None:
-        super().send()
+    def send(self, push_batch: PushBatch, key: Hashable | None = None) -> None:
+        super().send(push_batch, key)
 
 
 class AppointmentCanceledNotification(Notification):
@@ -183,36 +174,21 @@ class AppointmentCanceledNotification(Notification):
     def __init__(
         self,
         *,
-        db: Session,
+        context: NotificationContext,
         user_id: UUID4,
         service_id: UUID4,
         appointment_date: datetime.datetime,
     ):
-        self.db = db
+        self.user_id = user_id
 
-        self.fcm_tokens_db = (
-            db.query(models.FcmToken).where(models.FcmToken.user_id == user_id).all()
-        )
+        recipient = context["recipients"].get(user_id)
 
         # TODO: Notification settings
 
-        if self.fcm_tokens_db:
-            self.fcm_tokens = [token_db.token for token_db in self.fcm_tokens_db]
-
-            language_id = get_user_language_id(db, user_id)
-
-            service_translation = (
-                db.query(
-                    models.ServiceTranslations.name,
-                    models.ServiceTranslations.description,
-                )
-                .where(models.ServiceTranslations.language_id == language_id)
-                .where(models.ServiceTranslations.service_id == service_id)
-                .first()
-            )
-            service_name = service_translation[0]
+        if recipient and recipient["fcm_tokens"]:
+            self.fcm_tokens = recipient["fcm_tokens"]
 
-            self.title = service_name
+            self.title = get_service_name(recipient, service_id)
             self.msg = (
                 f"Wizyta ({format_datetime_str(appointment_date)})" f" została odwołana"
             )
@@ -220,11 +196,17 @@ class AppointmentCanceledNotification(Notification):
         else:
             self.abort_send = True
 
-    def send(self) -> None:
-        super().send()
+    def send(self, push_batch: PushBatch, key: Hashable | None = None) -> None:
+        super().send(push_batch, key)
 
 
 class NewAppointmentNotification(Notification):
+    """Notifies owners about a new appointment via push messages and emails
+
+    Messages are buffered per instance and flushed by `send`, so sending
+    again doesn't repeat them
+    """
+
     user_name: str
     user_surname: str
     service_id: UUID4
@@ -232,7 +214,6 @@ class NewAppointmentNotification(Notification):
     fast_mail_client: FastMail
 
     class Notification(TypedDict):
-        fcm_tokens_db: list[models.FcmToken]
         fcm_tokens: list[str]
         title: str
         msg: str
@@ -241,113 +222,187 @@ class NewAppointmentNotification(Notification):
         message: MessageSchema
         template_name: str
 
-    notifications: list[Notification] = []
-    emails: list[Email] = []
+    notifications: list[Notification]
+    emails: list[Email]
 
     def __init__(
         self,
         *,
-        db: Session,
+        context: NotificationContext,
         user_name: str,
         user_surname: str,
         service_id: UUID4,
         appointment_date: datetime.datetime,
+        fast_mail_client: FastMail | None = None,
     ):
-        self.db = db
-
-        self.fast_mail_client = get_fast_mail_client()
+        self.fast_mail_client = fast_mail_client or get_fast_mail_client()
 
         self.user_name = user_name
         self.user_surname = user_surname
         self.service_id = service_id
         self.appointment_date = appointment_date
 
-        # TODO: Notification settings
+        self.notifications = []
+        self.emails = []
 
-        notification_recipients = (
-            db.query(models.User).where(models.User.permission_level.any("owner")).all()
-        )
+        # TODO: Notification settings
 
-        if not notification_recipients:
+        if not context["owner_ids"]:
             self.abort_send = True
             return
 
-        service_db = (
-            db.query(models.Service).where(models.Service.id == self.service_id).first()
-        )
-
-        for recipient in notification_recipients:
-            language_id = get_user_language_id(db, recipient.id)
+        for owner_id in context["owner_ids"]:
+            recipient = context["recipients"][owner_id]
 
-            service_translation = (
-                db.query(
-                    models.ServiceTranslations.name,
-                    models.ServiceTranslations.description,
-                )
-                .where(models.ServiceTranslations.language_id == language_id)
-                .where(models.ServiceTranslations.service_id == service_db.id)
-                .first()
-            )
-            service_name = service_translation[0]
+            service_name = get_service_name(recipient, self.service_id)
 
             title = f"{self.user_name} {self.user_surname} umówił/a wizytę"
             msg = f"{service_name} - {format_datetime_str(self.appointment_date)}"
 
             message, template_name = create_new_appointment_email(
-                recipient.email, title, msg
+                recipient["email"], title, msg
             )
 
-            self.emails.append({"message": message, "template_name": template_name})
-
-            recipient_fcm_tokens_db = db.query(models.FcmToken).where(
-                models.FcmToken.user_id == recipient.id
+            self.buffer(
+                self.emails, {"message": message, "template_name": template_name}
             )
 
-            if recipient_fcm_tokens_db:
-                recipient_fcm_tokens = [
-                    token_db.token for token_db in recipient_fcm_tokens_db
-                ]
-
-                self.notifications.append(
+            if recipient["fcm_tokens"]:
+                self.buffer(
+                    self.notifications,
                     {
-                        "fcm_tokens_db": recipient_fcm_tokens_db,
-                        "fcm_tokens": recipient_fcm_tokens,
+                        "fcm_tokens": recipient["fcm_tokens"],
                         "title": title,
                         "msg": msg,
-                    }
+                    },
                 )
 
-    async def send(self) -> None:
+    @staticmethod
+    def buffer(buffer: list, item: Notification | Email) -> None:
+        if len(buffer) >= NEW_APPOINTMENT_NOTIFICATION_MAX_BUFFERED:
+            app_logger.warning(
+                "New appointment notification buffer is full, dropping message"
+            )
+            return
+
+        buffer.append(item)
+
+    async def send(self, push_batch: PushBatch, key: Hashable | None = None) -> None:
+        # Emails go first, so push messages aren't queued if they can't be built
+        await self.send_buffered_emails()
+        self.add_push_messages(push_batch, key)
+
+    def add_push_messages(
+        self, push_batch: PushBatch, key: Hashable | None = None
+    ) -> None:
         if self.abort_send:
             return
 
-        for notification in self.notifications:
-            try:
-                fcm_tokens = notification.get("fcm_tokens")
-
-                if fcm_tokens:
-                    send_multicast_message(
-                        db=self.db,
-                        fcm_tokens_db=notification.get("fcm_tokens_db"),
-                        title=notification.get("title"),
-                        msg=notification.get("msg"),
-                        fcm_tokens=fcm_tokens,
-                    )
-            except Exception:
-                app_logger.exception(
-                    "Exception during sending new appointment fcm notification: \n"
-                    f"Notification: {str(notification)}"
-                )
+        notifications, self.notifications = self.notifications, []
 
-        for email in self.emails:
-            try:
-                await send_email(
-                    email.get("message"),
-                    email.get("template_name"),
-                    self.fast_mail_client,
-                )
-            except Exception:
-                app_logger.exception(
+        for notification in notifications:
+            push_batch.add(
+                fcm_tokens=notification.get("fcm_tokens"),
+                title=notification.get("title"),
+                msg=notification.get("msg"),
+                key=key,
+            )
+
+    async def send_buffered_emails(self) -> None:
+        """Sends the buffered emails
+
+        Raises EmailDeliveryException if any of them wasn't sent, so the
+        notification is retried. Owners already emailed then get it again
+        """
+        if self.abort_send:
+            return
+
+        emails, self.emails = self.emails, []
+
+        if not emails:
+            return
+
+        results = await send_emails(
+            [(email.get("message"), email.get("template_name")) for email in emails],
+            self.fast_mail_client,
+        )
+
+        errors = []
+
+        for email, error in zip(emails, results):
+            if error:
+                app_logger.error(
                     "Exception during sending new appointment email notification: \n"
-                    f"Email: {str(email)}"
+                    f"Email: {str(email)}, error: {error!r}"
+                )
+                errors.append(error)
+
+        if errors:
+            raise EmailDeliveryException(errors)
+
+
+class NewAppointmentsDigestNotification(NewAppointmentNotification):
+    """Notifies owners about appointments booked within a digest window
+
+    Every owner gets a single push message and email summarising all the appointments,
+    in the owner's language
+    """
+
+    appointments: list[NewAppointmentPayload]
+
+    def __init__(
+        self,
+        *,
+        context: NotificationContext,
+        appointments: list[NewAppointmentPayload],
+        fast_mail_client: FastMail | None = None,
+    ):
+        self.fast_mail_client = fast_mail_client or get_fast_mail_client()
+
+        self.appointments = sorted(
+            appointments, key=lambda appointment: appointment.appointment_date
+        )
+
+        self.notifications = []
+        self.emails = []
+
+        # TODO: Notification settings
+
+        if not context["owner_ids"] or not self.appointments:
+            self.abort_send = True
+            return
+
+        for owner_id in context["owner_ids"]:
+            recipient = context["recipients"][owner_id]
+            content_language = get_content_language(recipient)
+            title = get_new_appointments_title(len(self.appointments), content_language)
+
+            appointment_lines = [
+                f"{appointment.user_name} {appointment.user_surname}: "
+                f"{get_service_name(recipient, appointment.service_id)}"
+                f" - {format_datetime_str(appointment.appointment_date)}"
+                for appointment in self.appointments
+            ]
+
+            message, template_name = create_new_appointments_digest_email(
+                content_language, recipient["email"], title, appointment_lines
+            )
+
+            self.buffer(
+                self.emails, {"message": message, "template_name": template_name}
+            )
+
+            if recipient["fcm_tokens"]:
+                msg = "\n".join(appointment_lines[:DIGEST_PUSH_MAX_APPOINTMENTS])
+
+                if len(appointment_lines) > DIGEST_PUSH_MAX_APPOINTMENTS:
+                    msg += f"\n+{len(appointment_lines) - DIGEST_PUSH_MAX_APPOINTMENTS}"
+
+                self.buffer(
+                    self.notifications,
+                    {
+                        "fcm_tokens": recipient["fcm_tokens"],
+                        "title": title,
+                        "msg": msg,
+                    },
                 )
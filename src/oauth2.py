@@ -4,9 +4,9 @@ from datetime import datetime, timedelta
 from . import models
 from .config import settings
 from typing import Optional, Callable
-from fastapi import Depends, Header, status, Request
+from fastapi import BackgroundTasks, Depends, Header, status, Request
 from sqlalchemy.orm import Session
-from .database import get_db
+from .database import get_db, get_db_factory
 from fastapi.security import OAuth2PasswordBearer
 from .schemas.oauth2 import (
     TokenPayloadBase,
@@ -29,6 +29,8 @@ from .exceptions import (
     UserNotFoundException,
 )
 from secrets import compare_digest
+from .session_enrichment import enrich_session
+from .utils import update_session_last_access
 
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="/api/auth/login")
 
@@ -142,8 +144,10 @@ def get_user_no_verification(
 
 def get_user(
     request: Request,
+    background_tasks: BackgroundTasks,
     token: str = Depends(oauth2_scheme),
     db: Session = Depends(get_db),
+    get_db_func: callable = Depends(get_db_factory),
     user_agent: str | None = Header(None),
 ) -> UserSession:
     payload = decode_jwt(token, expected_token_type=TokenType.access_token)
@@ -166,11 +170,14 @@ def get_user(
     if not session_db:
         raise SessionNotFoundHTTPException()
 
-    session_db.last_accessed = datetime.utcnow()
-    session_db.last_user_agent = user_agent
-    session_db.last_ip_address = request.client.host
+    session_changed = update_session_last_access(
+        session_db, user_agent=user_agent, ip_address=request.client.host
+    )
     db.commit()
 
+    if session_changed:
+        background_tasks.add_task(enrich_session, get_db_func, session_id=session_db.id)
+
     if user.disabled:
         raise AccountDisabledHTTPException()
 
@@ -0,0 +1,51 @@
+from datetime import datetime, timedelta
+
+from pydantic import BaseModel
+from sqlalchemy.orm import Session
+
+from . import models
+from .config import settings
+from .schemas.notification_outbox import NOTIFICATION_PAYLOADS, NotificationKind
+
+
+def enqueue_notification(
+    db: Session, kind: NotificationKind, payload: BaseModel
+) -> models.NotificationOutbox:
+    """Adds a notification to the outbox without committing
+
+    The notification is persisted in the same transaction as the change it
+    announces and is sent later by the outbox worker
+
+    In digest mode new appointments are held until the end of the current
+    digest window, so they can be announced to owners together
+    """
+    if not isinstance(payload, NOTIFICATION_PAYLOADS[kind]):
+        raise ValueError(f"Invalid payload type for {kind.value} notification")
+
+    notification_db = models.NotificationOutbox(
+        kind=kind.value, payload=payload.model_dump(mode="json")
+    )
+
+    if (
+        settings.OWNER_NOTIFICATION_DIGEST_MINUTES
+        and kind == NotificationKind.new_appointment
+    ):
+        notification_db.next_attempt_at = get_digest_window_end(
+            datetime.utcnow(), settings.OWNER_NOTIFICATION_DIGEST_MINUTES
+        )
+
+    db.add(notification_db)
+
+    return notification_db
+
+
+def get_digest_window_end(now: datetime, window_minutes: int) -> datetime:
+    """Returns the end of the digest window containing `now`
+
+    Windows are aligned to midnight, so e.g. 15-minute windows end
+    at :00, :15, :30 and :45
+    """
+    window = timedelta(minutes=window_minutes)
+    midnight = now.replace(hour=0, minute=0, second=0, microsecond=0)
+
+    return midnight + ((now - midnight) // window + 1) * window
@@ -0,0 +1,404 @@
+import asyncio
+import contextlib
+from datetime import datetime, timedelta
+from typing import Hashable, TypedDict
+
+from pydantic import BaseModel
+from sqlalchemy.orm import Session
+from starlette.concurrency import run_in_threadpool
+
+from . import models
+from .config import settings
+from .fcm_manager import PushBatch
+from .loggers import app_logger
+from .notification_context import NotificationContext, load_notification_context
+from .notifications_manager import (
+    AppointmentCanceledNotification,
+    AppointmentUpdatedNotification,
+    NewAppointmentNotification,
+    NewAppointmentsDigestNotification,
+    UpcomingAppointmentNotification,
+)
+from .schemas.notification_outbox import (
+    NOTIFICATION_PAYLOADS,
+    NotificationKind,
+    OutboxStatus,
+)
+
+# Claimed notifications are retried after this time if the worker dies while sending
+OUTBOX_LEASE_SECONDS = 300
+OUTBOX_MAX_RETRY_DELAY_SECONDS = 6 * 3600
+
+# Push batch key of the owner digest, shared by all the summarised notifications
+OWNER_DIGEST_KEY = "owner_digest"
+
+
+class ClaimedNotification(TypedDict):
+    id: int
+    kind: NotificationKind
+    payload: BaseModel
+    attempts: int
+    emails_sent: bool
+
+
+def claim_notifications(db: Session, batch_size: int) -> list[ClaimedNotification]:
+    """Locks a batch of due notifications and leases them to this worker
+
+    Rows locked by other workers are skipped, so several workers can drain
+    the outbox concurrently without sending anything twice
+    """
+    now = datetime.utcnow()
+
+    notifications_db = (
+        db.query(models.NotificationOutbox)
+        .where(models.NotificationOutbox.status == OutboxStatus.pending)
+        .where(models.NotificationOutbox.next_attempt_at <= now)
+        .order_by(models.NotificationOutbox.next_attempt_at)
+        .limit(batch_size)
+        .with_for_update(skip_locked=True)
+        .all()
+    )
+
+    claimed_notifications = []
+
+    for notification_db in notifications_db:
+        notification_db.attempts += 1
+        notification_db.next_attempt_at = now + timedelta(seconds=OUTBOX_LEASE_SECONDS)
+
+        try:
+            kind = NotificationKind(notification_db.kind)
+            payload = NOTIFICATION_PAYLOADS[kind].model_validate(
+                notification_db.payload
+            )
+        except ValueError as e:
+            # Retrying a malformed notification would never succeed
+            app_logger.error(f"Invalid notification #{notification_db.id}: {e}")
+            notification_db.status = OutboxStatus.dead
+            notification_db.processed_at = now
+            notification_db.last_error = repr(e)
+            continue
+
+        claimed_notifications.append(
+            ClaimedNotification(
+                id=notification_db.id,
+                kind=kind,
+                payload=payload,
+                attempts=notification_db.attempts,
+                emails_sent=notification_db.emails_sent_at is not None,
+            )
+        )
+
+    db.commit()
+
+    return claimed_notifications
+
+
+def mark_notifications_sent(db: Session, notification_ids: list[int]) -> None:
+    db.query(models.NotificationOutbox).where(
+        models.NotificationOutbox.id.in_(notification_ids)
+    ).update(
+        {
+            models.NotificationOutbox.status: OutboxStatus.sent,
+            models.NotificationOutbox.processed_at: datetime.utcnow(),
+            models.NotificationOutbox.last_error: None,
+        },
+        synchronize_session=False,
+    )
+    db.commit()
+
+
+def mark_emails_sent(db: Session, notification_ids: list[int]) -> None:
+    db.query(models.NotificationOutbox).where(
+        models.NotificationOutbox.id.in_(notification_ids)
+    ).update(
+        {models.NotificationOutbox.emails_sent_at: datetime.utcnow()},
+        synchronize_session=False,
+    )
+    db.commit()
+
+
+def get_retry_delay(attempts: int) -> timedelta:
+    return timedelta(
+        seconds=min(
+            settings.OUTBOX_RETRY_BASE_SECONDS * 2 ** (attempts - 1),
+            OUTBOX_MAX_RETRY_DELAY_SECONDS,
+        )
+    )
+
+
+def mark_notification_failed(
+    db: Session, notification: ClaimedNotification, error: str
+) -> None:
+    now = datetime.utcnow()
+
+    if notification["attempts"] >= settings.OUTBOX_MAX_ATTEMPTS:
+        values = {
+            models.NotificationOutbox.status: OutboxStatus.dead,
+            models.NotificationOutbox.processed_at: now,
+        }
+        app_logger.error(
+            f"Notification #{notification['id']} moved to dead letters "
+            f"after {notification['attempts']} attempts"
+        )
+    else:
+        values = {
+            models.NotificationOutbox.next_attempt_at: now
+            + get_retry_delay(notification["attempts"])
+        }
+
+    values[models.NotificationOutbox.last_error] = error
+
+    db.query(models.NotificationOutbox).where(
+        models.NotificationOutbox.id == notification["id"]
+    ).update(values, synchronize_session=False)
+    db.commit()
+
+
+def load_batch_context(
+    db: Session, notifications: list[ClaimedNotification]
+) -> NotificationContext:
+    user_ids = set()
+    service_ids = set()
+    include_owners = False
+
+    for notification in notifications:
+        payload = notification["payload"]
+        service_ids.add(payload.service_id)
+
+        if notification["kind"] == NotificationKind.new_appointment:
+            include_owners = True
+        else:
+            user_ids.add(payload.user_id)
+
+    return load_notification_context(
+        db, user_ids=user_ids, service_ids=service_ids, include_owners=include_owners
+    )
+
+
+async def send_notification(
+    context: NotificationContext,
+    notification: ClaimedNotification,
+    push_batch: PushBatch,
+) -> bool:
+    """Sends the notification's emails and adds its push messages to the batch
+
+    Emails already sent by an earlier attempt aren't sent again.
+    Returns whether emails were sent
+    """
+    kind = notification["kind"]
+    payload_values = notification["payload"].model_dump()
+
+    match kind:
+        case NotificationKind.new_appointment:
+            new_appointment_notification = NewAppointmentNotification(
+                context=context, **payload_values
+            )
+            if notification["emails_sent"]:
+                new_appointment_notification.add_push_messages(
+                    push_batch, notification["id"]
+                )
+                return False
+
+            await new_appointment_notification.send(push_batch, notification["id"])
+            return True
+        case NotificationKind.upcoming_appointment:
+            sync_notification = UpcomingAppointmentNotification(
+                context=context, **payload_values
+            )
+        case NotificationKind.appointment_updated:
+            sync_notification = AppointmentUpdatedNotification(
+                context=context, **payload_values
+            )
+        case NotificationKind.appointment_canceled:
+            sync_notification = AppointmentCanceledNotification(
+                context=context, **payload_values
+            )
+        case _:
+            raise ValueError(f"Unsupported notification kind: {kind}")
+
+    sync_notification.send(push_batch, notification["id"])
+    return False
+
+
+def is_digest_notification(notification: ClaimedNotification) -> bool:
+    return bool(settings.OWNER_NOTIFICATION_DIGEST_MINUTES) and (
+        notification["kind"] == NotificationKind.new_appointment
+    )
+
+
+async def send_owner_digest(
+    context: NotificationContext,
+    notifications: list[ClaimedNotification],
+    push_batch: PushBatch,
+) -> list[int]:
+    """Sends the digest email and adds its push messages to the batch
+
+    Appointments emailed by an earlier attempt are left out of the email,
+    while the push message always summarises all of them.
+    Returns IDs of the notifications whose emails were sent, raises
+    EmailDeliveryException without queueing the push message if they weren't
+    """
+    digest_notification = NewAppointmentsDigestNotification(
+        context=context,
+        appointments=[notification["payload"] for notification in notifications],
+    )
+
+    unemailed_notifications = [
+        notification
+        for notification in notifications
+        if not notification["emails_sent"]
+    ]
+
+    if len(unemailed_notifications) == len(notifications):
+        await digest_notification.send_buffered_emails()
+    elif unemailed_notifications:
+        await NewAppointmentsDigestNotification(
+            context=context,
+            appointments=[
+                notification["payload"] for notification in unemailed_notifications
+            ],
+        ).send_buffered_emails()
+
+    digest_notification.add_push_messages(push_batch, OWNER_DIGEST_KEY)
+
+    return [notification["id"] for notification in unemailed_notifications]
+
+
+async def drain_outbox(get_db_func: callable) -> int:
+    """Sends a single batch of due notifications
+
+    Data needed by all the notifications is loaded using a single query and
+    their push messages are collected and sent together.
+    In digest mode, new appointments are announced to owners with one summary.
+    Returns the number of claimed notifications
+    """
+    db = next(get_db_func())
+
+    try:
+        notifications = await run_in_threadpool(
+            claim_notifications, db, settings.OUTBOX_BATCH_SIZE
+        )
+
+        if not notifications:
+            return 0
+
+        context = await run_in_threadpool(load_batch_context, db, notifications)
+
+        push_batch = PushBatch()
+        prepared_notifications = []
+        push_keys: dict[int, Hashable] = {}
+        digest_notifications = []
+        emailed_notification_ids = []
+
+        for notification in notifications:
+            if is_digest_notification(notification):
+                digest_notifications.append(notification)
+                continue
+
+            try:
+                emails_sent = await send_notification(context, notification, push_batch)
+            except Exception as e:
+                app_logger.exception(
+                    f"Failed to send {notification['kind'].value} "
+                    f"notification #{notification['id']}"
+                )
+                await run_in_threadpool(
+                    mark_notification_failed, db, notification, repr(e)
+                )
+            else:
+                prepared_notifications.append(notification)
+                push_keys[notification["id"]] = notification["id"]
+
+                if emails_sent:
+                    emailed_notification_ids.append(notification["id"])
+
+        if digest_notifications:
+            try:
+                emailed_digest_notification_ids = await send_owner_digest(
+                    context, digest_notifications, push_batch
+                )
+            except Exception as e:
+                app_logger.exception(
+                    "Failed to send owner digest of "
+                    f"{len(digest_notifications)} notifications"
+                )
+                for notification in digest_notifications:
+                    await run_in_threadpool(
+                        mark_notification_failed, db, notification, repr(e)
+                    )
+            else:
+                prepared_notifications.extend(digest_notifications)
+                emailed_notification_ids.extend(emailed_digest_notification_ids)
+                push_keys.update(
+                    (notification["id"], OWNER_DIGEST_KEY)
+                    for notification in digest_notifications
+                )
+
+        # Recorded before pushing, so a failed push doesn't resend the emails
+        if emailed_notification_ids:
+            await run_in_threadpool(mark_emails_sent, db, emailed_notification_ids)
+
+        failed_push_keys = await push_batch.flush(db)
+
+        sent_notification_ids = []
+
+        for notification in prepared_notifications:
+            if push_keys[notification["id"]] in failed_push_keys:
+                await run_in_threadpool(
+                    mark_notification_failed,
+                    db,
+                    notification,
+                    "Failed to send push messages",
+                )
+            else:
+                sent_notification_ids.append(notification["id"])
+
+        if sent_notification_ids:
+            await run_in_threadpool(mark_notifications_sent, db, sent_notification_ids)
+    finally:
+        db.close()
+
+    return len(notifications)
+
+
+async def run_outbox_worker(get_db_func: callable) -> None:
+    app_logger.info("Notification outbox worker started")
+
+    while True:
+        try:
+            drained = await drain_outbox(get_db_func)
+        except Exception:
+            app_logger.exception("Draining notification outbox failed")
+            drained = 0
+
+        # A full batch means there is probably more work waiting
+        if drained < settings.OUTBOX_BATCH_SIZE:
+            await asyncio.sleep(settings.OUTBOX_POLL_INTERVAL_SECONDS)
+
+
+outbox_worker_task: asyncio.Task | None = None
+
+
+def is_outbox_worker_running() -> bool:
+    return outbox_worker_task is not None and not outbox_worker_task.done()
+
+
+def start_outbox_worker(get_db_func: callable) -> None:
+    global outbox_worker_task
+
+    if outbox_worker_task is None or outbox_worker_task.done():
+        outbox_worker_task = asyncio.create_task(run_outbox_worker(get_db_func))
+
+
+async def stop_outbox_worker() -> None:
+    global outbox_worker_task
+
+    if outbox_worker_task is None:
+        return
+
+    outbox_worker_task.cancel()
+
+    with contextlib.suppress(asyncio.CancelledError):
+        await outbox_worker_task
+
+    outbox_worker_task = None
@@ -0,0 +1,213 @@
+import abc
+import asyncio
+import os
+
+import httpx
+from pydantic import BaseModel
+
+from .config import settings
+from .loggers import app_logger
+
+FCM_SEND_URL = "https://fcm.googleapis.com/v1/projects/{project_id}/messages:send"
+FCM_SCOPE = "https://www.googleapis.com/auth/firebase.messaging"
+FCM_MAX_CONCURRENT_REQUESTS = 100
+FCM_REQUEST_TIMEOUT_SECONDS = 10
+
+# Error codes meaning the token will never work again
+INVALID_TOKEN_ERROR_CODES = {"UNREGISTERED", "SENDER_ID_MISMATCH"}
+
+
+class PushMessage(BaseModel):
+    token: str
+    title: str
+    body: str
+    data: dict[str, str] | None = None
+
+
+class PushResult(BaseModel):
+    success: bool
+    invalid_token: bool = False
+    error: str | None = None
+
+
+class PushTransport:
+    @abc.abstractmethod
+    async def send_each(self, messages: list[PushMessage]) -> list[PushResult]:
+        """Sends every message separately
+
+        Returns results in the order of the messages
+        """
+
+    async def aclose(self) -> None:
+        pass
+
+
+def create_fcm_message(message: PushMessage) -> dict:
+    fcm_message = {
+        "token": message.token,
+        "notification": {"title": message.title, "body": message.body},
+        "android": {
+            "priority": "high",
+            "notification": {"notification_priority": "PRIORITY_MAX"},
+        },
+        "apns": {
+            "headers": {"apns-priority": "10", "interruption-level": "time-sensitive"}
+        },
+    }
+
+    if message.data:
+        fcm_message["data"] = message.data
+
+    return fcm_message
+
+
+def get_fcm_error_code(response: httpx.Response) -> str | None:
+    try:
+        error = response.json()["error"]
+    except (ValueError, KeyError, TypeError):
+        return None
+
+    for detail in error.get("details", []):
+        if "errorCode" in detail:
+            return detail["errorCode"]
+
+    return error.get("status")
+
+
+class HttpxPushTransport(PushTransport):
+    """Sends messages to the FCM v1 API concurrently
+
+    A single HTTP/2 connection pool is reused for all the messages and
+    the OAuth access token is cached until it expires
+    """
+
+    def __init__(
+        self,
+        credentials_path: str,
+        max_concurrent_requests: int = FCM_MAX_CONCURRENT_REQUESTS,
+    ):
+        self.credentials_path = credentials_path
+        self.max_concurrent_requests = max_concurrent_requests
+        self.credentials = None
+        self.client: httpx.AsyncClient | None = None
+        self.semaphore = asyncio.Semaphore(max_concurrent_requests)
+        self.credentials_lock = asyncio.Lock()
+
+    def get_client(self) -> httpx.AsyncClient:
+        if self.client is None:
+            self.client = httpx.AsyncClient(
+                http2=True,
+                timeout=FCM_REQUEST_TIMEOUT_SECONDS,
+                limits=httpx.Limits(
+                    max_connections=self.max_concurrent_requests,
+                    max_keepalive_connections=self.max_concurrent_requests,
+                ),
+            )
+
+        return self.client
+
+    def load_credentials(self):
+        from google.oauth2 import service_account
+
+        return service_account.Credentials.from_service_account_file(
+            self.credentials_path, scopes=[FCM_SCOPE]
+        )
+
+    async def get_access_token(self) -> str:
+        async with self.credentials_lock:
+            if self.credentials is None:
+                self.credentials = await asyncio.to_thread(self.load_credentials)
+
+            if not self.credentials.valid:
+                from google.auth.transport.requests import Request
+
+                await asyncio.to_thread(self.credentials.refresh, Request())
+
+            return self.credentials.token
+
+    async def send(self, message: PushMessage) -> PushResult:
+        async with self.semaphore:
+            try:
+                access_token = await self.get_access_token()
+
+                response = await self.get_client().post(
+                    FCM_SEND_URL.format(project_id=self.credentials.project_id),
+                    json={"message": create_fcm_message(message)},
+                    headers={"Authorization": f"Bearer {access_token}"},
+                )
+            except Exception as e:
+                return PushResult(success=False, error=repr(e))
+
+        if response.is_success:
+            return PushResult(success=True)
+
+        error_code = get_fcm_error_code(response)
+
+        return PushResult(
+            success=False,
+            invalid_token=error_code in INVALID_TOKEN_ERROR_CODES,
+            error=f"{response.status_code} {error_code}",
+        )
+
+    async def send_each(self, messages: list[PushMessage]) -> list[PushResult]:
+        return list(await asyncio.gather(*(self.send(message) for message in messages)))
+
+    async def aclose(self) -> None:
+        if self.client is not None:
+            await self.client.aclose()
+            self.client = None
+
+
+class FakePushTransport(PushTransport):
+    """Stand-in for FCM used for tests and local development
+
+    Records every sent message, messages to `invalid_tokens` are rejected
+    the way FCM rejects unregistered tokens. While `unavailable` is set,
+    sending raises the way it does during an FCM outage
+    """
+
+    def __init__(self, invalid_tokens: set[str] | None = None):
+        self.invalid_tokens = invalid_tokens or set()
+        self.unavailable = False
+        self.sent_messages: list[PushMessage] = []
+
+    async def send_each(self, messages: list[PushMessage]) -> list[PushResult]:
+        if self.unavailable:
+            raise ConnectionError("FCM is unavailable")
+
+        results = []
+
+        for message in messages:
+            if message.token in self.invalid_tokens:
+                results.append(
+                    PushResult(success=False, invalid_token=True, error="UNREGISTERED")
+                )
+            else:
+                self.sent_messages.append(message)
+                results.append(PushResult(success=True))
+
+        return results
+
+
+push_transport: PushTransport = HttpxPushTransport(
+    os.path.join(
+        os.path.dirname(__file__), settings.FIREBASE_SERVICE_ACCOUNT_CREDENTIALS_PATH
+    )
+)
+
+
+def get_push_transport() -> PushTransport:
+    return push_transport
+
+
+def set_push_transport(transport: PushTransport) -> None:
+    global push_transport
+
+    push_transport = transport
+
+
+async def close_push_transport() -> None:
+    try:
+        await push_transport.aclose()
+    except Exception:
+        app_logger.exception("Failed to close push transport")
@@ -0,0 +1,301 @@
+import abc
+import json
+import math
+import time
+from collections import OrderedDict
+from urllib.parse import parse_qs
+
+from pydantic import BaseModel
+from starlette.responses import JSONResponse
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+from .config import settings
+from .loggers import app_logger
+
+MAX_IN_MEMORY_BUCKETS = 100_000
+MAX_INSPECTED_BODY_BYTES = 64 * 1024
+
+
+class TokenBucketLimit(BaseModel):
+    capacity: int
+    refill_period_seconds: float
+
+    @property
+    def refill_rate(self) -> float:
+        return self.capacity / self.refill_period_seconds
+
+
+class RateLimitRule(BaseModel):
+    path: str
+    per_ip: TokenBucketLimit
+    per_account: TokenBucketLimit | None = None
+    # Name of the form/JSON body field identifying the account
+    account_field: str | None = None
+
+
+class RateLimiterBackend:
+    @abc.abstractmethod
+    async def consume(self, key: str, limit: TokenBucketLimit) -> float:
+        """Takes a single token from the bucket stored under `key`.
+
+        Returns 0 if the request is allowed,
+        otherwise the number of seconds after which it can be retried.
+        """
+
+
+class InMemoryRateLimiterBackend(RateLimiterBackend):
+    def __init__(self, max_buckets: int = MAX_IN_MEMORY_BUCKETS):
+        self.max_buckets = max_buckets
+        self.buckets: OrderedDict[str, tuple[float, float, TokenBucketLimit]] = (
+            OrderedDict()
+        )
+
+    async def consume(self, key: str, limit: TokenBucketLimit) -> float:
+        now = time.monotonic()
+
+        tokens, updated_at, _ = self.buckets.pop(key, (limit.capacity, now, limit))
+        tokens = min(limit.capacity, tokens + (now - updated_at) * limit.refill_rate)
+
+        retry_after = 0.0
+        if tokens >= 1:
+            tokens -= 1
+        else:
+            retry_after = (1 - tokens) / limit.refill_rate
+
+        self.buckets[key] = (tokens, now, limit)
+
+        if len(self.buckets) > self.max_buckets:
+            self._prune(now)
+
+        return retry_after
+
+    def _prune(self, now: float) -> None:
+        # A bucket that has fully refilled behaves exactly like a missing one
+        for key, (tokens, updated_at, limit) in list(self.buckets.items()):
+            if tokens + (now - updated_at) * limit.refill_rate >= limit.capacity:
+                del self.buckets[key]
+
+        while len(self.buckets) > self.max_buckets:
+            self.buckets.popitem(last=False)
+
+
+class RedisRateLimiterBackend(RateLimiterBackend):
+    CONSUME_SCRIPT = """
+    local capacity = tonumber(ARGV[1])
+    local refill_rate = tonumber(ARGV[2])
+    local now = tonumber(ARGV[3])
+
+    local state = redis.call('HMGET', KEYS[1], 'tokens', 'updated_at')
+    local tokens = tonumber(state[1]) or capacity
+    local updated_at = tonumber(state[2]) or now
+
+    tokens = math.min(capacity, tokens + math.max(0, now - updated_at) * refill_rate)
+
+    local retry_after = 0
+    if tokens >= 1 then
+        tokens = tokens - 1
+    else
+        retry_after = (1 - tokens) / refill_rate
+    end
+
+    redis.call('HSET', KEYS[1], 'tokens', tostring(tokens), 'updated_at', tostring(now))
+    redis.call('EXPIRE', KEYS[1], math.ceil(capacity / refill_rate))
+
+    return tostring(retry_after)
+    """
+
+    def __init__(self, redis_client):
+        self.redis_client = redis_client
+        self.consume_script = redis_client.register_script(self.CONSUME_SCRIPT)
+
+    async def consume(self, key: str, limit: TokenBucketLimit) -> float:
+        retry_after = await self.consume_script(
+            keys=[f"rate-limit:{key}"],
+            args=[limit.capacity, limit.refill_rate, time.time()],
+        )
+        return float(retry_after)
+
+
+def create_rate_limiter_backend() -> RateLimiterBackend:
+    if settings.RATE_LIMIT_REDIS_URL:
+        from redis import asyncio as redis_asyncio
+
+        redis_client = redis_asyncio.from_url(settings.RATE_LIMIT_REDIS_URL)
+        return RedisRateLimiterBackend(redis_client)
+
+    return InMemoryRateLimiterBackend()
+
+
+rate_limiter_backend: RateLimiterBackend = create_rate_limiter_backend()
+
+
+def get_rate_limiter_backend() -> RateLimiterBackend:
+    return rate_limiter_backend
+
+
+def set_rate_limiter_backend(backend: RateLimiterBackend) -> None:
+    global rate_limiter_backend
+
+    rate_limiter_backend = backend
+
+
+RATE_LIMIT_RULES = [
+    RateLimitRule(
+        path=settings.BASE_URL + "/auth/login",
+        per_ip=TokenBucketLimit(capacity=20, refill_period_seconds=60),
+        per_account=TokenBucketLimit(capacity=5, refill_period_seconds=60),
+        account_field="username",
+    ),
+    RateLimitRule(
+        path=settings.BASE_URL + "/auth/request-password-reset",
+        per_ip=TokenBucketLimit(capacity=5, refill_period_seconds=60),
+        per_account=TokenBucketLimit(
+            capacity=1,
+            refill_period_seconds=settings.PASSWORD_RESET_COOLDOWN_MINUTES * 60,
+        ),
+        account_field="email",
+    ),
+    RateLimitRule(
+        path=settings.BASE_URL + "/users/request-email-verification",
+        per_ip=TokenBucketLimit(capacity=5, refill_period_seconds=60),
+        per_account=TokenBucketLimit(
+            capacity=1,
+            refill_period_seconds=settings.MAIL_VERIFICATION_COOLDOWN_MINUTES * 60,
+        ),
+        account_field="email",
+    ),
+    RateLimitRule(
+        path=settings.BASE_URL + "/users/register",
+        per_ip=TokenBucketLimit(capacity=5, refill_period_seconds=600),
+    ),
+]
+
+
+def get_account_from_body(
+    body: bytes, content_type: str, account_field: str
+) -> str | None:
+    try:
+        if content_type.startswith("application/x-www-form-urlencoded"):
+            values = parse_qs(body.decode("utf-8")).get(account_field)
+            account = values[0] if values else None
+        elif content_type.startswith("application/json"):
+            account = json.loads(body).get(account_field)
+        else:
+            return None
+    except (UnicodeDecodeError, ValueError, AttributeError):
+        return None
+
+    if not isinstance(account, str):
+        return None
+
+    return account.strip().lower() or None
+
+
+class RateLimitMiddleware:
+    """Rejects abusive traffic on auth and email endpoints using token buckets
+
+    Requests are limited per client IP address and,
+    where the endpoint identifies an account in its body, per account.
+    Rejected requests never reach the router, so they cost neither
+    a database query nor a password hash comparison.
+    Without a `backend`, the process-wide one is looked up on every request,
+    so it can be replaced while the app is running.
+    """
+
+    def __init__(
+        self,
+        app: ASGIApp,
+        *,
+        backend: RateLimiterBackend | None = None,
+        rules: list[RateLimitRule],
+    ):
+        self.app = app
+        self.backend = backend
+        self.rules = {rule.path: rule for rule in rules}
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http" or scope["method"] != "POST":
+            await self.app(scope, receive, send)
+            return
+
+        rule = self.rules.get(scope["path"])
+
+        if not rule:
+            await self.app(scope, receive, send)
+            return
+
+        backend = self.backend or get_rate_limiter_backend()
+        client_ip = scope["client"][0] if scope.get("client") else "unknown"
+
+        retry_after = await backend.consume(f"ip:{rule.path}:{client_ip}", rule.per_ip)
+
+        if not retry_after and rule.per_account:
+            body, more_body = await self._read_body(receive, MAX_INSPECTED_BODY_BYTES)
+            receive = self._replay_body(body, more_body, receive)
+
+            account = None
+            # Oversized bodies are passed on without being inspected
+            if not more_body:
+                headers = dict(scope["headers"])
+                content_type = headers.get(b"content-type", b"").decode("latin-1")
+                account = get_account_from_body(body, content_type, rule.account_field)
+
+            if account:
+                retry_after = await backend.consume(
+                    f"account:{rule.path}:{account}", rule.per_account
+                )
+
+        if retry_after:
+            app_logger.info(
+                f"Rate limit exceeded for {scope['path']} from {client_ip}, "
+                f"retry after {retry_after:.1f}s"
+            )
+            response = JSONResponse(
+                {"detail": "Too many requests, try again later"},
+                status_code=429,
+                headers={"Retry-After": str(math.ceil(retry_after))},
+            )
+            await response(scope, receive, send)
+            return
+
+        await self.app(scope, receive, send)
+
+    @staticmethod
+    async def _read_body(receive: Receive, max_bytes: int) -> tuple[bytes, bool]:
+        """Reads the request body, stopping once it's longer than `max_bytes`
+
+        Returns the read part of the body and whether there's more of it
+        """
+        chunks = []
+        read_bytes = 0
+        more_body = True
+
+        while more_body and read_bytes <= max_bytes:
+            message = await receive()
+
+            if message["type"] != "http.request":
+                break
+
+            chunk = message.get("body", b"")
+            chunks.append(chunk)
+            read_bytes += len(chunk)
+            more_body = message.get("more_body", False)
+
+        return b"".join(chunks), more_body
+
+    @staticmethod
+    def _replay_body(
+        body: bytes, more_body: bool, original_receive: Receive
+    ) -> Receive:
+        body_sent = False
+
+        async def receive() -> Message:
+            nonlocal body_sent
+
+            if not body_sent:
+                body_sent = True
+                return {"type": "http.request", "body": body, "more_body": more_body}
+
+            return await original_receive()
+
+        return receive
@@ -0,0 +1,225 @@
+import math
+import select
+import threading
+import time
+import uuid
+from datetime import datetime, timedelta, timezone
+
+from sqlalchemy import Engine
+
+from .config import settings
+from .jobs import (
+    REMINDER_MINUTES,
+    REMINDERS_CHANNEL,
+    PendingReminder,
+    get_pending_reminders,
+    send_appointment_reminders,
+)
+from .loggers import app_logger
+from .timing_wheel import TimingWheel
+
+REMINDER_WHEEL_TICK_SECONDS = 1
+# Seconds, minutes and hours, a day in total
+REMINDER_WHEEL_SIZES = (60, 60, 24)
+# Longest horizon the wheel can hold, with a few ticks to spare as it's
+# advanced only once per tick
+REMINDER_WHEEL_MAX_HORIZON_SECONDS = (
+    math.prod(REMINDER_WHEEL_SIZES) - 5
+) * REMINDER_WHEEL_TICK_SECONDS
+
+
+class ReminderScheduler:
+    """Sends appointment reminders on time using an in-memory timing wheel
+
+    The database stays the source of truth. Reminders due within
+    REMINDER_WHEEL_HORIZON_HOURS are loaded into the wheel periodically and
+    reloaded whenever an appointment notifies about a change, firing
+    reminders are marked as sent in the database before they're enqueued.
+    The horizon is capped at what the wheel can hold
+    """
+
+    def __init__(self, get_db_func: callable, engine: Engine):
+        self.get_db_func = get_db_func
+        self.engine = engine
+        self.horizon_seconds = settings.REMINDER_WHEEL_HORIZON_HOURS * 3600
+
+        if self.horizon_seconds > REMINDER_WHEEL_MAX_HORIZON_SECONDS:
+            app_logger.warning(
+                f"REMINDER_WHEEL_HORIZON_HOURS={settings.REMINDER_WHEEL_HORIZON_HOURS} "
+                "exceeds the reminder wheel, reminders are loaded "
+                f"{REMINDER_WHEEL_MAX_HORIZON_SECONDS}s ahead instead"
+            )
+            self.horizon_seconds = REMINDER_WHEEL_MAX_HORIZON_SECONDS
+
+        self.wheel: TimingWheel | None = None
+        self.listen_connection = None
+        self.next_top_up_at = 0.0
+        self.stop_event = threading.Event()
+        self.thread: threading.Thread | None = None
+
+    def start(self) -> None:
+        if self.thread is not None and self.thread.is_alive():
+            return
+
+        self.stop_event.clear()
+        self.thread = threading.Thread(
+            target=self.run, name="reminder-scheduler", daemon=True
+        )
+        self.thread.start()
+
+    def stop(self) -> None:
+        self.stop_event.set()
+
+        if self.thread is not None:
+            self.thread.join(timeout=REMINDER_WHEEL_TICK_SECONDS * 5)
+            self.thread = None
+
+    def run(self) -> None:
+        self.wheel = TimingWheel(
+            REMINDER_WHEEL_TICK_SECONDS, REMINDER_WHEEL_SIZES, time.time()
+        )
+
+        while not self.stop_event.is_set():
+            try:
+                if self.listen_connection is None:
+                    self.listen()
+                    self.catch_up()
+                    # Changes made while not listening are picked up by a top up
+                    self.next_top_up_at = 0
+
+                if time.monotonic() >= self.next_top_up_at:
+                    self.top_up()
+
+                self.wait_for_changes(REMINDER_WHEEL_TICK_SECONDS)
+                self.send_due_reminders()
+            except Exception:
+                app_logger.exception("Reminder scheduler failed")
+                self.close_listen_connection()
+                self.stop_event.wait(settings.SCHEDULER_LEADER_POLL_INTERVAL_SECONDS)
+
+        self.close_listen_connection()
+
+    def listen(self) -> None:
+        connection = self.engine.raw_connection()
+        # LISTEN needs its own connection for as long as the scheduler runs
+        connection.detach()
+
+        driver_connection = connection.driver_connection
+        driver_connection.autocommit = True
+
+        with driver_connection.cursor() as cursor:
+            cursor.execute(f"LISTEN {REMINDERS_CHANNEL}")
+
+        self.listen_connection = driver_connection
+
+    def close_listen_connection(self) -> None:
+        if self.listen_connection is not None:
+            try:
+                self.listen_connection.close()
+            except Exception:
+                pass
+
+            self.listen_connection = None
+
+    def get_horizon(self) -> datetime:
+        return datetime.now(timezone.utc) + timedelta(seconds=self.horizon_seconds)
+
+    def schedule(self, reminders: list[PendingReminder]) -> None:
+        for reminder in reminders:
+            scheduled = self.wheel.add(
+                (reminder["appointment_id"], reminder["minutes_to_appointment"]),
+                reminder["due_at"].timestamp(),
+                reminder,
+            )
+
+            # Loaded again by a later top up, once it's within the wheel's horizon
+            if not scheduled:
+                app_logger.warning(
+                    f"Reminder of appointment {reminder['appointment_id']} due at "
+                    f"{reminder['due_at']} is beyond the reminder wheel's horizon"
+                )
+
+    def catch_up(self) -> None:
+        """Sends reminders missed while no scheduler was running in a single batch
+
+        Only reminders of appointments which haven't started yet are sent
+        """
+        db = next(self.get_db_func())
+
+        try:
+            reminders = get_pending_reminders(db, datetime.now(timezone.utc))
+
+            if not reminders:
+                return
+
+            enqueued = send_appointment_reminders(db, reminders)
+        finally:
+            db.close()
+
+        app_logger.info(
+            f"Caught up on {len(reminders)} missed reminders, {enqueued} enqueued"
+        )
+
+    def top_up(self) -> None:
+        db = next(self.get_db_func())
+
+        try:
+            reminders = get_pending_reminders(db, self.get_horizon())
+        finally:
+            db.close()
+
+        self.schedule(reminders)
+        self.next_top_up_at = (
+            time.monotonic() + settings.REMINDER_WHEEL_TOP_UP_MINUTES * 60
+        )
+
+        app_logger.debug(
+            f"Loaded {len(reminders)} reminders, {len(self.wheel)} scheduled"
+        )
+
+    def wait_for_changes(self, timeout: float) -> None:
+        if not select.select([self.listen_connection], [], [], timeout)[0]:
+            return
+
+        self.listen_connection.poll()
+
+        appointment_ids = set()
+
+        while self.listen_connection.notifies:
+            notification = self.listen_connection.notifies.pop(0)
+            appointment_ids.add(uuid.UUID(notification.payload))
+
+        if appointment_ids:
+            self.reload(appointment_ids)
+
+    def reload(self, appointment_ids: set[uuid.UUID]) -> None:
+        for appointment_id in appointment_ids:
+            for minutes_to_appointment in REMINDER_MINUTES:
+                self.wheel.cancel((appointment_id, minutes_to_appointment))
+
+        db = next(self.get_db_func())
+
+        try:
+            reminders = get_pending_reminders(
+                db, self.get_horizon(), appointment_ids=appointment_ids
+            )
+        finally:
+            db.close()
+
+        self.schedule(reminders)
+
+    def send_due_reminders(self) -> None:
+        reminders = self.wheel.advance(time.time())
+
+        if not reminders:
+            return
+
+        db = next(self.get_db_func())
+
+        # If sending fails, the reminders are loaded again once the scheduler recovers
+        try:
+            enqueued = send_appointment_reminders(db, reminders)
+        finally:
+            db.close()
+
+        app_logger.info(f"Enqueued {enqueued} appointment reminders")
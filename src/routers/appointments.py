@@ -1,25 +1,18 @@
 import datetime
-import logging
 from datetime import timedelta
 
-import apscheduler.jobstores.base
-from fastapi import APIRouter, BackgroundTasks, Depends, HTTPException, Header, status
+from fastapi import APIRouter, Depends, HTTPException, Header, status
 from pydantic import UUID4
-from sqlalchemy import and_, or_
-from sqlalchemy.orm import Session
+from sqlalchemy import and_, func, or_
+from sqlalchemy.orm import Session, aliased, contains_eager, joinedload
 from sqlalchemy.sql import extract
 
 from .. import models, oauth2
 from ..config import settings
 from ..database import get_db
 from ..exceptions import ResourceNotFoundHTTPException
-from ..jobs import (
-    send_appointment_canceled_notification,
-    send_appointment_updated_notification,
-    send_new_appointment_notification,
-    send_upcoming_appointment_notification,
-)
-from ..scheduler import scheduler
+from ..jobs import notify_reminders_changed, skip_passed_reminders
+from ..outbox import enqueue_notification
 from ..schemas.appointment import (
     AppointmentSlot,
     CreateAppointment,
@@ -30,10 +23,16 @@ from ..schemas.appointment import (
     ReturnAppointmentDetailed,
     UnreserveSlots,
 )
+from ..schemas.notification_outbox import (
+    AppointmentCanceledPayload,
+    AppointmentUpdatedPayload,
+    NewAppointmentPayload,
+    NotificationKind,
+)
+from ..translation_catalog import get_translation_catalog
 from ..utils import (
     COMPANY_TIMEZONE,
     get_language_code_from_header,
-    get_language_id_from_language_code,
     get_user_language_id,
     is_archival,
 )
@@ -76,19 +75,16 @@ def get_appointment_slots(
     ).all()
 
     language_code = get_language_code_from_header(accept_language)
-    user_language_id = get_language_id_from_language_code(db, language_code)
+
+    translation_catalog = get_translation_catalog(db)
+    user_language_id = translation_catalog.get_language_id(language_code)
 
     for slot in slots:
         if slot.holiday:
-            holiday_name = (
-                db.query(models.HolidayTranslations.name)
-                .where(models.HolidayTranslations.holiday_id == slot.holiday_info.id)
-                .where(models.HolidayTranslations.language_id == user_language_id)
-                .first()[0]
+            slot.holiday_name = translation_catalog.get_holiday_name(
+                slot.holiday_id, user_language_id
             )
 
-            slot.holiday_name = holiday_name
-
     return slots
 
 
@@ -165,18 +161,10 @@ def get_your_appointments(
     )
 
     language_id = get_user_language_id(db, user.id)
+    translation_catalog = get_translation_catalog(db)
 
     for appointment_db in appointments_db:
-        service_translation = (
-            db.query(
-                models.ServiceTranslations.name, models.ServiceTranslations.description
-            )
-            .where(models.ServiceTranslations.language_id == language_id)
-            .where(models.ServiceTranslations.service_id == appointment_db.service.id)
-            .first()
-        )
-        appointment_db.service.name = service_translation[0]
-        appointment_db.service.description = service_translation[1]
+        translation_catalog.translate_service(appointment_db.service, language_id)
 
         appointment_db.archival = is_archival(appointment_db)
 
@@ -196,16 +184,7 @@ def get_your_appointment(
 
     language_id = get_user_language_id(db, verified_user.id)
 
-    service_translation = (
-        db.query(
-            models.ServiceTranslations.name, models.ServiceTranslations.description
-        )
-        .where(models.ServiceTranslations.language_id == language_id)
-        .where(models.ServiceTranslations.service_id == appointment_db.service.id)
-        .first()
-    )
-    appointment_db.service.name = service_translation[0]
-    appointment_db.service.description = service_translation[1]
+    get_translation_catalog(db).translate_service(appointment_db.service, language_id)
 
     appointment_db.archival = is_archival(appointment_db)
 
@@ -215,7 +194,6 @@ def get_your_appointment(
 @router.post("", status_code=status.HTTP_201_CREATED)
 def create_appointment(
     appointment: CreateAppointment,
-    background_tasks: BackgroundTasks,
     db: Session = Depends(get_db),
     verified_user_session=Depends(oauth2.get_verified_user),
 ):
@@ -305,47 +283,20 @@ def create_appointment(
         slot.occupied = True
         slot.occupied_by_appointment = new_appointment.id
 
-    if now < appointment_start_time - timedelta(hours=2):
-        scheduler.add_job(
-            func=send_upcoming_appointment_notification,
-            trigger="date",
-            id=f"appointment_reminder_t_minus_120_min_appointment#{new_appointment.id}",
-            name=f"Appointment Reminder T-120min - Appointment #{new_appointment.id}",
-            misfire_grace_time=20,
-            next_run_time=appointment_start_time - timedelta(hours=2),
-            args=[get_db],
-            kwargs={
-                "user_id": verified_user.id,
-                "appointment_id": new_appointment.id,
-                "minutes_to_appointment": 120,
-            },
-        )  # todo: fix possible error
-
-    if now < appointment_start_time - timedelta(minutes=30):
-        scheduler.add_job(
-            func=send_upcoming_appointment_notification,
-            trigger="date",
-            id=f"appointment_reminder_t_minus_30_min_appointment#{new_appointment.id}",
-            name=f"Appointment Reminder T-30min - Appointment #{new_appointment.id}",
-            misfire_grace_time=20,
-            next_run_time=appointment_start_time - timedelta(minutes=30),
-            args=[get_db],
-            kwargs={
-                "user_id": verified_user.id,
-                "appointment_id": new_appointment.id,
-                "minutes_to_appointment": 30,
-            },
-        )  # todo: fix possible error
+    skip_passed_reminders(new_appointment, appointment_start_time)
+    notify_reminders_changed(db, new_appointment.id)
 
     new_appointment.archival = False
 
-    background_tasks.add_task(
-        send_new_appointment_notification,
+    enqueue_notification(
         db,
-        user_name=verified_user.name,
-        user_surname=verified_user.surname,
-        service_id=service_db.id,
-        appointment_date=first_slot_db.start_time,
+        NotificationKind.new_appointment,
+        NewAppointmentPayload(
+            user_name=verified_user.name,
+            user_surname=verified_user.surname,
+            service_id=service_db.id,
+            appointment_date=first_slot_db.start_time,
+        ),
     )
 
     db.commit()
@@ -365,48 +316,50 @@ def get_all_appointments(
 ):
     admin = admin_session.admin
 
-    appointments_db = db.query(models.Appointment)
+    end_slot = aliased(models.AppointmentSlot)
+    archival = end_slot.end_time < func.now()
+
+    appointments_db = db.query(models.Appointment).join(
+        end_slot, models.Appointment.end_slot.of_type(end_slot)
+    )
 
     if not include_archival:
-        appointments_db = appointments_db.join(
-            models.AppointmentSlot,
-            and_(models.Appointment.end_slot_id == models.AppointmentSlot.id),
-        ).filter(
-            models.AppointmentSlot.end_time > datetime.datetime.now(COMPANY_TIMEZONE)
-        )
+        appointments_db = appointments_db.where(~archival)
 
     if user_id:
         appointments_db = appointments_db.where(models.Appointment.user_id == user_id)
 
+    appointments_num = appointments_db.with_entities(func.count()).scalar()
+
+    appointments_db = (
+        appointments_db.add_columns(archival.label("archival"))
+        .options(
+            contains_eager(models.Appointment.end_slot.of_type(end_slot)),
+            joinedload(models.Appointment.start_slot),
+            joinedload(models.Appointment.service),
+            joinedload(models.Appointment.user),
+        )
+        .order_by(models.Appointment.created_at.desc(), models.Appointment.id)
+    )
+
     if offset:
         appointments_db = appointments_db.offset(offset)
 
     if limit:
         appointments_db = appointments_db.limit(limit)
 
-    appointments_db = appointments_db.order_by(models.Appointment.created_at.desc())
-
-    appointments_db = appointments_db.all()
-
-    appointments_num = db.query(models.Appointment).count()
-
     language_id = get_user_language_id(db, admin.id)
+    translation_catalog = get_translation_catalog(db)
 
-    for appointment_db in appointments_db:
-        service_translation = (
-            db.query(
-                models.ServiceTranslations.name, models.ServiceTranslations.description
-            )
-            .where(models.ServiceTranslations.language_id == language_id)
-            .where(models.ServiceTranslations.service_id == appointment_db.service.id)
-            .first()
-        )
-        appointment_db.service.name = service_translation[0]
-        appointment_db.service.description = service_translation[1]
+    appointments = []
 
-        appointment_db.archival = is_archival(appointment_db)
+    for appointment_db, appointment_archival in appointments_db:
+        translation_catalog.translate_service(appointment_db.service, language_id)
+
+        appointment_db.archival = appointment_archival
+        appointments.append(appointment_db)
 
-    return {"items": appointments_db, "total": appointments_num}
+    return {"items": appointments, "total": appointments_num}
 
 
 @router.get("/any/{appointment_id}", response_model=ReturnAppointmentDetailed)
@@ -427,16 +380,7 @@ def get_any_appointment(
     admin = admin_session.admin
     language_id = get_user_language_id(db, admin.id)
 
-    service_translation = (
-        db.query(
-            models.ServiceTranslations.name, models.ServiceTranslations.description
-        )
-        .where(models.ServiceTranslations.language_id == language_id)
-        .where(models.ServiceTranslations.service_id == appointment_db.service.id)
-        .first()
-    )
-    appointment_db.service.name = service_translation[0]
-    appointment_db.service.description = service_translation[1]
+    get_translation_catalog(db).translate_service(appointment_db.service, language_id)
 
     appointment_db.archival = is_archival(appointment_db)
 
@@ -448,7 +392,6 @@ def get_any_appointment(
 def update_any_appointment(
     new_start_slot: FirstSlot,
     appointment_id: UUID4,
-    background_tasks: BackgroundTasks,
     db: Session = Depends(get_db),
     admin_session=Depends(oauth2.get_admin),  # TODO: events
 ):
@@ -534,67 +477,29 @@ def update_any_appointment(
         slot.occupied = True
         slot.occupied_by_appointment = appointment_db.id
 
-    db.commit()
-
-    for job_name in [
-        f"appointment_reminder_t_minus_120_min_appointment#{appointment_db.id}",
-        f"appointment_reminder_t_minus_30_min_appointment#{appointment_db.id}",
-    ]:
-        try:
-            scheduler.remove_job(job_name)
-        except apscheduler.jobstores.base.JobLookupError:
-            logging.info(
-                f"Failed to remove job: {job_name}"
-                f"Appointment reminder for appointment {appointment_db.id}"
-            )
+    skip_passed_reminders(appointment_db, appointment_start_time)
+    notify_reminders_changed(db, appointment_db.id)
 
-    scheduler.add_job(
-        func=send_upcoming_appointment_notification,
-        trigger="date",
-        id=f"appointment_reminder_t_minus_120_min_appointment#{appointment_db.id}",
-        name=f"Appointment Reminder T-120min - Appointment #{appointment_db.id}",
-        misfire_grace_time=20,
-        next_run_time=appointment_start_time - timedelta(hours=2),
-        args=[get_db],
-        kwargs={
-            "user_id": appointment_db.id,
-            "appointment_id": appointment_db.id,
-            "minutes_to_appointment": 120,
-        },
+    enqueue_notification(
+        db,
+        NotificationKind.appointment_updated,
+        AppointmentUpdatedPayload(
+            user_id=appointment_db.user_id,
+            service_id=appointment_db.service_id,
+            new_appointment_date=appointment_start_time,
+        ),
     )
 
-    scheduler.add_job(
-        func=send_upcoming_appointment_notification,
-        trigger="date",
-        id=f"appointment_reminder_t_minus_30_min_appointment#{appointment_db.id}",
-        name=f"Appointment Reminder T-30min - Appointment #{appointment_db.id}",
-        misfire_grace_time=20,
-        next_run_time=appointment_start_time - timedelta(minutes=30),
-        args=[get_db],
-        kwargs={
-            "user_id": appointment_db.id,
-            "appointment_id": appointment_db.id,
-            "minutes_to_appointment": 30,
-        },
-    )
+    db.commit()
 
     appointment_db.archival = False
 
-    background_tasks.add_task(
-        send_appointment_updated_notification,
-        db,
-        user_id=appointment_db.user.id,
-        service_id=appointment_db.service.id,
-        new_appointment_date=appointment_db.start_slot.start_time,
-    )
-
     return appointment_db
 
 
 @router.post("/any/{appointment_id}")
 def cancel_appointment(
     appointment_id: UUID4,
-    background_tasks: BackgroundTasks,
     db: Session = Depends(get_db),
     admin_session=Depends(oauth2.get_admin),  # TODO: events
 ):
@@ -625,30 +530,22 @@ def cancel_appointment(
 
     appointment_db.canceled = True
 
-    db.commit()
-
-    for job_name in [
-        f"appointment_reminder_t_minus_120_min_appointment#{appointment_db.id}",
-        f"appointment_reminder_t_minus_30_min_appointment#{appointment_db.id}",
-    ]:
-        try:
-            scheduler.remove_job(job_name)
-        except apscheduler.jobstores.base.JobLookupError:
-            logging.info(
-                f"Failed to remove job: {job_name}"
-                f"Appointment reminder for appointment {appointment_db.id}"
-            )
+    notify_reminders_changed(db, appointment_db.id)
 
-    appointment_db.archival = False
-
-    background_tasks.add_task(
-        send_appointment_canceled_notification,
+    enqueue_notification(
         db,
-        user_id=appointment_db.user.id,
-        service_id=appointment_db.service.id,
-        appointment_date=appointment_db.start_slot.start_time,
+        NotificationKind.appointment_canceled,
+        AppointmentCanceledPayload(
+            user_id=appointment_db.user_id,
+            service_id=appointment_db.service_id,
+            appointment_date=appointment_db.start_slot.start_time,
+        ),
     )
 
+    db.commit()
+
+    appointment_db.archival = False
+
     return appointment_db
 
 
@@ -18,7 +18,7 @@ from sqlalchemy.orm import Session
 
 from .. import models, oauth2, utils
 from ..config import settings
-from ..database import get_db
+from ..database import get_db, get_db_factory
 from ..email_manager import (
     create_email_request,
     create_password_reset_email,
@@ -46,9 +46,13 @@ from ..schemas.session import (
 )
 from ..schemas.user import UserEmailOnly
 from ..schemas.user_settings import AvailableSettings
+from ..session_enrichment import enrich_session, enrich_sessions
+from ..settings_cache import get_user_settings_cache
 from ..utils import (
+    is_session_enriched,
     load_session_data,
     on_decode_error,
+    update_session_last_access,
     verify_password,
 )
 
@@ -58,8 +62,10 @@ router = APIRouter(prefix=settings.BASE_URL + "/auth", tags=["Authorization"])
 @router.post("/login", response_model=ReturnAccessToken)
 def login(
     request: Request,
+    background_tasks: BackgroundTasks,
     user_credentials: OAuth2PasswordRequestFormStrict = Depends(),
     db: Session = Depends(get_db),
+    get_db_func: callable = Depends(get_db_factory),
     user_agent: str | None = Header(None),
 ):
     if user_credentials.grant_type != "password":
@@ -98,10 +104,14 @@ def login(
         last_ip_address=user_ip_address,
     )
 
+    utils.evict_least_recently_used_sessions(db, user.id)
+
     db.add(db_session)
     db.commit()
     db.refresh(db_session)
 
+    background_tasks.add_task(enrich_session, get_db_func, session_id=db_session.id)
+
     user_session = session.ActiveUserSession(
         id=db_session.id,
         first_accessed=db_session.first_accessed,
@@ -125,9 +135,11 @@ def login(
 @router.post("/refresh-token", response_model=ReturnAccessToken, name="Refresh Token")
 def token_refresh(
     request: Request,
+    background_tasks: BackgroundTasks,
     refresh_token: Annotated[str, Form()],
     grant_type: Annotated[str, Form()],
     db: Session = Depends(get_db),
+    get_db_func: callable = Depends(get_db_factory),
     user_agent: str | None = Header(None),
 ):
     if grant_type != "refresh_token":
@@ -159,13 +171,16 @@ def token_refresh(
 
     db_session.access_token = access_token
     db_session.refresh_token = refresh_token
-    db_session.last_accessed = datetime.utcnow()
-    db_session.last_user_agent = user_agent
-    db_session.last_ip_address = request.client.host
+    session_changed = update_session_last_access(
+        db_session, user_agent=user_agent, ip_address=request.client.host
+    )
 
     db.commit()
     db.refresh(db_session)
 
+    if session_changed:
+        background_tasks.add_task(enrich_session, get_db_func, session_id=db_session.id)
+
     user_session = session.ActiveUserSession(
         id=db_session.id,
         first_accessed=db_session.first_accessed,
@@ -294,15 +309,12 @@ def request_password_reset(
 
     app_logger.info(f"Successfully created new password reset request for {user_email}")
 
-    content_language = (
-        db.query(models.Setting)
-        .where(models.Setting.name == AvailableSettings.language)
-        .where(models.Setting.user_id == user_db.id)
-        .first()
+    content_language = get_user_settings_cache().get_value(
+        db, user_db.id, AvailableSettings.language.value
     )
 
     message, template_name = create_password_reset_email(
-        content_language.current_value, user_db, password_reset_request.request_token
+        content_language, user_db, password_reset_request.request_token
     )
 
     background_tasks.add_task(send_email, message, template_name, fast_mail_client)
@@ -401,7 +413,12 @@ def enter_sudo_mode(
 
 
 @router.get("/sessions", response_model=List[ReturnActiveSession])
-def get_sessions(db: Session = Depends(get_db), user_session=Depends(oauth2.get_user)):
+def get_sessions(
+    background_tasks: BackgroundTasks,
+    db: Session = Depends(get_db),
+    get_db_func: callable = Depends(get_db_factory),
+    user_session=Depends(oauth2.get_user),
+):
     user = user_session.user
 
     sessions = (
@@ -411,6 +428,15 @@ def get_sessions(db: Session = Depends(get_db), user_session=Depends(oauth2.get_
         .all()
     )
 
+    unenriched_session_ids = [
+        session_db.id for session_db in sessions if not is_session_enriched(session_db)
+    ]
+
+    if unenriched_session_ids:
+        background_tasks.add_task(
+            enrich_sessions, get_db_func, session_ids=unenriched_session_ids
+        )
+
     sessions_with_data = []
 
     for session_db in sessions:
@@ -1,4 +1,4 @@
-from fastapi import APIRouter, Depends, Header
+from fastapi import APIRouter, Depends, Header, Response, status
 from pydantic import UUID4
 from sqlalchemy.orm import Session
 
@@ -11,32 +11,58 @@ from ..schemas.service import (
     ReturnService,
     ReturnServiceDetailed,
 )
+from ..translation_catalog import SerializedResponse, get_translation_catalog
 from ..utils import get_language_code_from_header, get_user_language_id
 
 router = APIRouter(prefix=settings.BASE_URL + "/services", tags=["Services"])
 
+# Clients revalidate with the ETag once the catalog could have been reloaded
+SERVICES_CACHE_CONTROL = (
+    f"public, max-age={int(settings.TRANSLATION_CATALOG_CHECK_SECONDS)}"
+)
+
+
+def is_etag_matched(etag: str, if_none_match: str | None) -> bool:
+    if not if_none_match:
+        return False
+
+    if if_none_match.strip() == "*":
+        return True
+
+    return etag in (tag.strip().removeprefix("W/") for tag in if_none_match.split(","))
+
+
+def get_serialized_response(
+    serialized_response: SerializedResponse, if_none_match: str | None
+) -> Response:
+    headers = {
+        "ETag": serialized_response["etag"],
+        "Cache-Control": SERVICES_CACHE_CONTROL,
+        "Vary": "Accept-Language",
+    }
+
+    if is_etag_matched(serialized_response["etag"], if_none_match):
+        return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers=headers)
+
+    return Response(
+        serialized_response["body"], media_type="application/json", headers=headers
+    )
+
 
 @router.get("", response_model=list[ReturnService])
 def get_services(
-    db: Session = Depends(get_db), accept_language: str | None = Header(None)
+    db: Session = Depends(get_db),
+    accept_language: str | None = Header(None),
+    if_none_match: str | None = Header(None),
 ):
     language_code = get_language_code_from_header(accept_language)
 
-    services_db = (
-        db.query(models.Service, models.ServiceTranslations)
-        .join(models.ServiceTranslations)
-        .join(models.Language)
-        .where(models.Language.code == language_code)
-        .all()
-    )
-
-    services = []
-    for service, translation in services_db:
-        service.name = translation.name
-        # service.description = translation.description
-        services.append(service)
+    translation_catalog = get_translation_catalog(db)
+    language_id = translation_catalog.get_language_id(language_code)
 
-    return services
+    return get_serialized_response(
+        translation_catalog.get_services_response(language_id), if_none_match
+    )
 
 
 @router.get("/details", response_model=list[ReturnServiceDetailed])
@@ -46,48 +72,28 @@ def get_services_details(
     admin = admin_session.admin
 
     language_id = get_user_language_id(db, admin.id)
+    translation_catalog = get_translation_catalog(db)
 
-    services_db = db.query(models.Service).all()
-
-    for service_db in services_db:
-        service_translation = (
-            db.query(
-                models.ServiceTranslations.name, models.ServiceTranslations.description
-            )
-            .where(models.ServiceTranslations.language_id == language_id)
-            .where(models.ServiceTranslations.service_id == service_db.id)
-            .first()
-        )
-        service_db.name = service_translation[0]
-        service_db.description = service_translation[1]
-
-    return services_db
+    return [
+        translation_catalog.get_translated_service(service_id, language_id)
+        for service_id in translation_catalog.services
+    ]
 
 
 @router.get("/details/{uuid}", response_model=ReturnServiceDetailed)
 def get_service_details(
     uuid: UUID4, db: Session = Depends(get_db), admin_session=Depends(oauth2.get_admin)
 ):
-    service_db = db.query(models.Service).where(models.Service.id == uuid).first()
-
-    if not service_db:
-        raise ResourceNotFoundHTTPException()
-
     admin = admin_session.admin
+
     language_id = get_user_language_id(db, admin.id)
 
-    service_translation = (
-        db.query(
-            models.ServiceTranslations.name, models.ServiceTranslations.description
-        )
-        .where(models.ServiceTranslations.language_id == language_id)
-        .where(models.ServiceTranslations.service_id == service_db.id)
-        .first()
-    )
-    service_db.name = service_translation[0]
-    service_db.description = service_translation[1]
+    service = get_translation_catalog(db).get_translated_service(uuid, language_id)
 
-    return service_db
+    if not service:
+        raise ResourceNotFoundHTTPException()
+
+    return service
 
 
 @router.get("/{uuid}", response_model=ReturnService)
@@ -95,28 +101,19 @@ def get_service(
     uuid: UUID4,
     db: Session = Depends(get_db),
     accept_language: str | None = Header(None),
+    if_none_match: str | None = Header(None),
 ):
     language_code = get_language_code_from_header(accept_language)
 
-    service_db = (
-        db.query(models.Service, models.ServiceTranslations)
-        .join(models.ServiceTranslations)
-        .join(models.Language)
-        .where(models.Language.code == language_code)
-        .where(models.Service.id == uuid)
-        .first()
-    )
-
-    if not service_db:
-        raise ResourceNotFoundHTTPException()
+    translation_catalog = get_translation_catalog(db)
+    language_id = translation_catalog.get_language_id(language_code)
 
-    service = service_db[0]
-    translation = service_db[1]
+    serialized_response = translation_catalog.get_service_response(uuid, language_id)
 
-    service.name = translation.name
-    service.description = translation.description
+    if not serialized_response:
+        raise ResourceNotFoundHTTPException()
 
-    return service
+    return get_serialized_response(serialized_response, if_none_match)
 
 
 @router.post("")
@@ -1,10 +1,11 @@
 from fastapi import APIRouter, Depends
 from sqlalchemy.orm import Session
 
-from .. import models, oauth2
+from .. import oauth2
 from ..config import settings
 from ..database import get_db
 from ..schemas.user_settings import ReturnSettings, UpdateSettings
+from ..settings_cache import get_user_settings_cache
 
 router = APIRouter(prefix=settings.BASE_URL + "/settings", tags=["Settings"])
 
@@ -13,11 +14,9 @@ router = APIRouter(prefix=settings.BASE_URL + "/settings", tags=["Settings"])
 def get_settings(db: Session = Depends(get_db), user_session=Depends(oauth2.get_user)):
     user = user_session.user
 
-    user_settings = (
-        db.query(models.Setting).where(models.Setting.user_id == user.id).all()
-    )
+    user_settings = get_user_settings_cache().get(db, user.id)
 
-    return {"settings": user_settings}
+    return {"settings": list(user_settings.values())}
 
 
 @router.put("", response_model=ReturnSettings)
@@ -28,23 +27,14 @@ def update_settings(
 ):
     user = user_session.user
 
-    settings_db = []
-
-    for setting in new_settings.settings:
-        setting_db = (
-            db.query(models.Setting)
-            .where(models.Setting.user_id == user.id)
-            .where(models.Setting.name == setting.name)
-            .first()
-        )
-
-        setting_db.current_value = setting.new_value
-
-        db.commit()
-
-        settings_db.append(setting_db)
-
-    for setting_db in settings_db:
-        db.refresh(setting_db)
+    user_settings = get_user_settings_cache().update(
+        db,
+        user.id,
+        {setting.name.value: setting.new_value for setting in new_settings.settings},
+    )
 
-    return {"settings": settings_db}
+    return {
+        "settings": [
+            user_settings[setting.name.value] for setting in new_settings.settings
+        ]
+    }
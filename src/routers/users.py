@@ -46,6 +46,7 @@ from ..schemas.user_settings import (
     PreferredThemeBase,
     ReturnSetting,
 )
+from ..settings_cache import get_user_settings_cache
 from ..utils import get_user_from_db, on_decode_error, verify_password
 
 router = APIRouter(prefix=settings.BASE_URL + "/users", tags=["Users"])
@@ -179,7 +180,6 @@ def create_user(
     return new_user
 
 
-# todo: fastapi limiter: 1 per 5 minutes
 @router.post(
     "/request-email-verification",
     status_code=status.HTTP_202_ACCEPTED,
@@ -233,15 +233,12 @@ def request_email_verification(
     db.add(email_verification_request)
     db.commit()
 
-    content_language = (
-        db.query(models.Setting)
-        .where(models.Setting.name == AvailableSettings.language)
-        .where(models.Setting.user_id == user_db.id)
-        .first()
+    content_language = get_user_settings_cache().get_value(
+        db, user_db.id, AvailableSettings.language.value
     )
 
     message, template_name = create_email_verification_email(
-        content_language.current_value,
+        content_language,
         user_db,
         email_verification_request.request_token,
     )
@@ -380,6 +377,8 @@ def delete_user(
 
     db.commit()
 
+    get_user_settings_cache().invalidate(user.id)
+
     return {"status": "ok"}
 
 
@@ -1,16 +1,141 @@
+import threading
+
 from apscheduler.jobstores.sqlalchemy import SQLAlchemyJobStore
 from apscheduler.schedulers.background import BackgroundScheduler
+from sqlalchemy import Engine, func, select
 
-from src.database import database_engine
+from src.config import settings
+from src.database import database_engine, get_db
+from src.loggers import app_logger
+from src.reminder_scheduler import ReminderScheduler
 from src.utils import COMPANY_TIMEZONE
 
-scheduler = BackgroundScheduler()
+# Key of the Postgres advisory lock held by the process running the scheduler
+SCHEDULER_ADVISORY_LOCK_ID = 730_412_019
+
+
+def create_scheduler() -> BackgroundScheduler:
+    return BackgroundScheduler(
+        jobstores={"default": SQLAlchemyJobStore(engine=database_engine)},
+        timezone=COMPANY_TIMEZONE,
+    )
+
+
+class SchedulerLeaderElection:
+    """Runs the scheduler in a single process across all workers
+
+    Processes compete for a Postgres advisory lock and the one holding it
+    runs the scheduler and the reminder scheduler. The lock belongs to the
+    leader's database session, so it's released as soon as the leader dies
+    and another process takes over within `poll_interval_seconds`
+    """
+
+    def __init__(self, engine: Engine, poll_interval_seconds: float):
+        self.engine = engine
+        self.poll_interval_seconds = poll_interval_seconds
+        self.connection = None
+        self.scheduler: BackgroundScheduler | None = None
+        self.reminder_scheduler: ReminderScheduler | None = None
+        self.stop_event = threading.Event()
+        self.thread: threading.Thread | None = None
+
+    @property
+    def is_leader(self) -> bool:
+        return self.scheduler is not None and self.scheduler.running
+
+    def start(self) -> None:
+        if self.thread is not None and self.thread.is_alive():
+            return
+
+        self.stop_event.clear()
+        self.thread = threading.Thread(
+            target=self.run, name="scheduler-leader-election", daemon=True
+        )
+        self.thread.start()
+
+    def stop(self) -> None:
+        self.stop_event.set()
+
+        if self.thread is not None:
+            self.thread.join(timeout=self.poll_interval_seconds * 2)
+            self.thread = None
+
+    def run(self) -> None:
+        while not self.stop_event.is_set():
+            try:
+                if self.connection is None:
+                    self.try_to_lead()
+                else:
+                    self.check_leadership()
+            except Exception:
+                app_logger.exception("Scheduler leader election failed")
+                self.resign()
+
+            self.stop_event.wait(self.poll_interval_seconds)
+
+        self.resign()
+
+    def try_to_lead(self) -> None:
+        connection = self.engine.connect()
+
+        try:
+            acquired = connection.execute(
+                select(func.pg_try_advisory_lock(SCHEDULER_ADVISORY_LOCK_ID))
+            ).scalar()
+            # The lock outlives the transaction, it's held until unlocked
+            connection.commit()
+        except Exception:
+            connection.invalidate()
+            raise
+
+        if not acquired:
+            connection.close()
+            return
+
+        self.connection = connection
+        self.scheduler = create_scheduler()
+        self.scheduler.start()
+
+        self.reminder_scheduler = ReminderScheduler(get_db, self.engine)
+        self.reminder_scheduler.start()
+
+        app_logger.info("Acquired scheduler leadership, scheduler started")
+
+    def check_leadership(self) -> None:
+        # Fails if the connection, and thus the lock, was lost
+        self.connection.execute(select(1))
+        self.connection.commit()
+
+    def resign(self) -> None:
+        if self.reminder_scheduler is not None:
+            self.reminder_scheduler.stop()
+            self.reminder_scheduler = None
+
+        if self.scheduler is not None:
+            if self.scheduler.running:
+                self.scheduler.shutdown(wait=False)
+
+            self.scheduler = None
+            app_logger.info("Resigned scheduler leadership, scheduler stopped")
+
+        if self.connection is not None:
+            try:
+                self.connection.execute(
+                    select(func.pg_advisory_unlock(SCHEDULER_ADVISORY_LOCK_ID))
+                )
+                self.connection.commit()
+                self.connection.close()
+            except Exception:
+                # A connection still holding the lock mustn't return to the pool
+                self.connection.invalidate()
+
+            self.connection = None
 
 
-def configure_and_start_scheduler():
-    if not scheduler.running:
-        jobstores = {"default": SQLAlchemyJobStore(engine=database_engine)}
+scheduler_leader_election = SchedulerLeaderElection(
+    database_engine, settings.SCHEDULER_LEADER_POLL_INTERVAL_SECONDS
+)
 
-        scheduler.configure(jobstores=jobstores, timezone=COMPANY_TIMEZONE)
 
-        scheduler.start()
+def get_scheduler_leader_election() -> SchedulerLeaderElection:
+    return scheduler_leader_election
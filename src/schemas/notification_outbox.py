@@ -0,0 +1,51 @@
+import datetime
+from enum import Enum
+
+from pydantic import BaseModel, UUID4
+
+
+class NotificationKind(str, Enum):
+    new_appointment = "new_appointment"
+    appointment_updated = "appointment_updated"
+    appointment_canceled = "appointment_canceled"
+    upcoming_appointment = "upcoming_appointment"
+
+
+class OutboxStatus(str, Enum):
+    pending = "pending"
+    sent = "sent"
+    dead = "dead"
+
+
+class NewAppointmentPayload(BaseModel):
+    user_name: str
+    user_surname: str
+    service_id: UUID4
+    appointment_date: datetime.datetime
+
+
+class AppointmentUpdatedPayload(BaseModel):
+    user_id: UUID4
+    service_id: UUID4
+    new_appointment_date: datetime.datetime
+
+
+class AppointmentCanceledPayload(BaseModel):
+    user_id: UUID4
+    service_id: UUID4
+    appointment_date: datetime.datetime
+
+
+class UpcomingAppointmentPayload(BaseModel):
+    user_id: UUID4
+    appointment_id: UUID4
+    service_id: UUID4
+    minutes_to_appointment: int
+
+
+NOTIFICATION_PAYLOADS: dict[NotificationKind, type[BaseModel]] = {
+    NotificationKind.new_appointment: NewAppointmentPayload,
+    NotificationKind.appointment_updated: AppointmentUpdatedPayload,
+    NotificationKind.appointment_canceled: AppointmentCanceledPayload,
+    NotificationKind.upcoming_appointment: UpcomingAppointmentPayload,
+}
@@ -22,16 +22,19 @@ class DeviceInfo(BaseModel):
     is_tablet: bool | None = None
     is_pc: bool | None = None
     supports_touch: bool | None = None
+    model_config = ConfigDict(frozen=True)
 
 
 class OsInfo(BaseModel):
     family: str | None = None
     version: str | None = None
+    model_config = ConfigDict(frozen=True)
 
 
 class BrowserInfo(BaseModel):
     family: str | None = None
     version: str | None = None
+    model_config = ConfigDict(frozen=True)
 
 
 class UserAgentInfo(BaseModel):
@@ -39,6 +42,7 @@ class UserAgentInfo(BaseModel):
     device: DeviceInfo
     os: OsInfo
     browser: BrowserInfo
+    model_config = ConfigDict(frozen=True)
 
 
 class LoginData(BaseModel):
@@ -1,9 +1,12 @@
 from enum import Enum
+from functools import lru_cache
 from typing import List, Union
 
 import langcodes
 from pydantic import BaseModel, ConfigDict, field_validator, model_validator
 
+LANGUAGE_TAG_CACHE_SIZE = 1024
+
 
 class AvailableSettings(str, Enum):
     language = "language"
@@ -15,6 +18,14 @@ class DefaultContentLanguages(str, Enum):
     english = langcodes.Language.get(langcodes.standardize_tag("en")).language
 
 
+@lru_cache(maxsize=LANGUAGE_TAG_CACHE_SIZE)
+def is_valid_language_tag(tag: str) -> bool:
+    try:
+        return langcodes.Language.get(tag).is_valid()
+    except ValueError:
+        return False
+
+
 class AvailableThemes(str, Enum):
     dark = "dark"
     light = "light"
@@ -64,7 +75,7 @@ class SettingBase(BaseModel):
                     "value is not a valid enumeration member; permitted: "
                     + ", ".join([f"'{v.value}'" for v in AvailableThemes])
                 )
-        elif not langcodes.Language.get(self.current_value).is_valid():
+        elif not is_valid_language_tag(self.current_value):
             raise ValueError("value is not a valid ietf language tag ")
         return self
 
@@ -83,7 +94,7 @@ class UpdateSetting(BaseModel):
                     f"value is not a valid enumeration member; permitted: "
                     + ", ".join([f"'{v.value}'" for v in AvailableThemes])
                 )
-        elif not langcodes.Language.get(self.new_value).is_valid():
+        elif not is_valid_language_tag(self.new_value):
             raise ValueError("value is not a valid ietf language tag ")
         return self
 
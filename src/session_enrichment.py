@@ -0,0 +1,114 @@
+from pydantic import UUID4
+from sqlalchemy.orm import Session
+from starlette.concurrency import run_in_threadpool
+
+from . import models
+from .ipinfo import get_ip_addresses_details
+from .loggers import app_logger
+from .utils import (
+    build_location_data,
+    get_user_agent_info,
+    get_user_agent_info_cache_stats,
+)
+
+
+def dump_location_data(ip_address_details: dict | None) -> dict | None:
+    location_data = build_location_data(ip_address_details)
+
+    return location_data.model_dump() if location_data else None
+
+
+def get_unenriched_sessions(
+    db: Session, session_ids: list[UUID4]
+) -> list[models.Session]:
+    return (
+        db.query(models.Session)
+        .where(models.Session.id.in_(session_ids))
+        .where(
+            (models.Session.sign_in_user_agent_info == None)
+            | (models.Session.last_user_agent_info == None)
+        )
+        .all()
+    )
+
+
+def store_sessions_enrichment(
+    db: Session,
+    sessions_db: list[models.Session],
+    ip_addresses_details: dict[str, dict | None],
+) -> None:
+    # Updates are conditional on the user agent and IP address still being
+    # the enriched ones, so a concurrent change is never overwritten with stale data
+    for session_db in sessions_db:
+        if not session_db.sign_in_user_agent_info:
+            db.query(models.Session).where(models.Session.id == session_db.id).where(
+                models.Session.sign_in_user_agent == session_db.sign_in_user_agent
+            ).where(
+                models.Session.sign_in_ip_address == session_db.sign_in_ip_address
+            ).update(
+                {
+                    models.Session.sign_in_user_agent_info: get_user_agent_info(
+                        session_db.sign_in_user_agent
+                    ).model_dump(),
+                    models.Session.sign_in_location: dump_location_data(
+                        ip_addresses_details.get(session_db.sign_in_ip_address)
+                    ),
+                },
+                synchronize_session=False,
+            )
+
+        if not session_db.last_user_agent_info:
+            db.query(models.Session).where(models.Session.id == session_db.id).where(
+                models.Session.last_user_agent == session_db.last_user_agent
+            ).where(
+                models.Session.last_ip_address == session_db.last_ip_address
+            ).update(
+                {
+                    models.Session.last_user_agent_info: get_user_agent_info(
+                        session_db.last_user_agent
+                    ).model_dump(),
+                    models.Session.last_location: dump_location_data(
+                        ip_addresses_details.get(session_db.last_ip_address)
+                    ),
+                },
+                synchronize_session=False,
+            )
+
+    db.commit()
+
+
+async def enrich_sessions(get_db_func: callable, *, session_ids: list[UUID4]) -> None:
+    """Parses user agents and geolocates IP addresses of the sessions once
+
+    Results are stored with the sessions, so listing sessions doesn't have to
+    repeat this work. All IP addresses are looked up in a single batch.
+    """
+    db = next(get_db_func())
+
+    try:
+        sessions_db = await run_in_threadpool(get_unenriched_sessions, db, session_ids)
+
+        if not sessions_db:
+            return
+
+        ip_addresses = set()
+        for session_db in sessions_db:
+            ip_addresses.add(session_db.sign_in_ip_address)
+            ip_addresses.add(session_db.last_ip_address)
+
+        ip_addresses_details = await get_ip_addresses_details(db, ip_addresses)
+
+        await run_in_threadpool(
+            store_sessions_enrichment, db, sessions_db, ip_addresses_details
+        )
+
+        app_logger.debug(f"User agent info cache: {get_user_agent_info_cache_stats()}")
+    except Exception:
+        db.rollback()
+        app_logger.exception(f"Failed to enrich sessions: {session_ids}")
+    finally:
+        db.close()
+
+
+async def enrich_session(get_db_func: callable, *, session_id: UUID4) -> None:
+    await enrich_sessions(get_db_func, session_ids=[session_id])
@@ -0,0 +1,139 @@
+import threading
+import time
+from collections import OrderedDict
+from typing import TypedDict
+
+from pydantic import UUID4
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.orm import Session
+
+from . import models
+from .config import settings
+
+USER_SETTINGS_CACHE_SIZE = 4096
+
+
+class UserSetting(TypedDict):
+    name: str
+    default_value: str | None
+    current_value: str
+
+
+class UserSettingsCache:
+    """Write-through cache of users' settings, populated on first access
+
+    Settings changed through `update` are written to the database and the
+    cache at once. Other processes see the change once their entry expires
+    after `ttl_seconds`. The least recently used users are evicted above
+    `max_users`
+    """
+
+    def __init__(self, ttl_seconds: float, max_users: int):
+        self.ttl_seconds = ttl_seconds
+        self.max_users = max_users
+        self.lock = threading.Lock()
+        self.entries: OrderedDict[UUID4, tuple[float, dict[str, UserSetting]]] = (
+            OrderedDict()
+        )
+
+    def get(self, db: Session, user_id: UUID4) -> dict[str, UserSetting]:
+        """Returns the user's settings keyed by name"""
+        with self.lock:
+            entry = self.entries.get(user_id)
+
+            if entry is not None and time.monotonic() - entry[0] < self.ttl_seconds:
+                self.entries.move_to_end(user_id)
+                return entry[1]
+
+        user_settings = {
+            setting.name: UserSetting(
+                name=setting.name,
+                default_value=setting.default_value,
+                current_value=setting.current_value,
+            )
+            for setting in db.query(
+                models.Setting.name,
+                models.Setting.default_value,
+                models.Setting.current_value,
+            ).where(models.Setting.user_id == user_id)
+        }
+
+        self.set(user_id, user_settings)
+
+        return user_settings
+
+    def get_value(self, db: Session, user_id: UUID4, name: str) -> str | None:
+        setting = self.get(db, user_id).get(name)
+
+        return setting["current_value"] if setting else None
+
+    def update(
+        self, db: Session, user_id: UUID4, values: dict[str, str]
+    ) -> dict[str, UserSetting]:
+        """Sets the user's settings in a single statement and commits
+
+        Returns all of the user's settings keyed by name
+        """
+        statement = insert(models.Setting).values(
+            [
+                {"user_id": user_id, "name": name, "current_value": value}
+                for name, value in values.items()
+            ]
+        )
+        updated_settings = db.execute(
+            statement.on_conflict_do_update(
+                index_elements=[models.Setting.user_id, models.Setting.name],
+                set_={"current_value": statement.excluded.current_value},
+            ).returning(
+                models.Setting.name,
+                models.Setting.default_value,
+                models.Setting.current_value,
+            )
+        ).all()
+
+        db.commit()
+
+        with self.lock:
+            entry = self.entries.get(user_id)
+
+        if entry is None:
+            return self.get(db, user_id)
+
+        # Entries are shared with readers, so they're replaced instead of modified
+        user_settings = dict(entry[1])
+
+        for setting in updated_settings:
+            user_settings[setting.name] = UserSetting(
+                name=setting.name,
+                default_value=setting.default_value,
+                current_value=setting.current_value,
+            )
+
+        self.set(user_id, user_settings)
+
+        return user_settings
+
+    def set(self, user_id: UUID4, user_settings: dict[str, UserSetting]) -> None:
+        with self.lock:
+            self.entries[user_id] = (time.monotonic(), user_settings)
+            self.entries.move_to_end(user_id)
+
+            while len(self.entries) > self.max_users:
+                self.entries.popitem(last=False)
+
+    def invalidate(self, user_id: UUID4) -> None:
+        with self.lock:
+            self.entries.pop(user_id, None)
+
+    def clear(self) -> None:
+        with self.lock:
+            self.entries.clear()
+
+
+user_settings_cache = UserSettingsCache(
+    settings.USER_SETTINGS_CACHE_TTL_SECONDS, USER_SETTINGS_CACHE_SIZE
+)
+
+
+def get_user_settings_cache() -> UserSettingsCache:
+    return user_settings_cache
@@ -0,0 +1,108 @@
+import math
+from typing import Any, Hashable
+
+
+class TimingWheel:
+    """Hierarchical timing wheel with O(1) insert and cancel
+
+    The lowest level has `wheel_sizes[0]` slots of `tick_seconds` each and
+    every slot of the next level spans a full rotation of the previous one.
+    Timers are kept on the lowest level able to hold them and cascade down
+    as the wheel advances, timers further than `horizon_seconds` are rejected
+    """
+
+    def __init__(self, tick_seconds: float, wheel_sizes: tuple[int, ...], now: float):
+        self.tick_seconds = tick_seconds
+        self.wheel_sizes = wheel_sizes
+        # Number of ticks spanned by a single slot on each level
+        self.slot_ticks = [
+            math.prod(wheel_sizes[:level]) for level in range(len(wheel_sizes))
+        ]
+        self.span_ticks = math.prod(wheel_sizes)
+        self.wheels: list[list[dict[Hashable, tuple[int, Any]]]] = [
+            [{} for _ in range(size)] for size in wheel_sizes
+        ]
+        # Level and slot of every timer, so it can be canceled without a lookup
+        self.timers: dict[Hashable, tuple[int, int]] = {}
+        self.current_tick = self.get_tick(now)
+
+    def __len__(self) -> int:
+        return len(self.timers)
+
+    def __contains__(self, key: Hashable) -> bool:
+        return key in self.timers
+
+    @property
+    def horizon_seconds(self) -> float:
+        return (self.span_ticks - 1) * self.tick_seconds
+
+    def get_tick(self, timestamp: float) -> int:
+        return math.floor(timestamp / self.tick_seconds)
+
+    def add(self, key: Hashable, due_at: float, value: Any) -> bool:
+        """Schedules `value` to expire at `due_at` (a timestamp), replacing the key's timer
+
+        Timers already due expire on the next tick.
+        Returns False if `due_at` is beyond the wheel's horizon
+        """
+        expires_tick = max(math.ceil(due_at / self.tick_seconds), self.current_tick + 1)
+
+        if expires_tick - self.current_tick >= self.span_ticks:
+            return False
+
+        self.cancel(key)
+        self.insert(key, expires_tick, value)
+
+        return True
+
+    def insert(self, key: Hashable, expires_tick: int, value: Any) -> None:
+        ticks_left = expires_tick - self.current_tick
+
+        for level, size in enumerate(self.wheel_sizes):
+            if ticks_left < self.slot_ticks[level] * size:
+                break
+
+        slot = (expires_tick // self.slot_ticks[level]) % self.wheel_sizes[level]
+
+        self.wheels[level][slot][key] = (expires_tick, value)
+        self.timers[key] = (level, slot)
+
+    def cancel(self, key: Hashable) -> bool:
+        location = self.timers.pop(key, None)
+
+        if location is None:
+            return False
+
+        level, slot = location
+        del self.wheels[level][slot][key]
+
+        return True
+
+    def advance(self, now: float) -> list[Any]:
+        """Moves the wheel to `now`, returns values of the expired timers"""
+        expired = []
+        target_tick = self.get_tick(now)
+
+        while self.current_tick < target_tick:
+            self.current_tick += 1
+
+            # Higher levels first, so their timers can cascade all the way down
+            for level in range(len(self.wheel_sizes) - 1, 0, -1):
+                if self.current_tick % self.slot_ticks[level] == 0:
+                    self.cascade(level)
+
+            slot = self.current_tick % self.wheel_sizes[0]
+            bucket, self.wheels[0][slot] = self.wheels[0][slot], {}
+
+            for key, (_, value) in bucket.items():
+                del self.timers[key]
+                expired.append(value)
+
+        return expired
+
+    def cascade(self, level: int) -> None:
+        slot = (self.current_tick // self.slot_ticks[level]) % self.wheel_sizes[level]
+        bucket, self.wheels[level][slot] = self.wheels[level][slot], {}
+
+        for key, (expires_tick, value) in bucket.items():
+            self.insert(key, expires_tick, value)
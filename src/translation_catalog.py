@@ -0,0 +1,253 @@
+import hashlib
+import threading
+import time
+from typing import Any, TypedDict
+
+from pydantic import UUID4, TypeAdapter
+from sqlalchemy.orm import Session
+
+from . import models
+from .config import settings
+from .loggers import app_logger
+from .schemas.service import ReturnService
+from .schemas.user_settings import DefaultContentLanguages
+
+service_adapter = TypeAdapter(ReturnService)
+services_adapter = TypeAdapter(list[ReturnService])
+
+
+class ServiceTranslation(TypedDict):
+    name: str
+    description: str | None
+
+
+class SerializedResponse(TypedDict):
+    body: bytes
+    etag: str
+
+
+def serialize_response(content: Any, adapter: TypeAdapter) -> SerializedResponse:
+    body = adapter.dump_json(adapter.validate_python(content))
+
+    return SerializedResponse(
+        body=body, etag=f'"{hashlib.blake2b(body, digest_size=16).hexdigest()}"'
+    )
+
+
+class CatalogSnapshot(TypedDict):
+    language_ids: dict[str, int]
+    service_translations: dict[tuple[UUID4, int], ServiceTranslation]
+    holiday_names: dict[tuple[int, int], str]
+    services: dict[UUID4, dict[str, Any]]
+    # Responses serialized from this snapshot's data
+    responses: dict[tuple, SerializedResponse]
+
+
+def create_empty_snapshot() -> CatalogSnapshot:
+    return CatalogSnapshot(
+        language_ids={},
+        service_translations={},
+        holiday_names={},
+        services={},
+        responses={},
+    )
+
+
+class TranslationCatalog:
+    """Process-wide cache of languages along with service and holiday translations
+
+    Translations change only on deploys, so they're loaded once and reloaded
+    when the version in `translation_catalog_version` (bumped by database
+    triggers on every change) differs from the loaded one. The version is
+    checked at most every `check_interval_seconds`.
+    Services are loaded along with their translations, public service
+    responses are serialized once per language and kept until the next reload.
+    Loaded data is replaced as a whole, so a response is always built from
+    and cached in the same snapshot
+    """
+
+    def __init__(self, check_interval_seconds: float):
+        self.check_interval_seconds = check_interval_seconds
+        self.lock = threading.Lock()
+        self.version: int | None = None
+        self.checked_at: float | None = None
+        self.snapshot = create_empty_snapshot()
+
+    @property
+    def language_ids(self) -> dict[str, int]:
+        return self.snapshot["language_ids"]
+
+    @property
+    def services(self) -> dict[UUID4, dict[str, Any]]:
+        return self.snapshot["services"]
+
+    def is_check_due(self) -> bool:
+        return (
+            self.checked_at is None
+            or time.monotonic() - self.checked_at >= self.check_interval_seconds
+        )
+
+    def refresh(self, db: Session) -> None:
+        if not self.is_check_due():
+            return
+
+        with self.lock:
+            # Another thread could have refreshed the catalog in the meantime
+            if not self.is_check_due():
+                return
+
+            version = db.query(models.TranslationCatalogVersion.version).scalar()
+
+            # Without the version row the catalog is reloaded on every check
+            if version is None or version != self.version:
+                self.load(db)
+                self.version = version
+
+            self.checked_at = time.monotonic()
+
+    def load(self, db: Session) -> None:
+        language_ids = {
+            language.code: language.id
+            for language in db.query(models.Language.code, models.Language.id)
+        }
+
+        service_translations = {
+            (translation.service_id, translation.language_id): ServiceTranslation(
+                name=translation.name, description=translation.description
+            )
+            for translation in db.query(
+                models.ServiceTranslations.service_id,
+                models.ServiceTranslations.language_id,
+                models.ServiceTranslations.name,
+                models.ServiceTranslations.description,
+            )
+        }
+
+        holiday_names = {
+            (translation.holiday_id, translation.language_id): translation.name
+            for translation in db.query(
+                models.HolidayTranslations.holiday_id,
+                models.HolidayTranslations.language_id,
+                models.HolidayTranslations.name,
+            )
+        }
+
+        services = {
+            service.id: service._asdict()
+            for service in db.query(*models.Service.__table__.columns)
+        }
+
+        # Swapped all at once, readers never see a partially loaded catalog
+        self.snapshot = CatalogSnapshot(
+            language_ids=language_ids,
+            service_translations=service_translations,
+            holiday_names=holiday_names,
+            services=services,
+            responses={},
+        )
+
+        app_logger.info(
+            f"Loaded translation catalog: {len(language_ids)} languages, "
+            f"{len(service_translations)} service translations, "
+            f"{len(holiday_names)} holiday translations, {len(services)} services"
+        )
+
+    def invalidate(self) -> None:
+        with self.lock:
+            self.version = None
+            self.checked_at = None
+
+    def get_language_id(self, language_code: str | None) -> int:
+        """Returns id of the language, english if it's not available"""
+        language_id = self.language_ids.get(language_code)
+
+        if language_id is None:
+            language_id = self.language_ids[DefaultContentLanguages.english.value]
+
+        return language_id
+
+    def get_service_translation(
+        self, service_id: UUID4, language_id: int
+    ) -> ServiceTranslation | None:
+        return self.snapshot["service_translations"].get((service_id, language_id))
+
+    def translate_service(self, service: models.Service, language_id: int) -> None:
+        translation = self.snapshot["service_translations"][(service.id, language_id)]
+
+        service.name = translation["name"]
+        service.description = translation["description"]
+
+    def get_translated_service(
+        self, service_id: UUID4, language_id: int
+    ) -> dict[str, Any] | None:
+        """Returns the service's columns with name and description translated
+
+        Returns None if there's no such service, raises KeyError if it isn't
+        translated to the language
+        """
+        snapshot = self.snapshot
+        service = snapshot["services"].get(service_id)
+
+        if service is None:
+            return None
+
+        return service | snapshot["service_translations"][(service_id, language_id)]
+
+    def get_holiday_name(self, holiday_id: int, language_id: int) -> str | None:
+        return self.snapshot["holiday_names"].get((holiday_id, language_id))
+
+    def get_services_response(self, language_id: int) -> SerializedResponse:
+        """Returns the serialized list of services translated to the language
+
+        Services without a translation are left out, descriptions aren't translated
+        """
+        snapshot = self.snapshot
+        key = ("services", language_id)
+        response = snapshot["responses"].get(key)
+
+        if response is None:
+            services = []
+
+            for service in snapshot["services"].values():
+                translation = snapshot["service_translations"].get(
+                    (service["id"], language_id)
+                )
+
+                if translation:
+                    services.append(service | {"name": translation["name"]})
+
+            response = serialize_response(services, services_adapter)
+            snapshot["responses"][key] = response
+
+        return response
+
+    def get_service_response(
+        self, service_id: UUID4, language_id: int
+    ) -> SerializedResponse | None:
+        """Returns the serialized translated service, None if it's not available"""
+        snapshot = self.snapshot
+        key = ("service", service_id, language_id)
+        response = snapshot["responses"].get(key)
+
+        if response is None:
+            service = snapshot["services"].get(service_id)
+            translation = snapshot["service_translations"].get(
+                (service_id, language_id)
+            )
+
+            if not service or not translation:
+                return None
+
+            response = serialize_response(service | translation, service_adapter)
+            snapshot["responses"][key] = response
+
+        return response
+
+
+translation_catalog = TranslationCatalog(settings.TRANSLATION_CATALOG_CHECK_SECONDS)
+
+
+def get_translation_catalog(db: Session) -> TranslationCatalog:
+    translation_catalog.refresh(db)
+
+    return translation_catalog
@@ -1,8 +1,8 @@
 import datetime
 import logging
+from functools import lru_cache
 
 import langcodes
-import pydantic
 import pytz
 import user_agents
 from fastapi import HTTPException, status
@@ -12,7 +12,6 @@ from sqlalchemy.orm import Session
 
 from src import models
 from .config import settings
-from .ipinfo import get_ip_address_details
 from .schemas.session import (
     BrowserInfo,
     DeviceInfo,
@@ -22,9 +21,15 @@ from .schemas.session import (
     UserAgentInfo,
 )
 from .schemas.user_settings import AvailableSettings, DefaultContentLanguages
+from .settings_cache import get_user_settings_cache
+from .translation_catalog import get_translation_catalog
 
 COMPANY_TIMEZONE = pytz.timezone(settings.COMPANY_TIMEZONE)
 
+USER_AGENT_INFO_CACHE_SIZE = 1024
+
+ACCEPT_LANGUAGE_CACHE_SIZE = 1024
+
 pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
 
 formatter = logging.Formatter(
@@ -37,54 +42,69 @@ logger.setLevel(logging.DEBUG)
 logger.addHandler(file_handler)
 
 
-def get_language_code_from_header(accept_language: str) -> str | None:
-    if accept_language:
-        accept_language = accept_language.split(",")[0].split(";")[0]
-        language = langcodes.Language.get(langcodes.standardize_tag(accept_language))
+def parse_accept_language(accept_language: str) -> list[str]:
+    """Returns language tags from the Accept-Language header, most preferred first
+
+    Tags with q=0, malformed q-values and the wildcard are skipped
+    """
+    weighted_tags = []
+
+    for item in accept_language.split(","):
+        tag, *params = (part.strip() for part in item.split(";"))
+        quality = 1.0
+
+        for param in params:
+            name, _, value = param.partition("=")
+
+            if name.strip().lower() == "q":
+                try:
+                    quality = float(value)
+                except ValueError:
+                    quality = 0.0
+
+        if tag and tag != "*" and 0 < quality <= 1:
+            weighted_tags.append((quality, tag))
+
+    # Sorting is stable, tags with equal weights keep the header's order
+    weighted_tags.sort(key=lambda weighted_tag: weighted_tag[0], reverse=True)
+
+    return [tag for _, tag in weighted_tags]
+
+
+@lru_cache(maxsize=ACCEPT_LANGUAGE_CACHE_SIZE)
+def resolve_accept_language(accept_language: str) -> str:
+    """Returns code of the most preferred valid language, polish if there's none
+
+    Results are memoized, browsers send only a handful of distinct headers
+    """
+    for tag in parse_accept_language(accept_language):
+        try:
+            language = langcodes.Language.get(langcodes.standardize_tag(tag))
+        except ValueError:
+            continue
 
         if language.is_valid():
-            language_code = language.language
-        else:
-            language_code = DefaultContentLanguages.polish.value
-    else:
-        language_code = DefaultContentLanguages.polish.value
+            return language.language
 
-    return language_code
+    return DefaultContentLanguages.polish.value
 
 
-def get_language_id_from_language_code(
-    db: Session, language_code: str
-) -> pydantic.UUID4:
-    language_id = (
-        db.query(models.Language.id)
-        .where(models.Language.code == language_code)
-        .first()
-    )
+def get_language_code_from_header(accept_language: str | None) -> str:
+    if not accept_language:
+        return DefaultContentLanguages.polish.value
 
-    if language_id:
-        language_id = language_id[0]
+    return resolve_accept_language(accept_language)
 
-    if not language_id:
-        language_id = (
-            db.query(models.Language.id)
-            .where(models.Language.code == DefaultContentLanguages.english)
-            .first()[0]
-        )
 
-    return language_id
+def get_language_id_from_language_code(db: Session, language_code: str | None) -> int:
+    return get_translation_catalog(db).get_language_id(language_code)
 
 
 def get_user_language_id(db: Session, user_id: UUID4) -> int:
-    language_code = (
-        db.query(models.Setting.current_value)
-        .where(models.Setting.name == AvailableSettings.language.value)
-        .where(models.Setting.user_id == user_id)
-        .first()
+    language_code = get_user_settings_cache().get_value(
+        db, user_id, AvailableSettings.language.value
     )
 
-    if language_code:
-        language_code = language_code[0]
-
     language_id = get_language_id_from_language_code(db, language_code)
 
     return language_id
@@ -177,92 +197,141 @@ def get_user_from_db(*, uuid: UUID4, db: Session) -> models.User:
     return user
 
 
-def get_user_agent_info(user_agent: str) -> user_agents.parsers.UserAgent:
-    return user_agents.parse(user_agent)
+@lru_cache(maxsize=USER_AGENT_INFO_CACHE_SIZE)
+def get_user_agent_info(user_agent: str) -> UserAgentInfo:
+    """Parses the user agent string
 
+    Results are memoized, the returned objects are frozen and shared between callers
+    """
+    user_agent_info = user_agents.parse(user_agent)
 
-def load_session_data(session_db: models.Session) -> models.Session:
-    sign_in_user_agent_info = get_user_agent_info(session_db.sign_in_user_agent)
-    sign_in_user_agent_info = UserAgentInfo(
-        is_bot=sign_in_user_agent_info.is_bot,
+    return UserAgentInfo(
+        is_bot=user_agent_info.is_bot,
         device=DeviceInfo(
-            brand=sign_in_user_agent_info.device.brand,
-            family=sign_in_user_agent_info.device.family,
-            model=sign_in_user_agent_info.device.model,
-            is_mobile=sign_in_user_agent_info.is_mobile,
-            is_tablet=sign_in_user_agent_info.is_tablet,
-            is_pc=sign_in_user_agent_info.is_pc,
-            supports_touch=sign_in_user_agent_info.is_touch_capable,
+            brand=user_agent_info.device.brand,
+            family=user_agent_info.device.family,
+            model=user_agent_info.device.model,
+            is_mobile=user_agent_info.is_mobile,
+            is_tablet=user_agent_info.is_tablet,
+            is_pc=user_agent_info.is_pc,
+            supports_touch=user_agent_info.is_touch_capable,
         ),
         os=OsInfo(
-            family=sign_in_user_agent_info.os.family,
-            version=sign_in_user_agent_info.os.version_string,
+            family=user_agent_info.os.family,
+            version=user_agent_info.os.version_string,
         ),
         browser=BrowserInfo(
-            family=sign_in_user_agent_info.browser.family,
-            version=sign_in_user_agent_info.browser.version_string,
+            family=user_agent_info.browser.family,
+            version=user_agent_info.browser.version_string,
         ),
     )
-    sign_in_data = LoginData(
-        user_agent=session_db.sign_in_user_agent,
-        ip_address=session_db.sign_in_ip_address,
-        location=None,
-        user_agent_info=sign_in_user_agent_info,
+
+
+def get_user_agent_info_cache_stats() -> dict[str, int | float]:
+    cache_info = get_user_agent_info.cache_info()
+    lookups = cache_info.hits + cache_info.misses
+
+    return {
+        "hits": cache_info.hits,
+        "misses": cache_info.misses,
+        "size": cache_info.currsize,
+        "hit_rate": round(cache_info.hits / lookups, 3) if lookups else 0.0,
+    }
+
+
+def build_location_data(ip_address_details: dict | None) -> LocationData | None:
+    if not ip_address_details:
+        return None
+
+    return LocationData(
+        city=ip_address_details.get("city"),
+        region=ip_address_details.get("region"),
+        country=ip_address_details.get("country"),
+        longitude=ip_address_details.get("longitude"),
+        latitude=ip_address_details.get("latitude"),
     )
-    sign_in_ip_address_details = get_ip_address_details(session_db.sign_in_ip_address)
-    if sign_in_ip_address_details:
-        location_data = LocationData(
-            city=sign_in_ip_address_details.get("city"),
-            region=sign_in_ip_address_details.get("region"),
-            country=sign_in_ip_address_details.get("country"),
-            longitude=sign_in_ip_address_details.get("longitude"),
-            latitude=sign_in_ip_address_details.get("latitude"),
-        )
-        sign_in_data.location = location_data
-    session_db.sign_in_data = sign_in_data
 
-    last_user_agent_info = get_user_agent_info(session_db.last_user_agent)
-    last_user_agent_info = UserAgentInfo(
-        is_bot=last_user_agent_info.is_bot,
-        device=DeviceInfo(
-            brand=last_user_agent_info.device.brand,
-            family=last_user_agent_info.device.family,
-            model=last_user_agent_info.device.model,
-            is_mobile=last_user_agent_info.is_mobile,
-            is_tablet=last_user_agent_info.is_tablet,
-            is_pc=last_user_agent_info.is_pc,
-            supports_touch=last_user_agent_info.is_touch_capable,
-        ),
-        os=OsInfo(
-            family=last_user_agent_info.os.family,
-            version=last_user_agent_info.os.version_string,
-        ),
-        browser=BrowserInfo(
-            family=last_user_agent_info.browser.family,
-            version=last_user_agent_info.browser.version_string,
+
+def load_session_data(session_db: models.Session) -> models.Session:
+    """Builds sign in and last access data from the enrichment stored with the session
+
+    Doesn't perform any outbound requests, sessions which haven't been enriched yet
+    are returned without location data
+    """
+    session_db.sign_in_data = LoginData(
+        user_agent=session_db.sign_in_user_agent,
+        ip_address=session_db.sign_in_ip_address,
+        location=session_db.sign_in_location,
+        user_agent_info=(
+            session_db.sign_in_user_agent_info
+            or get_user_agent_info(session_db.sign_in_user_agent)
         ),
     )
-    last_access_data = LoginData(
+
+    session_db.last_access_data = LoginData(
         user_agent=session_db.last_user_agent,
         ip_address=session_db.last_ip_address,
-        location=None,
-        user_agent_info=last_user_agent_info,
+        location=session_db.last_location,
+        user_agent_info=(
+            session_db.last_user_agent_info
+            or get_user_agent_info(session_db.last_user_agent)
+        ),
     )
-    last_ip_address_details = get_ip_address_details(session_db.last_ip_address)
-    if last_ip_address_details:
-        location_data = LocationData(
-            city=last_ip_address_details.get("city"),
-            region=last_ip_address_details.get("region"),
-            country=last_ip_address_details.get("country"),
-            longitude=last_ip_address_details.get("longitude"),
-            latitude=last_ip_address_details.get("latitude"),
-        )
-        last_access_data.location = location_data
-    session_db.last_access_data = last_access_data
 
     return session_db
 
 
+def is_session_enriched(session_db: models.Session) -> bool:
+    return bool(session_db.sign_in_user_agent_info and session_db.last_user_agent_info)
+
+
+def update_session_last_access(
+    session_db: models.Session, *, user_agent: str, ip_address: str
+) -> bool:
+    """Updates last access data of the session
+
+    Returns True if the user agent or IP address changed and the session
+    needs to be enriched again
+    """
+    session_db.last_accessed = datetime.datetime.utcnow()
+
+    if (
+        session_db.last_user_agent == user_agent
+        and session_db.last_ip_address == ip_address
+    ):
+        return False
+
+    session_db.last_user_agent = user_agent
+    session_db.last_ip_address = ip_address
+    session_db.last_user_agent_info = None
+    session_db.last_location = None
+
+    return True
+
+
+def evict_least_recently_used_sessions(db: Session, user_id: UUID4) -> None:
+    """Makes room for a new session of the user
+
+    Deletes the least recently used sessions (along with their FCM tokens)
+    exceeding the limit, without committing, so it happens in the same
+    transaction as creating the new session
+    """
+    evicted_session_ids = (
+        db.query(models.Session.id)
+        .where(models.Session.user_id == user_id)
+        .order_by(models.Session.last_accessed.desc(), models.Session.id)
+        .offset(max(settings.MAX_SESSIONS_PER_USER - 1, 0))
+        .scalar_subquery()
+    )
+
+    db.query(models.FcmToken).where(
+        models.FcmToken.session_id.in_(evicted_session_ids)
+    ).delete(synchronize_session=False)
+    db.query(models.Session).where(models.Session.id.in_(evicted_session_ids)).delete(
+        synchronize_session=False
+    )
+
+
 def is_archival(appointment: models.Appointment) -> bool:
     return appointment.end_slot.end_time < datetime.datetime.now(COMPANY_TIMEZONE)
 
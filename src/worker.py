@@ -0,0 +1,119 @@
+"""Runs scheduled jobs and sends notifications outside the API workers
+
+Start with `python -m src.worker` and set RUN_BACKGROUND_WORKERS_IN_API=false.
+`python -m src.worker healthcheck` exits with 0 only if the worker is alive
+"""
+
+import asyncio
+import contextlib
+import json
+import os
+import signal
+import sys
+import time
+
+from starlette.concurrency import run_in_threadpool
+
+from .config import settings
+from .database import get_db
+from .email_manager import get_mail_sender
+from .email_renderer import get_email_renderer
+from .loggers import app_logger
+from .outbox_worker import (
+    is_outbox_worker_running,
+    start_outbox_worker,
+    stop_outbox_worker,
+)
+from .push_transport import close_push_transport
+from .scheduler import get_scheduler_leader_election
+
+
+def start_background_workers() -> None:
+    get_scheduler_leader_election().start()
+
+    start_outbox_worker(get_db)
+
+
+async def stop_background_workers() -> None:
+    await run_in_threadpool(get_scheduler_leader_election().stop)
+
+    await stop_outbox_worker()
+
+
+def is_scheduler_leader() -> bool:
+    return get_scheduler_leader_election().is_leader
+
+
+def write_heartbeat(path: str) -> None:
+    heartbeat = {"updated_at": time.time(), "scheduler_leader": is_scheduler_leader()}
+
+    # Replaced at once, so the health check never reads a partially written file
+    with open(f"{path}.tmp", "w") as heartbeat_file:
+        json.dump(heartbeat, heartbeat_file)
+
+    os.replace(f"{path}.tmp", path)
+
+
+def check_heartbeat(path: str, max_age_seconds: float) -> bool:
+    try:
+        with open(path) as heartbeat_file:
+            heartbeat = json.load(heartbeat_file)
+    except (OSError, ValueError):
+        return False
+
+    return time.time() - heartbeat.get("updated_at", 0) <= max_age_seconds
+
+
+async def run_heartbeat(stop_event: asyncio.Event) -> None:
+    """Writes the heartbeat file for as long as the background workers run"""
+    while not stop_event.is_set():
+        if is_outbox_worker_running():
+            await run_in_threadpool(write_heartbeat, settings.WORKER_HEARTBEAT_PATH)
+        else:
+            app_logger.error("Notification outbox worker isn't running")
+
+        with contextlib.suppress(asyncio.TimeoutError):
+            await asyncio.wait_for(stop_event.wait(), settings.WORKER_HEARTBEAT_SECONDS)
+
+    with contextlib.suppress(FileNotFoundError):
+        os.remove(settings.WORKER_HEARTBEAT_PATH)
+
+
+async def run_worker() -> None:
+    app_logger.info("Background worker started")
+
+    get_email_renderer().compile_templates()
+
+    start_background_workers()
+
+    stop_event = asyncio.Event()
+    loop = asyncio.get_running_loop()
+
+    for stop_signal in (signal.SIGINT, signal.SIGTERM):
+        loop.add_signal_handler(stop_signal, stop_event.set)
+
+    try:
+        await run_heartbeat(stop_event)
+    finally:
+        await stop_background_workers()
+        await close_push_transport()
+
+        mail_sender = get_mail_sender()
+        mail_sender.log_metrics()
+        await mail_sender.close()
+
+        app_logger.info("Background worker stopped")
+
+
+if __name__ == "__main__":
+    if sys.argv[1:] == ["healthcheck"]:
+        # Missed heartbeats are tolerated, e.g. while the database is slow
+        healthy = check_heartbeat(
+            settings.WORKER_HEARTBEAT_PATH, settings.WORKER_HEARTBEAT_SECONDS * 3
+        )
+        sys.exit(0 if healthy else 1)
+
+    from init_app import init_app
+
+    init_app()
+    asyncio.run(run_worker())
@@ -0,0 +1,1225 @@
+import asyncio
+import datetime
+import gc
+import socket
+import time
+import tracemalloc
+import uuid
+from pathlib import Path
+from types import SimpleNamespace
+
+import pytest
+from aiosmtpd.controller import Controller
+from apscheduler.schedulers.background import BackgroundScheduler
+from fastapi import status
+from fastapi.testclient import TestClient
+from fastapi_mail import ConnectionConfig, FastMail
+from sqlalchemy import event, func, select, text
+
+from src import models, oauth2
+from src.config import settings
+from src.email_manager import (
+    build_email_message,
+    create_new_appointment_email,
+    get_mail_sender,
+    set_mail_sender,
+)
+from src.fcm_manager import PushBatch
+from src.jobs import PendingReminder, skip_passed_reminders
+from src.main import app
+from src.mail_sender import FakeMailSender, SmtpMailSender
+from src.notification_context import (
+    NotificationContext,
+    NotificationRecipient,
+    load_notification_context,
+)
+from src.notifications_manager import (
+    NewAppointmentNotification,
+    NewAppointmentsDigestNotification,
+    UpcomingAppointmentNotification,
+)
+from src.outbox import enqueue_notification, get_digest_window_end
+from src.outbox_worker import (
+    claim_notifications,
+    drain_outbox,
+    get_retry_delay,
+    mark_notification_failed,
+)
+from src.push_transport import FakePushTransport, set_push_transport
+from src.schemas.notification_outbox import (
+    AppointmentCanceledPayload,
+    NewAppointmentPayload,
+    NotificationKind,
+    OutboxStatus,
+)
+from src.reminder_scheduler import (
+    REMINDER_WHEEL_MAX_HORIZON_SECONDS,
+    REMINDER_WHEEL_SIZES,
+    REMINDER_WHEEL_TICK_SECONDS,
+    ReminderScheduler,
+)
+from src.scheduler import SCHEDULER_ADVISORY_LOCK_ID, SchedulerLeaderElection
+from src.schemas.user_settings import AvailableSettings
+from src.timing_wheel import TimingWheel
+from src.worker import check_heartbeat, run_heartbeat
+from ..conf_database import TestingSessionLocal, database_engine
+from ..conf_test import client, session  # noqa
+
+BOOKED_APPOINTMENTS = 500
+WARM_UP_APPOINTMENTS = 50
+MAX_MEMORY_GROWTH_BYTES = 256 * 1024
+OWNER_EMAILS = 20
+DIGEST_APPOINTMENTS = 30
+LISTED_APPOINTMENTS = 100
+
+
+def get_test_fast_mail_client(suppress_send: bool = True) -> FastMail:
+    return FastMail(
+        ConnectionConfig(
+            MAIL_USERNAME=settings.MAIL_USERNAME,
+            MAIL_PASSWORD=settings.MAIL_PASSWORD,
+            MAIL_FROM=settings.MAIL_FROM,
+            MAIL_PORT=settings.MAIL_PORT,
+            MAIL_SERVER=settings.MAIL_SERVER,
+            MAIL_STARTTLS=settings.MAIL_STARTTLS,
+            MAIL_SSL_TLS=settings.MAIL_SSL_TLS,
+            USE_CREDENTIALS=settings.USE_CREDENTIALS,
+            VALIDATE_CERTS=settings.VALIDATE_CERTS,
+            MAIL_FROM_NAME=settings.MAIL_FROM_NAME,
+            TEMPLATE_FOLDER=Path(__file__).parent.parent.parent / "src/templates",
+            SUPPRESS_SEND=suppress_send,
+        )
+    )
+
+
+def get_owners_context(service_id: uuid.UUID) -> NotificationContext:
+    owner_ids = [uuid.uuid4(), uuid.uuid4()]
+
+    return NotificationContext(
+        recipients={
+            owner_id: NotificationRecipient(
+                id=owner_id,
+                email=f"owner{i}@example.com",
+                is_owner=True,
+                language_id=1,
+                language_code="pl",
+                fcm_tokens=[f"token-{i}-a", f"token-{i}-b"],
+                service_names={service_id: "Strzyżenie"},
+            )
+            for i, owner_id in enumerate(owner_ids)
+        },
+        owner_ids=owner_ids,
+    )
+
+
+def test_new_appointment_notifications_do_not_accumulate():
+    push_transport = FakePushTransport()
+    set_push_transport(push_transport)
+    # Emails are built and handed over to a sender which only records them
+    mail_sender = FakeMailSender()
+    fast_mail_client = get_test_fast_mail_client(suppress_send=False)
+
+    service_id = uuid.uuid4()
+    context = get_owners_context(service_id)
+    pushes_per_appointment = 4
+    emails_per_appointment = len(context["owner_ids"])
+
+    async def book_appointment() -> tuple[int, int]:
+        notification = NewAppointmentNotification(
+            context=context,
+            user_name="Jan",
+            user_surname="Kowalski",
+            service_id=service_id,
+            appointment_date=datetime.datetime.now(datetime.timezone.utc),
+            fast_mail_client=fast_mail_client,
+        )
+        push_batch = PushBatch()
+        emails_before = len(mail_sender.sent_messages)
+
+        await notification.send(push_batch)
+        # Sending again must not repeat already flushed messages
+        await notification.send(push_batch)
+
+        sent_before = len(push_transport.sent_messages)
+        await push_batch.flush(db=None)
+
+        return (
+            len(push_transport.sent_messages) - sent_before,
+            len(mail_sender.sent_messages) - emails_before,
+        )
+
+    async def book_appointments(count: int) -> list[tuple[int, int]]:
+        return [await book_appointment() for _ in range(count)]
+
+    original_mail_sender = get_mail_sender()
+    set_mail_sender(mail_sender)
+    try:
+        send_counts = asyncio.run(book_appointments(WARM_UP_APPOINTMENTS))
+        push_transport.sent_messages.clear()
+        mail_sender.sent_messages.clear()
+        gc.collect()
+
+        tracemalloc.start()
+        try:
+            memory_before, _ = tracemalloc.get_traced_memory()
+
+            send_counts += asyncio.run(book_appointments(BOOKED_APPOINTMENTS))
+            push_transport.sent_messages.clear()
+            mail_sender.sent_messages.clear()
+            gc.collect()
+
+            memory_after, _ = tracemalloc.get_traced_memory()
+        finally:
+            tracemalloc.stop()
+    finally:
+        set_mail_sender(original_mail_sender)
+
+    assert set(send_counts) == {(pushes_per_appointment, emails_per_appointment)}
+    assert memory_after - memory_before < MAX_MEMORY_GROWTH_BYTES
+
+
+def test_owner_digest_summarises_window_appointments():
+    push_transport = FakePushTransport()
+    set_push_transport(push_transport)
+
+    service_id = uuid.uuid4()
+    context = get_owners_context(service_id)
+    start = datetime.datetime(2026, 10, 19, 9, 0)
+    appointments = [
+        NewAppointmentPayload(
+            user_name="Jan",
+            user_surname=f"Kowalski {i}",
+            service_id=service_id,
+            appointment_date=start + datetime.timedelta(minutes=30 * (i % 7)),
+        )
+        for i in range(DIGEST_APPOINTMENTS)
+    ]
+
+    notification = NewAppointmentsDigestNotification(
+        context=context,
+        appointments=appointments,
+        fast_mail_client=get_test_fast_mail_client(),
+    )
+
+    assert len(notification.emails) == len(context["owner_ids"])
+    assert all(
+        len(email["message"].template_body["appointments"]) == DIGEST_APPOINTMENTS
+        for email in notification.emails
+    )
+
+    async def send_digest():
+        push_batch = PushBatch()
+        await notification.send(push_batch, "digest")
+        await push_batch.flush(db=None)
+
+    asyncio.run(send_digest())
+
+    # One push message per owner's token, regardless of the number of appointments
+    assert len(push_transport.sent_messages) == 4
+    assert {message.title for message in push_transport.sent_messages} == {
+        f"{DIGEST_APPOINTMENTS} nowych wizyt"
+    }
+
+
+def test_owner_digest_is_sent_in_owners_language():
+    service_id = uuid.uuid4()
+    context = get_owners_context(service_id)
+    polish_owner_id, english_owner_id = context["owner_ids"]
+    context["recipients"][english_owner_id]["language_code"] = "en"
+
+    notification = NewAppointmentsDigestNotification(
+        context=context,
+        appointments=[
+            NewAppointmentPayload(
+                user_name="Jan",
+                user_surname="Kowalski",
+                service_id=service_id,
+                appointment_date=datetime.datetime(2026, 10, 19, 9, 0),
+            )
+        ]
+        * 2,
+        fast_mail_client=get_test_fast_mail_client(),
+    )
+
+    emails = {email["message"].recipients[0]: email for email in notification.emails}
+    polish_email = emails[context["recipients"][polish_owner_id]["email"]]
+    english_email = emails[context["recipients"][english_owner_id]["email"]]
+
+    assert polish_email["template_name"] == "new_appointments_digest_pl.html"
+    assert polish_email["message"].template_body["title"] == "2 nowe wizyty"
+    assert english_email["template_name"] == "new_appointments_digest_en.html"
+    assert english_email["message"].template_body["title"] == "2 new appointments"
+    assert {notification["title"] for notification in notification.notifications} == {
+        "2 nowe wizyty",
+        "2 new appointments",
+    }
+
+
+def test_digest_window_end():
+    assert get_digest_window_end(
+        datetime.datetime(2026, 10, 19, 9, 7, 30), 15
+    ) == datetime.datetime(2026, 10, 19, 9, 15)
+    assert get_digest_window_end(
+        datetime.datetime(2026, 10, 19, 9, 15), 15
+    ) == datetime.datetime(2026, 10, 19, 9, 30)
+    assert get_digest_window_end(
+        datetime.datetime(2026, 10, 19, 23, 59), 15
+    ) == datetime.datetime(2026, 10, 20)
+
+
+def test_reminders_skip_windows_passed_at_booking():
+    now = datetime.datetime.now(datetime.timezone.utc)
+    appointment = models.Appointment()
+
+    skip_passed_reminders(appointment, now + datetime.timedelta(hours=1))
+
+    assert appointment.reminder_t_minus_120_sent_at is not None
+    assert appointment.reminder_t_minus_30_sent_at is None
+
+    # Moving the appointment resets its reminders
+    skip_passed_reminders(appointment, now + datetime.timedelta(days=1))
+
+    assert appointment.reminder_t_minus_120_sent_at is None
+    assert appointment.reminder_t_minus_30_sent_at is None
+
+
+def test_late_reminders_state_actual_time_left():
+    service_id = uuid.uuid4()
+    context = get_owners_context(service_id)
+    user_id = context["owner_ids"][0]
+
+    def get_reminder_msg(minutes_to_appointment: int) -> str:
+        return UpcomingAppointmentNotification(
+            context=context,
+            user_id=user_id,
+            appointment_id=uuid.uuid4(),
+            service_id=service_id,
+            minutes_to_appointment=minutes_to_appointment,
+        ).msg
+
+    assert get_reminder_msg(30) == "Twoja wizyta odbędzie się za 30 minut"
+    assert get_reminder_msg(120) == "Twoja wizyta odbędzie się za 2 godziny"
+    assert get_reminder_msg(22) == "Twoja wizyta odbędzie się za 22 minuty"
+    assert get_reminder_msg(13) == "Twoja wizyta odbędzie się za 13 minut"
+    assert get_reminder_msg(1) == "Twoja wizyta odbędzie się za 1 minutę"
+
+
+def test_reminder_horizon_is_capped_at_wheel_span(monkeypatch):
+    monkeypatch.setattr(settings, "REMINDER_WHEEL_HORIZON_HOURS", 48)
+    reminder_scheduler = ReminderScheduler(get_db_func=None, engine=None)
+    reminder_scheduler.wheel = TimingWheel(
+        REMINDER_WHEEL_TICK_SECONDS, REMINDER_WHEEL_SIZES, time.time()
+    )
+
+    assert reminder_scheduler.horizon_seconds == REMINDER_WHEEL_MAX_HORIZON_SECONDS
+
+    # Everything loaded up to the horizon fits in the wheel
+    reminders = [
+        PendingReminder(
+            appointment_id=uuid.uuid4(),
+            minutes_to_appointment=30,
+            due_at=reminder_scheduler.get_horizon(),
+        ),
+        PendingReminder(
+            appointment_id=uuid.uuid4(),
+            minutes_to_appointment=30,
+            due_at=datetime.datetime.now(datetime.timezone.utc)
+            + datetime.timedelta(hours=30),
+        ),
+    ]
+    reminder_scheduler.schedule(reminders)
+
+    assert (reminders[0]["appointment_id"], 30) in reminder_scheduler.wheel
+    assert (reminders[1]["appointment_id"], 30) not in reminder_scheduler.wheel
+
+
+def test_timing_wheel_fires_timers_on_time():
+    start = 1_000_000.0
+    wheel = TimingWheel(1, (60, 60, 24), start)
+
+    # Due on every level of the wheel, and one already overdue
+    due_in_seconds = {"overdue": -30, "seconds": 42, "minutes": 1810, "hours": 9000}
+
+    for key, seconds in due_in_seconds.items():
+        assert wheel.add(key, start + seconds, key)
+
+    assert wheel.add("canceled", start + 500, "canceled")
+    assert wheel.cancel("canceled")
+    # Rescheduling replaces the previous timer
+    assert wheel.add("moved", start + 100, "moved")
+    assert wheel.add("moved", start + 200, "moved")
+    assert not wheel.add("too late", start + wheel.horizon_seconds + 10, "too late")
+
+    fired_at = {}
+    now = start
+
+    while now < start + 10000:
+        now += 7
+        for key in wheel.advance(now):
+            fired_at[key] = now
+
+    assert set(fired_at) == set(due_in_seconds) | {"moved"}
+    assert fired_at["overdue"] == start + 7
+    assert fired_at["moved"] - 7 < start + 200 <= fired_at["moved"]
+
+    for key, seconds in due_in_seconds.items():
+        if seconds > 0:
+            assert fired_at[key] - 7 < start + seconds <= fired_at[key]
+
+    assert len(wheel) == 0
+
+
+class RecordingSmtpHandler:
+    def __init__(self):
+        self.messages = []
+        self.connections = 0
+
+    async def handle_EHLO(self, server, session, envelope, hostname, responses):
+        self.connections += 1
+        session.host_name = hostname
+        return responses
+
+    async def handle_DATA(self, server, session, envelope):
+        self.messages.append(envelope)
+        return "250 OK"
+
+
+def get_free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def test_owner_emails_reuse_pooled_smtp_connections():
+    handler = RecordingSmtpHandler()
+    controller = Controller(handler, hostname="127.0.0.1", port=get_free_port())
+    controller.start()
+
+    try:
+        config = get_test_fast_mail_client().config.model_copy(
+            update={
+                "MAIL_SERVER": controller.hostname,
+                "MAIL_PORT": controller.port,
+                "MAIL_STARTTLS": False,
+                "MAIL_SSL_TLS": False,
+                "USE_CREDENTIALS": False,
+                "SUPPRESS_SEND": False,
+            }
+        )
+        mail_sender = SmtpMailSender(config, pool_size=2)
+
+        owner_emails = [
+            create_new_appointment_email(f"owner{i}@example.com", "Title", "Message")
+            for i in range(OWNER_EMAILS)
+        ]
+        messages = [
+            build_email_message(message, template_name, config)
+            for message, template_name in owner_emails
+        ]
+
+        async def send_bookings_emails():
+            try:
+                first_results = await mail_sender.send_many(messages)
+                second_results = await mail_sender.send_many(messages)
+            finally:
+                await mail_sender.close()
+
+            return first_results + second_results
+
+        results = asyncio.run(send_bookings_emails())
+    finally:
+        controller.stop()
+
+    metrics = mail_sender.get_metrics()
+
+    assert results == [None] * OWNER_EMAILS * 2
+    assert len(handler.messages) == OWNER_EMAILS * 2
+    assert handler.connections <= 2
+    assert metrics["sent"] == OWNER_EMAILS * 2
+    assert metrics["connections_opened"] <= 2
+
+
+def test_all_appointments_page_costs_constant_queries(client, session):
+    english = models.Language(code="en", name="English")
+    service = models.Service(
+        min_price=50, max_price=80, average_time_minutes=30, required_slots=1
+    )
+    session.add_all([english, service])
+    session.flush()
+    session.add(
+        models.ServiceTranslations(
+            service_id=service.id, language_id=english.id, name="Haircut"
+        )
+    )
+
+    now = datetime.datetime.now(datetime.timezone.utc).replace(microsecond=0)
+
+    for i in range(LISTED_APPOINTMENTS + 10):
+        user = models.User(
+            email=f"user{i}@example.com", name="Jan", surname="Kowalski", gender="male"
+        )
+        # Every other appointment has already ended
+        start_time = now + datetime.timedelta(hours=i if i % 2 else -i - 1)
+        slot = models.AppointmentSlot(
+            date=start_time.date(),
+            start_time=start_time,
+            end_time=start_time + datetime.timedelta(minutes=30),
+            occupied=True,
+        )
+        session.add_all([user, slot])
+        session.flush()
+        session.add(
+            models.Appointment(
+                service_id=service.id,
+                user_id=user.id,
+                start_slot_id=slot.id,
+                end_slot_id=slot.id,
+            )
+        )
+    session.commit()
+
+    app.dependency_overrides[oauth2.get_admin] = lambda: SimpleNamespace(
+        admin=SimpleNamespace(id=uuid.uuid4())
+    )
+    # Warms up the admin's settings and the translation catalog
+    client.get(settings.BASE_URL + "/appointments/all", params={"limit": 1})
+
+    statements = []
+
+    def count_statement(conn, cursor, statement, parameters, context, executemany):
+        statements.append(statement)
+
+    event.listen(database_engine, "before_cursor_execute", count_statement)
+
+    try:
+        res = client.get(
+            settings.BASE_URL + "/appointments/all",
+            params={"limit": LISTED_APPOINTMENTS},
+        )
+        archival_res = client.get(
+            settings.BASE_URL + "/appointments/all",
+            params={"include_archival": False, "offset": 5, "limit": 10},
+        )
+    finally:
+        event.remove(database_engine, "before_cursor_execute", count_statement)
+        app.dependency_overrides.pop(oauth2.get_admin)
+
+    assert res.status_code == status.HTTP_200_OK
+    assert len(res.json()["items"]) == LISTED_APPOINTMENTS
+    assert res.json()["total"] == LISTED_APPOINTMENTS + 10
+    assert all(item["service"]["name"] == "Haircut" for item in res.json()["items"])
+
+    assert archival_res.status_code == status.HTTP_200_OK
+    assert archival_res.json()["total"] == (LISTED_APPOINTMENTS + 10) // 2
+    assert not any(item["archival"] for item in archival_res.json()["items"])
+
+    # A count and a single eager-loading query per page
+    assert len(statements) == 4
+
+
+def enqueue_canceled_notifications(db, count: int) -> list[int]:
+    notifications_db = [
+        enqueue_notification(
+            db,
+            NotificationKind.appointment_canceled,
+            AppointmentCanceledPayload(
+                user_id=uuid.uuid4(),
+                service_id=uuid.uuid4(),
+                appointment_date=datetime.datetime(2026, 10, 19, 9, 0),
+            ),
+        )
+        for _ in range(count)
+    ]
+    db.commit()
+
+    return [notification_db.id for notification_db in notifications_db]
+
+
+def make_notification_due(db, notification_id: int) -> None:
+    db.query(models.NotificationOutbox).where(
+        models.NotificationOutbox.id == notification_id
+    ).update(
+        {
+            models.NotificationOutbox.next_attempt_at: datetime.datetime.utcnow()
+            - datetime.timedelta(seconds=1)
+        }
+    )
+    db.commit()
+
+
+def get_outbox_row(db, notification_id: int) -> models.NotificationOutbox:
+    db.expire_all()
+
+    return (
+        db.query(models.NotificationOutbox)
+        .where(models.NotificationOutbox.id == notification_id)
+        .one()
+    )
+
+
+def test_concurrent_outbox_claims_are_disjoint(session):
+    notification_ids = enqueue_canceled_notifications(session, 6)
+
+    other_session = TestingSessionLocal()
+    try:
+        # The other worker's claim is still in progress, its rows stay locked
+        other_session.commit = lambda: None
+        other_claimed = claim_notifications(other_session, 3)
+
+        claimed = claim_notifications(session, 10)
+    finally:
+        other_session.rollback()
+        other_session.close()
+
+    other_claimed_ids = {notification["id"] for notification in other_claimed}
+    claimed_ids = {notification["id"] for notification in claimed}
+
+    assert len(other_claimed_ids) == 3
+    assert claimed_ids == set(notification_ids) - other_claimed_ids
+
+
+def test_outbox_notification_is_reclaimed_after_lease_expires(session):
+    [notification_id] = enqueue_canceled_notifications(session, 1)
+
+    [claimed] = claim_notifications(session, 10)
+
+    assert claimed["attempts"] == 1
+    # Leased to the worker which claimed it
+    assert claim_notifications(session, 10) == []
+
+    make_notification_due(session, notification_id)
+
+    [reclaimed] = claim_notifications(session, 10)
+
+    assert reclaimed["id"] == notification_id
+    assert reclaimed["attempts"] == 2
+
+
+def test_failed_outbox_notification_backs_off_exponentially(session, monkeypatch):
+    monkeypatch.setattr(settings, "OUTBOX_RETRY_BASE_SECONDS", 30)
+    [notification_id] = enqueue_canceled_notifications(session, 1)
+
+    for attempt, expected_delay_seconds in enumerate((30, 60, 120), start=1):
+        make_notification_due(session, notification_id)
+        [claimed] = claim_notifications(session, 10)
+
+        failed_at = datetime.datetime.utcnow()
+        mark_notification_failed(session, claimed, f"error {attempt}")
+
+        notification_db = get_outbox_row(session, notification_id)
+        delay = notification_db.next_attempt_at - failed_at
+
+        assert claimed["attempts"] == attempt
+        assert notification_db.status == OutboxStatus.pending
+        assert notification_db.last_error == f"error {attempt}"
+        assert (
+            datetime.timedelta(seconds=expected_delay_seconds)
+            <= delay
+            < datetime.timedelta(seconds=expected_delay_seconds + 1)
+        )
+        assert get_retry_delay(attempt).total_seconds() == expected_delay_seconds
+
+
+def test_outbox_notification_is_dead_lettered_after_max_attempts(session, monkeypatch):
+    monkeypatch.setattr(settings, "OUTBOX_MAX_ATTEMPTS", 3)
+    [notification_id] = enqueue_canceled_notifications(session, 1)
+
+    for attempt in range(1, 4):
+        make_notification_due(session, notification_id)
+        [claimed] = claim_notifications(session, 10)
+        mark_notification_failed(session, claimed, f"error {attempt}")
+
+        notification_db = get_outbox_row(session, notification_id)
+
+        if attempt < 3:
+            assert notification_db.status == OutboxStatus.pending
+            assert notification_db.processed_at is None
+
+    assert notification_db.status == OutboxStatus.dead
+    assert notification_db.processed_at is not None
+    assert notification_db.last_error == "error 3"
+
+    make_notification_due(session, notification_id)
+
+    assert claim_notifications(session, 10) == []
+
+
+def test_notification_is_enqueued_with_the_appointment(session):
+    service = models.Service(
+        min_price=50, max_price=80, average_time_minutes=30, required_slots=1
+    )
+    user = models.User(
+        email="jan@example.com", name="Jan", surname="Kowalski", gender="male"
+    )
+    start_time = datetime.datetime(2026, 10, 19, 9, 0, tzinfo=datetime.timezone.utc)
+    slot = models.AppointmentSlot(
+        date=start_time.date(),
+        start_time=start_time,
+        end_time=start_time + datetime.timedelta(minutes=30),
+    )
+    session.add_all([service, user, slot])
+    session.commit()
+
+    def book_appointment() -> None:
+        session.add(
+            models.Appointment(
+                service_id=service.id,
+                user_id=user.id,
+                start_slot_id=slot.id,
+                end_slot_id=slot.id,
+            )
+        )
+        enqueue_notification(
+            session,
+            NotificationKind.new_appointment,
+            NewAppointmentPayload(
+                user_name="Jan",
+                user_surname="Kowalski",
+                service_id=service.id,
+                appointment_date=start_time,
+            ),
+        )
+        session.flush()
+
+    book_appointment()
+    session.rollback()
+
+    assert session.query(models.Appointment).count() == 0
+    assert session.query(models.NotificationOutbox).count() == 0
+
+    book_appointment()
+    session.commit()
+
+    assert session.query(models.Appointment).count() == 1
+    assert session.query(models.NotificationOutbox).count() == 1
+
+
+def seed_owner_with_service(db) -> uuid.UUID:
+    english = models.Language(code="en", name="English")
+    service = models.Service(
+        min_price=50, max_price=80, average_time_minutes=30, required_slots=1
+    )
+    owner = models.User(
+        email="owner@example.com",
+        name="Anna",
+        surname="Nowak",
+        gender="female",
+        permission_level=["user", "owner"],
+    )
+    db.add_all([english, service, owner])
+    db.flush()
+
+    owner_session = models.Session(
+        user_id=owner.id,
+        access_token="access",
+        refresh_token="refresh",
+        sign_in_user_agent="agent",
+        sign_in_ip_address="127.0.0.1",
+        last_user_agent="agent",
+        last_ip_address="127.0.0.1",
+    )
+    db.add_all(
+        [
+            owner_session,
+            models.ServiceTranslations(
+                service_id=service.id, language_id=english.id, name="Haircut"
+            ),
+        ]
+    )
+    db.flush()
+    db.add(
+        models.FcmToken(
+            token="owner-token", user_id=owner.id, session_id=owner_session.id
+        )
+    )
+    db.commit()
+
+    return service.id
+
+
+def drain_outbox_once() -> int:
+    def get_test_db():
+        db = TestingSessionLocal()
+        try:
+            yield db
+        finally:
+            db.close()
+
+    return asyncio.run(drain_outbox(get_test_db))
+
+
+def test_push_retry_does_not_resend_new_appointment_emails(session, monkeypatch):
+    monkeypatch.setattr(settings, "OWNER_NOTIFICATION_DIGEST_MINUTES", 0)
+    monkeypatch.setattr(
+        "src.notifications_manager.get_fast_mail_client",
+        lambda: get_test_fast_mail_client(suppress_send=False),
+    )
+    service_id = seed_owner_with_service(session)
+    notification_db = enqueue_notification(
+        session,
+        NotificationKind.new_appointment,
+        NewAppointmentPayload(
+            user_name="Jan",
+            user_surname="Kowalski",
+            service_id=service_id,
+            appointment_date=datetime.datetime(2026, 10, 19, 9, 0),
+        ),
+    )
+    session.commit()
+    notification_id = notification_db.id
+
+    push_transport = FakePushTransport()
+    push_transport.unavailable = True
+    set_push_transport(push_transport)
+    mail_sender = FakeMailSender()
+
+    original_mail_sender = get_mail_sender()
+    set_mail_sender(mail_sender)
+    try:
+        assert drain_outbox_once() == 1
+
+        notification_db = get_outbox_row(session, notification_id)
+
+        assert notification_db.status == OutboxStatus.pending
+        assert notification_db.emails_sent_at is not None
+        assert len(mail_sender.sent_messages) == 1
+        assert push_transport.sent_messages == []
+
+        push_transport.unavailable = False
+        make_notification_due(session, notification_id)
+
+        assert drain_outbox_once() == 1
+    finally:
+        set_mail_sender(original_mail_sender)
+
+    notification_db = get_outbox_row(session, notification_id)
+
+    assert notification_db.status == OutboxStatus.sent
+    # Only the push message was retried
+    assert len(mail_sender.sent_messages) == 1
+    assert [message.token for message in push_transport.sent_messages] == [
+        "owner-token"
+    ]
+
+
+def test_push_retry_does_not_resend_owner_digest_emails(session, monkeypatch):
+    monkeypatch.setattr(settings, "OWNER_NOTIFICATION_DIGEST_MINUTES", 15)
+    monkeypatch.setattr(
+        "src.notifications_manager.get_fast_mail_client",
+        lambda: get_test_fast_mail_client(suppress_send=False),
+    )
+    service_id = seed_owner_with_service(session)
+
+    def book_appointments(count: int) -> list[int]:
+        notifications_db = [
+            enqueue_notification(
+                session,
+                NotificationKind.new_appointment,
+                NewAppointmentPayload(
+                    user_name="Jan",
+                    user_surname=f"Kowalski {i}",
+                    service_id=service_id,
+                    appointment_date=datetime.datetime(2026, 10, 19, 9 + i, 0),
+                ),
+            )
+            for i in range(count)
+        ]
+        session.commit()
+        notification_ids = [notification_db.id for notification_db in notifications_db]
+
+        for notification_id in notification_ids:
+            make_notification_due(session, notification_id)
+
+        return notification_ids
+
+    push_transport = FakePushTransport()
+    push_transport.unavailable = True
+    set_push_transport(push_transport)
+    mail_sender = FakeMailSender()
+
+    original_mail_sender = get_mail_sender()
+    set_mail_sender(mail_sender)
+    try:
+        notification_ids = book_appointments(3)
+
+        assert drain_outbox_once() == 3
+        # A single digest email for the owner, its push message failed
+        assert len(mail_sender.sent_messages) == 1
+        assert push_transport.sent_messages == []
+        assert all(
+            get_outbox_row(session, notification_id).emails_sent_at is not None
+            for notification_id in notification_ids
+        )
+
+        push_transport.unavailable = False
+        for notification_id in notification_ids:
+            make_notification_due(session, notification_id)
+        # Booked before the retry, so it is emailed along with it
+        notification_ids += book_appointments(1)
+
+        assert drain_outbox_once() == 4
+    finally:
+        set_mail_sender(original_mail_sender)
+
+    # Only the new appointment was emailed again
+    assert len(mail_sender.sent_messages) == 2
+    assert len(push_transport.sent_messages) == 1
+    # The owner has no language setting, so gets content in english
+    assert push_transport.sent_messages[0].title == "4 new appointments"
+    assert all(
+        get_outbox_row(session, notification_id).status == OutboxStatus.sent
+        for notification_id in notification_ids
+    )
+
+
+def test_notification_context_is_loaded_with_one_query(session):
+    polish = models.Language(code="pl", name="polski")
+    english = models.Language(code="en", name="English")
+    services = [
+        models.Service(
+            min_price=50, max_price=80, average_time_minutes=30, required_slots=1
+        )
+        for _ in range(2)
+    ]
+    session.add_all([polish, english, *services])
+    session.flush()
+
+    for i, service in enumerate(services):
+        session.add_all(
+            [
+                models.ServiceTranslations(
+                    service_id=service.id, language_id=polish.id, name=f"Usługa {i}"
+                ),
+                models.ServiceTranslations(
+                    service_id=service.id, language_id=english.id, name=f"Service {i}"
+                ),
+            ]
+        )
+
+    def add_user(email: str, *, owner: bool, language: str | None, tokens: int):
+        user = models.User(
+            email=email,
+            name="Jan",
+            surname="Kowalski",
+            gender="male",
+            permission_level=["user", "owner"] if owner else ["user"],
+        )
+        session.add(user)
+        session.flush()
+
+        if language:
+            session.add(
+                models.Setting(
+                    user_id=user.id,
+                    name=AvailableSettings.language.value,
+                    current_value=language,
+                )
+            )
+
+        for j in range(tokens):
+            user_session = models.Session(
+                user_id=user.id,
+                access_token="access",
+                refresh_token="refresh",
+                sign_in_user_agent="agent",
+                sign_in_ip_address="127.0.0.1",
+                last_user_agent="agent",
+                last_ip_address="127.0.0.1",
+            )
+            session.add(user_session)
+            session.flush()
+            session.add(
+                models.FcmToken(
+                    token=f"{email}-{j}", user_id=user.id, session_id=user_session.id
+                )
+            )
+
+        return user.id
+
+    owner_ids = [
+        add_user(f"owner{i}@example.com", owner=True, language=language, tokens=i + 1)
+        for i, language in enumerate(("pl", "en", None))
+    ]
+    user_ids = [
+        add_user(f"user{i}@example.com", owner=False, language="pl", tokens=2)
+        for i in range(2)
+    ]
+    # Neither an owner nor part of the batch
+    add_user("other@example.com", owner=False, language="pl", tokens=1)
+    session.commit()
+    service_ids = [service.id for service in services]
+
+    statements = []
+
+    def count_statement(conn, cursor, statement, parameters, context, executemany):
+        statements.append(statement)
+
+    event.listen(database_engine, "before_cursor_execute", count_statement)
+
+    try:
+        context = load_notification_context(
+            session,
+            user_ids=user_ids,
+            service_ids=service_ids,
+            include_owners=True,
+        )
+    finally:
+        event.remove(database_engine, "before_cursor_execute", count_statement)
+
+    assert len(statements) == 1
+
+    assert set(context["owner_ids"]) == set(owner_ids)
+    assert set(context["recipients"]) == set(owner_ids + user_ids)
+
+    polish_owner, english_owner, default_owner = (
+        context["recipients"][owner_id] for owner_id in owner_ids
+    )
+
+    assert sorted(polish_owner["fcm_tokens"]) == ["owner0@example.com-0"]
+    assert len(english_owner["fcm_tokens"]) == 2
+    assert len(default_owner["fcm_tokens"]) == 3
+    assert polish_owner["service_names"] == {
+        service_id: f"Usługa {i}" for i, service_id in enumerate(service_ids)
+    }
+    # Users without a language setting get content in english
+    assert default_owner["language_code"] == "en"
+    assert (
+        default_owner["service_names"]
+        == english_owner["service_names"]
+        == {service_id: f"Service {i}" for i, service_id in enumerate(service_ids)}
+    )
+    assert all(
+        context["recipients"][user_id]["language_code"] == "pl"
+        and not context["recipients"][user_id]["is_owner"]
+        and len(context["recipients"][user_id]["fcm_tokens"]) == 2
+        for user_id in user_ids
+    )
+
+
+class FakeReminderScheduler:
+    def __init__(self, get_db_func: callable, engine):
+        self.running = False
+
+    def start(self) -> None:
+        self.running = True
+
+    def stop(self) -> None:
+        self.running = False
+
+
+def wait_until(predicate: callable, timeout_seconds: float = 5) -> bool:
+    deadline = time.monotonic() + timeout_seconds
+
+    while time.monotonic() < deadline:
+        if predicate():
+            return True
+
+        time.sleep(0.01)
+
+    return predicate()
+
+
+def test_scheduler_is_led_by_a_single_election(session, monkeypatch):
+    # Jobs aren't needed, only whether the schedulers run
+    monkeypatch.setattr("src.scheduler.create_scheduler", BackgroundScheduler)
+    monkeypatch.setattr("src.scheduler.ReminderScheduler", FakeReminderScheduler)
+
+    poll_interval_seconds = 0.05
+    first = SchedulerLeaderElection(database_engine, poll_interval_seconds)
+    second = SchedulerLeaderElection(database_engine, poll_interval_seconds)
+
+    try:
+        first.start()
+        assert wait_until(lambda: first.is_leader)
+
+        second.start()
+        time.sleep(poll_interval_seconds * 5)
+
+        assert first.is_leader
+        assert not second.is_leader
+        assert second.connection is None
+
+        # A resigning leader is replaced
+        first.stop()
+
+        assert not first.is_leader
+        assert wait_until(lambda: second.is_leader)
+        assert second.reminder_scheduler.running
+
+        first.start()
+        time.sleep(poll_interval_seconds * 5)
+
+        assert not first.is_leader
+
+        # So is a leader which lost its database connection
+        leader_pid = session.execute(
+            text(
+                "SELECT pid FROM pg_locks "
+                "WHERE locktype = 'advisory' AND objid = :lock_id AND granted"
+            ),
+            {"lock_id": SCHEDULER_ADVISORY_LOCK_ID},
+        ).scalar_one()
+        session.execute(select(func.pg_terminate_backend(leader_pid)))
+        session.commit()
+
+        assert wait_until(lambda: first.is_leader)
+        assert wait_until(lambda: not second.is_leader)
+        assert second.reminder_scheduler is None
+    finally:
+        first.stop()
+        second.stop()
+
+    assert not first.is_leader
+    assert not second.is_leader
+
+
+def test_failed_new_appointment_email_is_retried(session, monkeypatch):
+    monkeypatch.setattr(settings, "OWNER_NOTIFICATION_DIGEST_MINUTES", 0)
+    monkeypatch.setattr(
+        "src.notifications_manager.get_fast_mail_client",
+        lambda: get_test_fast_mail_client(suppress_send=False),
+    )
+    service_id = seed_owner_with_service(session)
+    notification_db = enqueue_notification(
+        session,
+        NotificationKind.new_appointment,
+        NewAppointmentPayload(
+            user_name="Jan",
+            user_surname="Kowalski",
+            service_id=service_id,
+            appointment_date=datetime.datetime(2026, 10, 19, 9, 0),
+        ),
+    )
+    session.commit()
+    notification_id = notification_db.id
+
+    push_transport = FakePushTransport()
+    set_push_transport(push_transport)
+    mail_sender = FakeMailSender(rejected_recipients={"owner@example.com"})
+
+    original_mail_sender = get_mail_sender()
+    set_mail_sender(mail_sender)
+    try:
+        assert drain_outbox_once() == 1
+
+        notification_db = get_outbox_row(session, notification_id)
+
+        assert notification_db.status == OutboxStatus.pending
+        assert notification_db.emails_sent_at is None
+        assert "EmailDeliveryException" in notification_db.last_error
+        # Held back along with the email, so the retry doesn't repeat them
+        assert push_transport.sent_messages == []
+
+        mail_sender.rejected_recipients.clear()
+        make_notification_due(session, notification_id)
+
+        assert drain_outbox_once() == 1
+    finally:
+        set_mail_sender(original_mail_sender)
+
+    notification_db = get_outbox_row(session, notification_id)
+
+    assert notification_db.status == OutboxStatus.sent
+    assert notification_db.emails_sent_at is not None
+    assert [message["To"] for message in mail_sender.sent_messages] == [
+        "owner@example.com"
+    ]
+    assert len(push_transport.sent_messages) == 1
+
+
+def test_failed_owner_digest_email_is_retried(session, monkeypatch):
+    monkeypatch.setattr(settings, "OWNER_NOTIFICATION_DIGEST_MINUTES", 15)
+    monkeypatch.setattr(
+        "src.notifications_manager.get_fast_mail_client",
+        lambda: get_test_fast_mail_client(suppress_send=False),
+    )
+    service_id = seed_owner_with_service(session)
+    notifications_db = [
+        enqueue_notification(
+            session,
+            NotificationKind.new_appointment,
+            NewAppointmentPayload(
+                user_name="Jan",
+                user_surname=f"Kowalski {i}",
+                service_id=service_id,
+                appointment_date=datetime.datetime(2026, 10, 19, 9 + i, 0),
+            ),
+        )
+        for i in range(3)
+    ]
+    session.commit()
+    notification_ids = [notification_db.id for notification_db in notifications_db]
+
+    push_transport = FakePushTransport()
+    set_push_transport(push_transport)
+    mail_sender = FakeMailSender(rejected_recipients={"owner@example.com"})
+
+    original_mail_sender = get_mail_sender()
+    set_mail_sender(mail_sender)
+    try:
+        for notification_id in notification_ids:
+            make_notification_due(session, notification_id)
+
+        assert drain_outbox_once() == 3
+        assert all(
+            get_outbox_row(session, notification_id).emails_sent_at is None
+            for notification_id in notification_ids
+        )
+        assert push_transport.sent_messages == []
+
+        mail_sender.rejected_recipients.clear()
+        for notification_id in notification_ids:
+            make_notification_due(session, notification_id)
+
+        assert drain_outbox_once() == 3
+    finally:
+        set_mail_sender(original_mail_sender)
+
+    # The retried digest lists all the appointments
+    assert len(mail_sender.sent_messages) == 1
+    assert len(push_transport.sent_messages) == 1
+    assert all(
+        get_outbox_row(session, notification_id).status == OutboxStatus.sent
+        for notification_id in notification_ids
+    )
+
+
+def test_health_leaves_out_scheduler_without_background_workers(monkeypatch):
+    monkeypatch.setattr("src.main.background_worker", None)
+
+    res = TestClient(app).get(settings.BASE_URL + "/health")
+
+    assert res.status_code == status.HTTP_200_OK
+    assert res.json() == {"status": "ok"}
+
+
+@pytest.mark.parametrize("outbox_worker_running", [True, False])
+def test_worker_heartbeat_reports_liveness(
+    tmp_path, monkeypatch, outbox_worker_running
+):
+    heartbeat_path = str(tmp_path / "worker-heartbeat.json")
+    monkeypatch.setattr(settings, "WORKER_HEARTBEAT_PATH", heartbeat_path)
+    monkeypatch.setattr(settings, "WORKER_HEARTBEAT_SECONDS", 0.01)
+    monkeypatch.setattr(
+        "src.worker.is_outbox_worker_running", lambda: outbox_worker_running
+    )
+    monkeypatch.setattr("src.worker.is_scheduler_leader", lambda: True)
+
+    assert not check_heartbeat(heartbeat_path, max_age_seconds=60)
+
+    async def run_worker_briefly() -> bool:
+        stop_event = asyncio.Event()
+        heartbeat_task = asyncio.create_task(run_heartbeat(stop_event))
+        await asyncio.sleep(0.05)
+
+        alive = check_heartbeat(heartbeat_path, max_age_seconds=60)
+
+        stop_event.set()
+        await heartbeat_task
+
+        return alive
+
+    # A worker whose outbox worker died doesn't report itself alive
+    assert asyncio.run(run_worker_briefly()) == outbox_worker_running
+    # Removed once the worker stops
+    assert not check_heartbeat(heartbeat_path, max_age_seconds=60)
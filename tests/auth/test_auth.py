@@ -0,0 +1,406 @@
+import asyncio
+import uuid
+from datetime import datetime, timedelta
+
+import pytest
+
+from src import models
+from src.config import settings
+from src.garbage_collector import collect_garbage
+from src.ipinfo import (
+    LocalIpInfoClient,
+    get_ip_addresses_details,
+    is_public_ip_address,
+    set_ip_info_client,
+)
+from src.main import app
+from src.rate_limiter import (
+    MAX_INSPECTED_BODY_BYTES,
+    RATE_LIMIT_RULES,
+    InMemoryRateLimiterBackend,
+    RateLimitMiddleware,
+    RateLimitRule,
+    TokenBucketLimit,
+)
+from src.schemas.email_request import EmailRequestType
+from src.utils import hash_password
+from ..conf_test import client, session  # noqa
+from fastapi import status
+from fastapi.testclient import TestClient
+from faker import Faker
+
+faker = Faker()
+
+ROUTE_PREFIX = "/auth/"
+
+CHROME_USER_AGENT = (
+    "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 "
+    "(KHTML, like Gecko) Chrome/129.0.0.0 Safari/537.36"
+)
+
+
+def create_user_with_password(session, email: str, password: str) -> models.User:
+    user = models.User(email=email, name="Jan", surname="Kowalski", gender="male")
+    session.add(user)
+    session.flush()
+    session.add(
+        models.Password(
+            password_hash=hash_password(password), user_id=user.id, current=True
+        )
+    )
+    session.commit()
+
+    return user
+
+
+# Run twice, the second run mustn't be limited by logins of the first one
+@pytest.mark.parametrize("run", range(2))
+def test_login_limits_are_counted_per_test(client, session, run):
+    [login_rule] = [
+        rule for rule in RATE_LIMIT_RULES if rule.path.endswith("/auth/login")
+    ]
+    create_user_with_password(session, "jan.kowalski@example.com", "Kwakwa5!")
+
+    responses = [
+        client.post(
+            settings.BASE_URL + ROUTE_PREFIX + "login",
+            data={
+                "username": "jan.kowalski@example.com",
+                "password": "Kwakwa5!",
+                "grant_type": "password",
+            },
+        )
+        for _ in range(login_rule.per_account.capacity)
+    ]
+
+    assert [res.status_code for res in responses] == [status.HTTP_200_OK] * len(
+        responses
+    )
+
+
+def test_request_password_reset_rate_limit(client):
+    user_email = {"email": faker.email()}
+
+    res = client.post(
+        settings.BASE_URL + ROUTE_PREFIX + "request-password-reset", json=user_email
+    )
+    assert res.status_code == status.HTTP_202_ACCEPTED
+
+    res = client.post(
+        settings.BASE_URL + ROUTE_PREFIX + "request-password-reset", json=user_email
+    )
+    assert res.status_code == status.HTTP_429_TOO_MANY_REQUESTS
+    assert int(res.headers["retry-after"]) > 0
+
+
+def test_oversized_body_is_not_buffered_by_rate_limiter():
+    chunk_size = 16 * 1024
+    chunks = [b"x" * chunk_size for _ in range(64)]
+    received_chunks = 0
+    app_body = b""
+
+    async def receive():
+        nonlocal received_chunks
+
+        received_chunks += 1
+        return {
+            "type": "http.request",
+            "body": chunks[received_chunks - 1],
+            "more_body": received_chunks < len(chunks),
+        }
+
+    async def app(scope, receive, send):
+        nonlocal app_body
+
+        # The limiter must not have read more than needed to exceed the cap
+        assert received_chunks * chunk_size <= MAX_INSPECTED_BODY_BYTES + chunk_size
+
+        more_body = True
+        while more_body:
+            message = await receive()
+            app_body += message["body"]
+            more_body = message["more_body"]
+
+    backend = InMemoryRateLimiterBackend()
+    middleware = RateLimitMiddleware(
+        app,
+        backend=backend,
+        rules=[
+            RateLimitRule(
+                path="/login",
+                per_ip=TokenBucketLimit(capacity=5, refill_period_seconds=60),
+                per_account=TokenBucketLimit(capacity=1, refill_period_seconds=60),
+                account_field="username",
+            )
+        ],
+    )
+    scope = {
+        "type": "http",
+        "method": "POST",
+        "path": "/login",
+        "client": ("127.0.0.1", 1234),
+        "headers": [(b"content-type", b"application/json")],
+    }
+
+    asyncio.run(middleware(scope, receive, None))
+
+    assert app_body == b"".join(chunks)
+    # Only the per IP bucket was used, the oversized body wasn't inspected
+    assert list(backend.buckets) == ["ip:/login:127.0.0.1"]
+
+
+def test_garbage_collection_deletes_only_expired_rows(session, monkeypatch):
+    monkeypatch.setattr(settings, "GARBAGE_COLLECTION_BATCH_SIZE", 3)
+
+    now = datetime.utcnow()
+    users_count = 7
+
+    for i in range(users_count):
+        user = models.User(
+            email=f"user{i}@example.com",
+            name="Jan",
+            surname="Kowalski",
+            gender="male",
+            verified=i % 2 == 0,
+        )
+        session.add(user)
+        session.flush()
+
+        idle_session, dormant_session, active_session = (
+            models.Session(
+                user_id=user.id,
+                access_token="access",
+                refresh_token="refresh",
+                sign_in_user_agent="agent",
+                sign_in_ip_address="127.0.0.1",
+                last_user_agent="agent",
+                last_ip_address="127.0.0.1",
+                last_accessed=last_accessed,
+            )
+            for last_accessed in (
+                now - timedelta(days=settings.SESSION_IDLE_RETENTION_DAYS + 10),
+                now - timedelta(days=settings.FCM_TOKEN_RETENTION_DAYS + 10),
+                now,
+            )
+        )
+        session.add_all([idle_session, dormant_session, active_session])
+        session.flush()
+
+        session.add_all(
+            [
+                # Stale, neither the token nor the session were used for long
+                models.FcmToken(
+                    token=f"dormant-{i}",
+                    user_id=user.id,
+                    session_id=dormant_session.id,
+                    last_updated_at=now - timedelta(days=70),
+                ),
+                # The session is still in use
+                models.FcmToken(
+                    token=f"active-{i}",
+                    user_id=user.id,
+                    session_id=active_session.id,
+                    last_updated_at=now - timedelta(days=70),
+                ),
+                models.EmailRequests(
+                    user_id=user.id,
+                    request_type=EmailRequestType.password_reset_request.value,
+                    request_token="token",
+                    created_at=now - timedelta(days=1),
+                ),
+                # Kept for unverified users until the retention period passes
+                models.EmailRequests(
+                    user_id=user.id,
+                    request_type=EmailRequestType.email_verification_request.value,
+                    request_token="token",
+                    created_at=now - timedelta(days=1),
+                ),
+            ]
+        )
+    session.commit()
+
+    def get_test_db():
+        yield session
+
+    stats = collect_garbage(get_test_db)
+
+    verified_users = (users_count + 1) // 2
+    unverified_users = users_count - verified_users
+
+    assert stats["sessions"] == users_count
+    assert stats["fcm_tokens"] == users_count
+    assert stats["email_requests"] == users_count + verified_users
+    assert stats["ip_address_details"] == 0
+    assert stats["notifications"] == 0
+    # 7 tokens, 7 sessions and 11 email requests deleted in batches of 3
+    assert stats["batches"] == 3 + 3 + 4
+
+    assert session.query(models.Session).count() == users_count * 2
+    assert {token for (token,) in session.query(models.FcmToken.token)} == {
+        f"active-{i}" for i in range(users_count)
+    }
+    assert (
+        session.query(models.EmailRequests)
+        .where(
+            models.EmailRequests.request_type
+            == EmailRequestType.email_verification_request
+        )
+        .count()
+        == unverified_users
+    )
+    assert session.query(models.EmailRequests).count() == unverified_users
+
+
+def test_login_stores_enriched_session(client, session):
+    client_ip_address = "81.2.69.7"
+    ip_info_client = LocalIpInfoClient(
+        {
+            client_ip_address: {
+                "city": "Kraków",
+                "region": "Lesser Poland",
+                "country": "PL",
+                "latitude": 50.06,
+                "longitude": 19.94,
+            }
+        }
+    )
+    set_ip_info_client(ip_info_client)
+
+    async def app_behind_public_ip(scope, receive, send):
+        if scope["type"] == "http":
+            scope["client"] = (client_ip_address, 50000)
+
+        await app(scope, receive, send)
+
+    user = models.User(
+        email=faker.email(), name="Jan", surname="Kowalski", gender="male"
+    )
+    session.add(user)
+    session.flush()
+    session.add(
+        models.Password(
+            password_hash=hash_password("Kwakwa5!"), user_id=user.id, current=True
+        )
+    )
+    session.commit()
+    user_id = user.id
+
+    res = TestClient(app_behind_public_ip).post(
+        settings.BASE_URL + ROUTE_PREFIX + "login",
+        data={"username": user.email, "password": "Kwakwa5!", "grant_type": "password"},
+        headers={"user-agent": CHROME_USER_AGENT},
+    )
+
+    assert res.status_code == status.HTTP_200_OK
+
+    session_db = (
+        session.query(models.Session).where(models.Session.user_id == user_id).one()
+    )
+
+    # Enriched by the background task in the test database
+    assert session_db.sign_in_user_agent_info["browser"]["family"] == "Chrome"
+    assert session_db.last_user_agent_info == session_db.sign_in_user_agent_info
+    assert session_db.sign_in_location == {
+        "country": "PL",
+        "region": "Lesser Poland",
+        "city": "Kraków",
+        "latitude": 50.06,
+        "longitude": 19.94,
+    }
+    assert session_db.last_location == session_db.sign_in_location
+    assert ip_info_client.lookups == [[client_ip_address]]
+
+
+def test_only_global_ip_addresses_are_public():
+    assert is_public_ip_address("81.2.69.7")
+    assert is_public_ip_address("2a00:1450:4001::1")
+
+    for ip_address in (
+        "10.0.0.1",
+        "127.0.0.1",
+        "::1",
+        "100.64.0.1",
+        "169.254.1.1",
+        "fe80::1",
+        "224.0.0.1",
+        "ff02::1",
+        "240.0.0.1",
+        "0.0.0.0",
+        "::",
+        "203.0.113.7",
+        "testclient",
+    ):
+        assert not is_public_ip_address(ip_address), ip_address
+
+
+def test_uncached_ip_addresses_are_looked_up_in_one_batch(session):
+    public_ip_addresses = [f"81.2.69.{i}" for i in range(1, 11)]
+    ip_info_client = LocalIpInfoClient(
+        {ip_address: {"country": "PL"} for ip_address in public_ip_addresses}
+    )
+    set_ip_info_client(ip_info_client)
+
+    ip_addresses = public_ip_addresses + ["10.0.0.1", "testclient", "not an ip"]
+
+    ip_addresses_details = asyncio.run(get_ip_addresses_details(session, ip_addresses))
+
+    assert len(ip_info_client.lookups) == 1
+    assert sorted(ip_info_client.lookups[0]) == sorted(public_ip_addresses)
+    assert ip_addresses_details == {
+        **{ip_address: {"country": "PL"} for ip_address in public_ip_addresses},
+        "10.0.0.1": None,
+        "testclient": None,
+        "not an ip": None,
+    }
+
+    # Served from the cache the second time
+    asyncio.run(get_ip_addresses_details(session, ip_addresses))
+
+    assert len(ip_info_client.lookups) == 1
+
+
+def test_login_evicts_least_recently_used_session(client, session):
+    user = create_user_with_password(session, faker.email(), "Kwakwa5!")
+    user_id, user_email = user.id, user.email
+
+    # Created directly, so only the final login counts towards the rate limit.
+    # The third session is the least recently used one, not the oldest
+    now = datetime.utcnow()
+    sessions_db = [
+        models.Session(
+            user_id=user_id,
+            access_token="access",
+            refresh_token="refresh",
+            sign_in_user_agent=CHROME_USER_AGENT,
+            sign_in_ip_address="127.0.0.1",
+            last_user_agent=CHROME_USER_AGENT,
+            last_ip_address="127.0.0.1",
+            last_accessed=now - timedelta(hours=10 if i == 2 else i),
+        )
+        for i in range(settings.MAX_SESSIONS_PER_USER)
+    ]
+    session.add_all(sessions_db)
+    session.commit()
+    session_ids = [session_db.id for session_db in sessions_db]
+    least_recently_used_id = session_ids[2]
+
+    res = client.post(
+        settings.BASE_URL + ROUTE_PREFIX + "login",
+        data={"username": user_email, "password": "Kwakwa5!", "grant_type": "password"},
+        headers={"user-agent": CHROME_USER_AGENT},
+    )
+
+    assert res.status_code == status.HTTP_200_OK
+
+    new_session_id = uuid.UUID(res.json()["session"]["id"])
+    remaining_session_ids = {
+        session_id
+        for (session_id,) in session.query(models.Session.id).where(
+            models.Session.user_id == user_id
+        )
+    }
+
+    assert len(remaining_session_ids) == settings.MAX_SESSIONS_PER_USER
+    assert remaining_session_ids == (
+        set(session_ids) - {least_recently_used_id} | {new_session_id}
+    )
@@ -7,7 +7,12 @@ from fastapi_mail import ConnectionConfig, FastMail
 from src.config import settings
 from src.database import get_db
 from src.email_manager import get_fast_mail_client
+from src.ipinfo import LocalIpInfoClient, set_ip_info_client
 from src.main import app
+from src.push_transport import FakePushTransport, set_push_transport
+from src.rate_limiter import InMemoryRateLimiterBackend, set_rate_limiter_backend
+from src.settings_cache import user_settings_cache
+from src.translation_catalog import translation_catalog
 from .conf_database import session  # noqa
 
 
@@ -39,5 +44,12 @@ def client(session):
 
     app.dependency_overrides[get_fast_mail_client] = get_test_fastMail_client
     app.dependency_overrides[get_db] = get_test_db
+    set_ip_info_client(LocalIpInfoClient())
+    set_push_transport(FakePushTransport())
+    # Rate limits are counted from scratch in every test
+    set_rate_limiter_backend(InMemoryRateLimiterBackend())
+    # Every test starts with a fresh database
+    translation_catalog.invalidate()
+    user_settings_cache.clear()
 
     yield TestClient(app)
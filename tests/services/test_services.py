@@ -0,0 +1,169 @@
+import json
+import uuid
+from datetime import datetime
+from types import SimpleNamespace
+
+from fastapi import status
+from sqlalchemy import event
+
+from src import models, oauth2
+from src.config import settings
+from src.main import app
+from src.routers.services import is_etag_matched
+from src.translation_catalog import (
+    CatalogSnapshot,
+    ServiceTranslation,
+    TranslationCatalog,
+    serialize_response,
+)
+from ..conf_database import database_engine
+from ..conf_test import client, session  # noqa
+
+ROUTE_PREFIX = "/services/"
+
+
+def get_catalog_with_service() -> tuple[TranslationCatalog, uuid.UUID]:
+    catalog = TranslationCatalog(check_interval_seconds=30)
+    service_id = uuid.uuid4()
+
+    catalog.snapshot = get_snapshot_with_service(service_id, "Haircut")
+
+    return catalog, service_id
+
+
+def get_snapshot_with_service(
+    service_id: uuid.UUID, english_name: str
+) -> CatalogSnapshot:
+    return CatalogSnapshot(
+        language_ids={"pl": 1, "en": 2},
+        service_translations={
+            (service_id, 1): ServiceTranslation(name="Strzyżenie", description=None),
+            (service_id, 2): ServiceTranslation(name=english_name, description=None),
+        },
+        holiday_names={},
+        services={
+            service_id: {
+                "id": service_id,
+                "min_price": 50,
+                "max_price": 80,
+                "average_time_minutes": 45,
+                "required_slots": 2,
+                "available": True,
+                "description": None,
+                "deleted": False,
+                "created_at": datetime(2026, 10, 1),
+            }
+        },
+        responses={},
+    )
+
+
+def test_service_responses_are_serialized_once_per_language():
+    catalog, service_id = get_catalog_with_service()
+
+    response = catalog.get_services_response(catalog.get_language_id("en"))
+
+    assert catalog.get_services_response(catalog.get_language_id("de")) is response
+    assert json.loads(response["body"])[0]["name"] == "Haircut"
+    assert "created_at" not in json.loads(response["body"])[0]
+
+    polish_response = catalog.get_service_response(service_id, 1)
+
+    assert json.loads(polish_response["body"])["name"] == "Strzyżenie"
+    assert polish_response["etag"] != response["etag"]
+    assert catalog.get_service_response(uuid.uuid4(), 1) is None
+
+
+def test_responses_built_during_reload_are_not_cached_in_new_catalog(monkeypatch):
+    def get_services_name(catalog: TranslationCatalog, service_id: uuid.UUID) -> str:
+        return json.loads(catalog.get_services_response(2)["body"])[0]["name"]
+
+    def get_service_name(catalog: TranslationCatalog, service_id: uuid.UUID) -> str:
+        return json.loads(catalog.get_service_response(service_id, 2)["body"])["name"]
+
+    for get_name in (get_services_name, get_service_name):
+        catalog, service_id = get_catalog_with_service()
+        new_snapshot = get_snapshot_with_service(service_id, "Men's haircut")
+
+        def reload_while_serializing(content, adapter):
+            # The catalog is reloaded by another thread in the middle of building
+            catalog.snapshot = new_snapshot
+
+            return serialize_response(content, adapter)
+
+        monkeypatch.setattr(
+            "src.translation_catalog.serialize_response", reload_while_serializing
+        )
+
+        assert get_name(catalog, service_id) == "Haircut"
+        assert new_snapshot["responses"] == {}
+
+        monkeypatch.undo()
+
+        assert get_name(catalog, service_id) == "Men's haircut"
+
+
+def test_etag_matching():
+    assert is_etag_matched('"abc"', '"xyz", W/"abc"')
+    assert is_etag_matched('"abc"', "*")
+    assert not is_etag_matched('"abc"', '"xyz"')
+    assert not is_etag_matched('"abc"', None)
+
+
+def test_services_details_are_served_from_catalog(client, session):
+    polish = models.Language(code="pl", name="polski")
+    english = models.Language(code="en", name="English")
+    services = [
+        models.Service(
+            min_price=50, max_price=80, average_time_minutes=45, required_slots=2
+        )
+        for _ in range(3)
+    ]
+    session.add_all([polish, english, *services])
+    session.flush()
+
+    for i, service in enumerate(services):
+        session.add_all(
+            [
+                models.ServiceTranslations(
+                    service_id=service.id, language_id=polish.id, name=f"Usługa {i}"
+                ),
+                models.ServiceTranslations(
+                    service_id=service.id, language_id=english.id, name=f"Service {i}"
+                ),
+            ]
+        )
+    session.commit()
+    service_id = services[0].id
+
+    app.dependency_overrides[oauth2.get_admin] = lambda: SimpleNamespace(
+        admin=SimpleNamespace(id=uuid.uuid4())
+    )
+    statements = []
+
+    def count_statement(conn, cursor, statement, parameters, context, executemany):
+        statements.append(statement)
+
+    event.listen(database_engine, "before_cursor_execute", count_statement)
+
+    try:
+        res = client.get(settings.BASE_URL + ROUTE_PREFIX + "details")
+
+        assert res.status_code == status.HTTP_200_OK
+        assert sorted(service["name"] for service in res.json()) == [
+            f"Service {i}" for i in range(3)
+        ]
+        # Admin's settings, catalog version, languages, service translations,
+        # holiday translations and services, independent of the services count
+        assert len(statements) == 6
+
+        statements.clear()
+
+        res = client.get(settings.BASE_URL + ROUTE_PREFIX + f"details/{service_id}")
+
+        assert res.status_code == status.HTTP_200_OK
+        assert res.json()["name"] == "Service 0"
+        assert len(statements) == 0
+    finally:
+        event.remove(database_engine, "before_cursor_execute", count_statement)
+        app.dependency_overrides.pop(oauth2.get_admin)
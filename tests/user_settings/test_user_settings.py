@@ -0,0 +1,49 @@
+import uuid
+
+from src.schemas.user_settings import is_valid_language_tag
+from src.settings_cache import UserSetting, UserSettingsCache
+from src.utils import get_language_code_from_header, parse_accept_language
+
+
+def test_accept_language_is_ordered_by_quality():
+    assert parse_accept_language("fr;q=0.5, en-US, pl;q=0.9, de;q=0, *;q=0.1") == [
+        "en-US",
+        "pl",
+        "fr",
+    ]
+
+
+def test_language_code_is_negotiated_from_header():
+    assert get_language_code_from_header("xx, en;q=0.4, pl;q=0.8") == "pl"
+    assert get_language_code_from_header("en-GB,en;q=0.9") == "en"
+    assert get_language_code_from_header("!!!, xx;q=0.5") == "pl"
+    assert get_language_code_from_header(None) == "pl"
+
+
+def test_language_tag_validation():
+    assert is_valid_language_tag("en-US")
+    assert not is_valid_language_tag("xx")
+    assert not is_valid_language_tag("!!!")
+
+
+def test_settings_cache_evicts_least_recently_used_users():
+    cache = UserSettingsCache(ttl_seconds=60, max_users=2)
+    user_ids = [uuid.uuid4() for _ in range(3)]
+
+    for user_id in user_ids:
+        cache.set(
+            user_id,
+            {
+                "language": UserSetting(
+                    name="language", default_value=None, current_value="pl"
+                )
+            },
+        )
+
+    assert list(cache.entries) == user_ids[1:]
+    # Cached settings are returned without touching the database
+    assert cache.get_value(None, user_ids[2], "language") == "pl"
+
+    cache.invalidate(user_ids[2])
+
+    assert list(cache.entries) == user_ids[1:2]